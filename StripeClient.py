@@ -3,7 +3,9 @@ import logging
 from typing import Optional, Dict
 
 from django.http import HttpResponse
-from flask import Flask
+from flask import Flask, request
+
+from responses import INVALID_PAYLOAD, INVALID_SIGNATURE, SUCCESS
 
 # Configuration settings
 stripe.api_key = "your_stripe_api_key"
@@ -121,9 +123,9 @@ class WebhookHandler:
         try:
             event = stripe.Webhook.construct_event(payload, sig_header, self.webhook_secret)
         except ValueError:
-            return {"error": "Invalid payload"}, 400
+            return INVALID_PAYLOAD
         except stripe.error.SignatureVerificationError:
-            return {"error": "Invalid signature"}, 400
+            return INVALID_SIGNATURE
 
         # Handle the event
         event_type = event.get('type')
@@ -147,7 +149,7 @@ class WebhookHandler:
         else:
             print(f"Unhandled event type: {event_type}")
 
-        return jsonify({'status': 'success'}), 20
+        return SUCCESS
 
     def handle_subscription_created(subscription):
         """
@@ -515,11 +517,11 @@ class WebhookHandler:
 
 
 @app.route('/webhook', methods=['POST'])
-def stripe_webhook(request=None):
+def stripe_webhook():
     payload = request.get_data(as_text=True)
     sig_header = request.headers.get('Stripe-Signature')
     webhook_handler = WebhookHandler(WEBHOOK_SECRET)
-    return webhook_handler.handle_webhook(payload, sig_header)
+    return webhook_handler.handle_webhook(payload, sig_header).flask
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
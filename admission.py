@@ -0,0 +1,98 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class AdmissionController:
+    """
+    Adaptive cap on outstanding webhook work (requests in flight plus events
+    queued for handlers).
+
+    The cap follows AIMD on observed handler latency: it grows by about one
+    per cap's worth of fast completions and is cut by `backoff_ratio` when a
+    completion is slower than `latency_target`. Past the cap new deliveries are
+    shed with a 503 and Retry-After, so Stripe retries later instead of our
+    workers queueing until they run out of memory.
+    """
+
+    def __init__(self, initial_limit: int = 32, min_limit: int = 4, max_limit: int = 512,
+                 latency_target: float = 0.5, backoff_ratio: float = 0.9,
+                 queue_depth: Optional[Callable[[], int]] = None, retry_after: int = 5,
+                 max_retry_after: int = 60):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.queue_depth = queue_depth or (lambda: 0)
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.latency_ewma = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def outstanding(self) -> int:
+        return self.in_flight + self.queue_depth()
+
+    def try_acquire(self) -> bool:
+        """
+        Admit a delivery if outstanding work is under the current cap.
+        """
+        with self._lock:
+            if self.in_flight + self.queue_depth() >= int(self.limit):
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self, latency: Optional[float] = None) -> None:
+        """
+        Finish an admitted delivery. Pass its latency when the handlers ran
+        inline, so it also drives the cap.
+        """
+        with self._lock:
+            self.in_flight -= 1
+        if latency is not None:
+            self.observe(latency)
+
+    def observe(self, latency: float) -> None:
+        """
+        Feed one handler latency sample into the AIMD cap.
+        """
+        with self._lock:
+            self.latency_ewma = latency if not self.latency_ewma else 0.9 * self.latency_ewma + 0.1 * latency
+            now = time.monotonic()
+
+            if latency > self.latency_target:
+                # Cut at most once per target interval, otherwise a burst of
+                # slow completions that were already queued collapses the cap
+                if now - self._last_decrease >= self.latency_target:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def retry_after_seconds(self) -> int:
+        """
+        Retry-After hint, longer the further past the cap we are.
+        """
+        overload = self.outstanding() / max(self.limit, 1.0)
+        return min(self.max_retry_after, max(1, int(math.ceil(self.retry_after * max(overload, 1.0)))))
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'queue_depth': self.queue_depth(),
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'latency_ewma_ms': round(self.latency_ewma * 1000, 3),
+                'latency_target_ms': round(self.latency_target * 1000, 3),
+            }
@@ -1,22 +1,157 @@
 # app.py
-from flask import Flask, request
-from stripe_client import StripeClient
-from webhook_handler import WebhookHandler
+import time
+
+from flask import Flask, request, jsonify
+from tenants import Tenant, TenantRegistry
+from admission import AdmissionController
+from responses import UNKNOWN_TENANT, shed
 
 app = Flask(__name__)
 
 STRIPE_API_KEY = "your_stripe_api_key"
 WEBHOOK_SECRET = "your_webhook_secret"
 
-# Initialize Stripe Client and Webhook Handler
-stripe_client = StripeClient(STRIPE_API_KEY)
-webhook_handler = WebhookHandler(WEBHOOK_SECRET, stripe_client)
+# JSON file listing the Stripe accounts served by this process (None serves only the keys above)
+TENANTS_FILE = None
+
+# Seconds to hold invoice events for the same object before handling them once (None disables)
+COALESCE_WINDOW_SECONDS = None
+
+# Directory for the hourly columnar event archive used by analytics (None disables)
+EVENT_ARCHIVE_DIR = None
+
+# Priority lanes per event type so payments never queue behind invoice churn, e.g.
+# priority_lanes.DEFAULT_LANES (None handles inline). Lanes answer Stripe before the
+# database write, so a crash loses the events still queued
+PRIORITY_LANES = None
+
+# Handler latency the admission controller steers towards before shedding load
+ADMISSION_LATENCY_TARGET_SECONDS = 0.5
+
+# Handler plugins with their own timeouts and concurrency limits,
+# e.g. WebhookHandler.default_plugins() (None uses the built-in routing)
+HANDLER_PLUGINS = None
+
+# Hand queued events of one type to the handlers in batches sized from the
+# backlog, keeping each batch within this many seconds (None handles one at a time)
+MICRO_BATCH_LATENCY_TARGET_SECONDS = None
+
+# SQLite file holding the latest snapshot of each customer, subscription,
+# invoice and payment intent, read by StripeClient before the API (None disables)
+STATE_STORE_PATH = None
+
+# Where to send a trace of every event from Stripe's `created` to the handler
+# commit: file:/path/traces.jsonl or an OTLP/HTTP collector such as
+# http://localhost:4318/v1/traces (None disables tracing)
+TRACE_EXPORT = None
+
+# Directory of the write-ahead journal that makes every verified delivery
+# durable before it is handled and replays unfinished ones after a crash (None disables)
+JOURNAL_DIR = None
+
+# Name of a shared memory block in which all workers on this host share the
+# ids of processed events, e.g. 'stripe-webhook' (None keeps them per worker)
+SHARED_CACHE_NAME = None
+
+# JSON file watched for secret rotation and runtime tuning without a restart (None disables)
+RUNTIME_CONFIG_FILE = None
+
+tracer = None
+if TRACE_EXPORT:
+    from tracing import Tracer, exporter_from_uri
+    tracer = Tracer(exporter_from_uri(TRACE_EXPORT))
+
+# Initialize a Stripe Client and Webhook Handler per tenant
+if TENANTS_FILE:
+    tenants = TenantRegistry.from_file(
+        TENANTS_FILE,
+        lanes=PRIORITY_LANES,
+        coalesce_window=COALESCE_WINDOW_SECONDS,
+        archive_dir=EVENT_ARCHIVE_DIR,
+        plugins=HANDLER_PLUGINS,
+        tracer=tracer,
+        batch_latency_target=MICRO_BATCH_LATENCY_TARGET_SECONDS
+    )
+else:
+    event_archive = None
+    if EVENT_ARCHIVE_DIR:
+        from event_archive import EventArchive
+        event_archive = EventArchive(EVENT_ARCHIVE_DIR)
+    state_store = None
+    if STATE_STORE_PATH:
+        from state_store import StateStore
+        state_store = StateStore(STATE_STORE_PATH)
+    micro_batch = None
+    if MICRO_BATCH_LATENCY_TARGET_SECONDS:
+        from micro_batching import AdaptiveBatchSizer
+        micro_batch = AdaptiveBatchSizer(latency_target=MICRO_BATCH_LATENCY_TARGET_SECONDS)
+    journal = None
+    if JOURNAL_DIR:
+        from journal import Journal
+        journal = Journal(JOURNAL_DIR)
+    shared_cache = None
+    if SHARED_CACHE_NAME:
+        from shared_cache import SharedCache
+        shared_cache = SharedCache(SHARED_CACHE_NAME)
+    tenants = TenantRegistry([
+        Tenant(
+            'default',
+            STRIPE_API_KEY,
+            WEBHOOK_SECRET,
+            coalesce_window=COALESCE_WINDOW_SECONDS,
+            archive=event_archive,
+            lanes=PRIORITY_LANES,
+            plugins=HANDLER_PLUGINS,
+            state_store=state_store,
+            tracer=tracer,
+            micro_batch=micro_batch,
+            journal=journal,
+            shared_cache=shared_cache
+        )
+    ])
+
+admission = AdmissionController(
+    latency_target=ADMISSION_LATENCY_TARGET_SECONDS,
+    queue_depth=tenants.queue_depth
+)
+for tenant in tenants.tenants.values():
+    if tenant.handler.scheduler is not None:
+        tenant.handler.scheduler.on_complete = lambda event_type, seconds: admission.observe(seconds)
+
+config_watcher = None
+if RUNTIME_CONFIG_FILE:
+    from config import ConfigWatcher, FileSource, apply_to_tenants
+    config_watcher = ConfigWatcher(FileSource(RUNTIME_CONFIG_FILE))
+    config_watcher.subscribe(apply_to_tenants(tenants, admission))
+    config_watcher.start()
 
 @app.route('/webhook', methods=['POST'])
-def stripe_webhook():
-    payload = request.get_data(as_text=True)
-    sig_header = request.headers.get('Stripe-Signature')
-    return webhook_handler.handle_webhook(payload, sig_header)
+@app.route('/webhook/<tenant_name>', methods=['POST'])
+def stripe_webhook(tenant_name=None):
+    # Shed early and cheaply so Stripe retries later instead of timing out
+    if not admission.try_acquire():
+        return shed(admission.retry_after_seconds()).flask
+
+    started = time.monotonic()
+    tenant = None
+    try:
+        payload = request.get_data()
+        sig_header = request.headers.get('Stripe-Signature')
+        tenant = tenants.resolve(payload, tenant_name)
+        if tenant is None:
+            return UNKNOWN_TENANT.flask
+        return tenant.handler.handle_webhook(payload, sig_header).flask
+    finally:
+        # A tenant with lanes has its handlers report their own latency
+        inline = tenant is not None and tenant.handler.scheduler is None
+        admission.release(time.monotonic() - started if inline else None)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        'admission': admission.metrics(),
+        'tenants': tenants.metrics(),
+    })
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+
+# Shares the tenants, admission controller and settings of the Flask app
+from app import admission, tenants
+from responses import NOT_FOUND, UNKNOWN_TENANT, shed
+
+WEBHOOK_PATH = '/webhook'
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def send_static(send, response) -> None:
+    await send(response.asgi_start)
+    await send(response.asgi_body)
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def webhook(scope, receive, send, tenant_name) -> None:
+    # Shed early and cheaply so Stripe retries later instead of timing out
+    if not admission.try_acquire():
+        await send_static(send, shed(admission.retry_after_seconds()))
+        return
+
+    started = time.monotonic()
+    tenant = None
+    try:
+        payload = await read_body(receive)
+        sig_header = None
+        for name, value in scope['headers']:
+            if name == b'stripe-signature':
+                sig_header = value.decode('latin-1')
+                break
+        tenant = tenants.resolve(payload, tenant_name)
+        if tenant is None:
+            response = UNKNOWN_TENANT
+        else:
+            # Verification, the journal sync and inline handlers block, so
+            # they run on the default thread pool instead of the event loop
+            response = await asyncio.get_running_loop().run_in_executor(
+                None, tenant.handler.handle_webhook, payload, sig_header
+            )
+    finally:
+        # A tenant with lanes has its handlers report their own latency
+        inline = tenant is not None and tenant.handler.scheduler is None
+        admission.release(time.monotonic() - started if inline else None)
+    await send_static(send, response)
+
+
+async def metrics(send) -> None:
+    body = json.dumps({'admission': admission.metrics(), 'tenants': tenants.metrics()}).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii'))],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def application(scope, receive, send):
+    """
+    ASGI entry point with the same routes as app.py, e.g.
+    `uvicorn asgi:application`.
+    """
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path'].rstrip('/')
+    method = scope['method']
+    if method == 'POST' and path == WEBHOOK_PATH:
+        await webhook(scope, receive, send, None)
+    elif method == 'POST' and path.startswith(WEBHOOK_PATH + '/') and '/' not in path[len(WEBHOOK_PATH) + 1:]:
+        await webhook(scope, receive, send, path[len(WEBHOOK_PATH) + 1:])
+    elif method == 'GET' and path == '/metrics':
+        await metrics(send)
+    else:
+        await send_static(send, NOT_FOUND)
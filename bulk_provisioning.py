@@ -0,0 +1,285 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional
+
+import stripe_client as stripe_client_module
+from stripe_client import StripeClient
+
+# Stripe's default live-mode limit is 100 read/write requests per second
+DEFAULT_RATE = 90.0
+
+RESULT_FIELDS = ('key', 'status', 'customer_id', 'subscription_id', 'error')
+
+
+def read_csv(path: str) -> Iterator[Dict]:
+    """
+    Stream rows from a CSV with columns such as email, name, description,
+    price_id and trial_period_days.
+    """
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def idempotency_key(namespace: str, row_key: str, step: str) -> str:
+    """
+    The same row, step and namespace always map to the same key, so a re-run
+    returns the objects created the first time instead of duplicating them.
+    """
+    digest = hashlib.sha256(f"{namespace}\0{step}\0{row_key}".encode('utf-8')).hexdigest()
+    return f"bulk-{step}-{digest[:40]}"
+
+
+class TokenBucket:
+    """
+    Shared request budget for all workers. A 429 pauses every worker, not
+    just the one that got it.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate / 10, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines file with one entry per finished row. On restart
+    the last entry for each key wins: successful rows are skipped and partly
+    provisioned rows reuse the customer they already have.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 500):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash
+                        continue
+                    self.entries[entry['key']] = entry
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+        self._unsynced = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.entries.get(key)
+
+    def record(self, entry: Dict) -> None:
+        with self._lock:
+            self.entries[entry['key']] = entry
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class BulkProvisioner:
+    """
+    Create a customer, and a subscription when the row has a price_id, for
+    every input row. Calls run concurrently under a shared rate limit, retry
+    rate limits and transient errors with backoff, and carry deterministic
+    idempotency keys so interrupted runs can simply be started again.
+    """
+
+    RETRYABLE = ('RateLimitError', 'APIConnectionError', 'APIError')
+
+    def __init__(self, client: StripeClient, checkpoint_path: str, results_path: Optional[str] = None,
+                 namespace: str = 'default', key_field: str = 'email', rate: float = DEFAULT_RATE,
+                 concurrency: int = 32, max_retries: int = 6, progress_every: int = 1000):
+        self.client = client
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.results_path = results_path
+        self.namespace = namespace
+        self.key_field = key_field
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.progress_every = progress_every
+        self.counts = {'provisioned': 0, 'skipped': 0, 'failed': 0}
+        # Failed rows the checkpoint has no entry for, e.g. rows without a key
+        self.unrecorded = []
+        self._counts_lock = threading.Lock()
+
+    def _call(self, create, params: Dict, key: str):
+        """
+        One create call under the rate limit, retried on 429s and transient
+        failures. Other Stripe errors are raised to the caller.
+        """
+        stripe = stripe_client_module.stripe
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                return create(params=params, options={'idempotency_key': key})
+            except stripe.error.StripeError as e:
+                if type(e).__name__ not in self.RETRYABLE or attempt == self.max_retries:
+                    raise
+                delay = min(2 ** attempt * 0.5, 30.0) * random.uniform(0.5, 1.5)
+                if isinstance(e, stripe.error.RateLimitError):
+                    self.bucket.pause(delay)
+                time.sleep(delay)
+
+    def provision(self, row: Dict) -> Dict:
+        key = row.get(self.key_field)
+        if not key:
+            return self._fail_unrecorded('', f"Missing {self.key_field}: {row}")
+
+        previous = self.checkpoint.get(key) or {}
+        if previous.get('status') == 'ok':
+            self._count('skipped')
+            return previous
+
+        entry = {'key': key, 'status': 'ok', 'customer_id': previous.get('customer_id'),
+                 'subscription_id': None, 'error': None}
+        api = self.client.api
+        try:
+            if not entry['customer_id']:
+                customer = self._call(api.customers.create, {
+                    field: value for field, value in (
+                        ('email', row.get('email')),
+                        ('name', row.get('name')),
+                        ('description', row.get('description')),
+                    ) if value
+                }, idempotency_key(self.namespace, key, 'customer'))
+                entry['customer_id'] = customer['id']
+
+            if row.get('price_id'):
+                params = {'customer': entry['customer_id'], 'items': [{'price': row['price_id']}]}
+                if row.get('trial_period_days'):
+                    params['trial_period_days'] = int(row['trial_period_days'])
+                subscription = self._call(api.subscriptions.create, params,
+                                          idempotency_key(self.namespace, key, 'subscription'))
+                entry['subscription_id'] = subscription['id']
+        except Exception as e:
+            entry['status'] = 'failed'
+            entry['error'] = getattr(e, 'user_message', None) or str(e)
+            print(f"Error provisioning {key}: {entry['error']}")
+
+        self.checkpoint.record(entry)
+        self._count('provisioned' if entry['status'] == 'ok' else 'failed')
+        return entry
+
+    def _fail_unrecorded(self, key: str, error: str) -> Dict:
+        print(f"Error provisioning {key or 'row'}: {error}")
+        entry = {'key': key, 'status': 'failed', 'error': error}
+        with self._counts_lock:
+            self.unrecorded.append(entry)
+        self._count('failed')
+        return entry
+
+    def _count(self, name: str) -> None:
+        with self._counts_lock:
+            self.counts[name] += 1
+            done = sum(self.counts.values())
+        if self.progress_every and done % self.progress_every == 0:
+            print(f"Provisioned {self.counts['provisioned']}, skipped {self.counts['skipped']}, "
+                  f"failed {self.counts['failed']}")
+
+    def run(self, rows: Iterable[Dict]) -> Dict:
+        """
+        Provision every row and write the results file. Rows are streamed, so
+        memory stays flat however large the input is.
+        """
+        # Build the SDK client before the workers race to do it
+        self.client.api
+        started = time.monotonic()
+        in_flight = threading.BoundedSemaphore(self.concurrency * 4)
+
+        def finished(future, row):
+            in_flight.release()
+            try:
+                future.result()
+            except Exception as e:
+                # provision() records API errors itself; this is anything
+                # else, such as a checkpoint write that failed
+                self._fail_unrecorded(row.get(self.key_field) or '', str(e))
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='provision') as pool:
+            for row in rows:
+                in_flight.acquire()
+                future = pool.submit(self.provision, row)
+                future.add_done_callback(lambda future, row=row: finished(future, row))
+
+        self.checkpoint.close()
+        if self.results_path:
+            self.write_results(self.results_path)
+
+        elapsed = time.monotonic() - started
+        summary = dict(self.counts, elapsed_seconds=round(elapsed, 1),
+                       rows_per_second=round(sum(self.counts.values()) / elapsed, 1) if elapsed else 0.0)
+        print(f"Bulk provisioning finished: {summary}")
+        return summary
+
+    def write_results(self, path: str) -> None:
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for entry in self.checkpoint.entries.values():
+                writer.writerow(entry)
+            for entry in self.unrecorded:
+                writer.writerow(entry)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create Stripe customers and subscriptions from a CSV.")
+    parser.add_argument('csv', help="Input with email, name, description, price_id, trial_period_days columns")
+    parser.add_argument('--api-key', default=os.environ.get('STRIPE_API_KEY'))
+    parser.add_argument('--api-base', default=None, help="e.g. the mock server, http://127.0.0.1:12111")
+    parser.add_argument('--checkpoint', default=None, help="Defaults to <csv>.checkpoint.jsonl")
+    parser.add_argument('--results', default=None, help="Defaults to <csv>.results.csv")
+    parser.add_argument('--namespace', default='default',
+                        help="Part of every idempotency key; change it to provision the same rows again")
+    parser.add_argument('--key-field', default='email', help="Column that identifies a row")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help="API requests per second")
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    provisioner = BulkProvisioner(
+        StripeClient(args.api_key, api_base=args.api_base),
+        checkpoint_path=args.checkpoint or f"{args.csv}.checkpoint.jsonl",
+        results_path=args.results or f"{args.csv}.results.csv",
+        namespace=args.namespace,
+        key_field=args.key_field,
+        rate=args.rate,
+        concurrency=args.concurrency,
+    )
+    provisioner.run(read_csv(args.csv))
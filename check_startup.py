@@ -0,0 +1,71 @@
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Modules the Flask path must not pull in at import time
+DEFAULT_FORBIDDEN = ('django', 'pyarrow', 'stripe')
+
+
+def measure_import(module: str, forbidden: Tuple[str, ...]) -> Tuple[Dict[str, Tuple[int, int]], List[str]]:
+    """
+    Import `module` in a fresh interpreter under -X importtime. Returns
+    {name: (self_us, cumulative_us)} and the forbidden modules that got loaded.
+    """
+    code = (
+        f"import sys; import {module}; "
+        f"print(','.join(m for m in {tuple(forbidden)!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+
+    loaded = [name for name in result.stdout.strip().split(',') if name]
+    return timings, loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if importing the app exceeds the startup budget.")
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--budget-ms', type=float, default=250.0)
+    parser.add_argument('--runs', type=int, default=3, help="Best of N runs, to filter out noise")
+    parser.add_argument('--forbid', action='append', default=None,
+                        help=f"Module that must not be imported (default: {', '.join(DEFAULT_FORBIDDEN)})")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    forbidden = tuple(args.forbid or DEFAULT_FORBIDDEN)
+    best = None
+    for _ in range(args.runs):
+        timings, loaded = measure_import(args.module, forbidden)
+        if best is None or timings[args.module][1] < best[0][args.module][1]:
+            best = (timings, loaded)
+
+    timings, loaded = best
+    total_ms = timings[args.module][1] / 1000
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.1f} ms)")
+    print("slowest modules by self time:")
+    for name, (self_us, cumulative_us) in sorted(timings.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import time over budget by {total_ms - args.budget_ms:.1f} ms")
+        failed = True
+    if loaded:
+        print(f"FAIL: eagerly imported {', '.join(loaded)}")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from stripe_client import StripeClient
+
+
+class RuntimeConfig:
+    """
+    Immutable snapshot of the settings that can change without a restart.
+    A new snapshot is built on every change and swapped in as a whole.
+    """
+
+    __slots__ = ('tenants', 'disabled_event_types', 'coalesce_window', 'archive_flush_rows', 'admission',
+                 'loaded_at')
+
+    def __init__(self, tenants: Dict[str, Dict], disabled_event_types: Tuple[str, ...] = (),
+                 coalesce_window: Optional[float] = None, archive_flush_rows: Optional[int] = None,
+                 admission: Optional[Dict] = None):
+        self.tenants = tenants
+        self.disabled_event_types = frozenset(disabled_event_types)
+        self.coalesce_window = coalesce_window
+        self.archive_flush_rows = archive_flush_rows
+        self.admission = admission or {}
+        self.loaded_at = time.time()
+
+    def key(self) -> Tuple:
+        """
+        Everything that matters for applying the config, for change detection.
+        """
+        return (
+            json.dumps(self.tenants, sort_keys=True),
+            tuple(sorted(self.disabled_event_types)),
+            self.coalesce_window,
+            self.archive_flush_rows,
+            json.dumps(self.admission, sort_keys=True),
+        )
+
+
+def active_secrets(entries: List, now: Optional[float] = None) -> List[str]:
+    """
+    Resolve webhook secret entries to the ones accepted right now. An entry is
+    either a secret string or {"secret": ..., "expires_at": unix_ts}, which is
+    how the old secret is kept valid for a rotation window.
+    """
+    now = time.time() if now is None else now
+    secrets = []
+    for entry in entries:
+        if isinstance(entry, str):
+            secrets.append(entry)
+        elif entry.get('expires_at') is None or entry['expires_at'] > now:
+            secrets.append(entry['secret'])
+    return secrets
+
+
+def build_config(raw: Dict, now: Optional[float] = None) -> RuntimeConfig:
+    """
+    Validate a raw config mapping and resolve it into a RuntimeConfig.
+    Raises ValueError so a bad edit never replaces a working config.
+    """
+    tenants = {}
+    for name, entry in (raw.get('tenants') or {}).items():
+        resolved = {}
+        if 'webhook_secrets' in entry:
+            secrets = active_secrets(entry['webhook_secrets'], now)
+            if not secrets:
+                raise ValueError(f"Tenant {name} has no active webhook secret")
+            resolved['webhook_secrets'] = secrets
+        if entry.get('api_key'):
+            resolved['api_key'] = entry['api_key']
+        tenants[name] = resolved
+
+    coalesce_window = raw.get('coalesce_window')
+    if coalesce_window is not None and coalesce_window <= 0:
+        raise ValueError("coalesce_window must be positive")
+    archive_flush_rows = raw.get('archive_flush_rows')
+    if archive_flush_rows is not None and archive_flush_rows < 1:
+        raise ValueError("archive_flush_rows must be at least 1")
+
+    return RuntimeConfig(
+        tenants,
+        disabled_event_types=tuple(raw.get('disabled_event_types') or ()),
+        coalesce_window=coalesce_window,
+        archive_flush_rows=archive_flush_rows,
+        admission=raw.get('admission'),
+    )
+
+
+class FileSource:
+    """
+    JSON config file, re-read whenever its mtime or size changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._stamp = None
+
+    def changed(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+    def load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError:
+            # Probably caught mid-write; try again on the next poll
+            self._stamp = None
+            raise
+
+
+class EnvSource:
+    """
+    Settings for a single tenant from environment variables, e.g.
+    STRIPE_WEBHOOK_SECRETS="whsec_new,whsec_old".
+    """
+
+    def __init__(self, tenant: str = 'default', prefix: str = 'STRIPE_'):
+        self.tenant = tenant
+        self.prefix = prefix
+        self._snapshot = None
+
+    def _read(self) -> Dict:
+        return {name: value for name, value in os.environ.items() if name.startswith(self.prefix)}
+
+    def changed(self) -> bool:
+        snapshot = self._read()
+        if snapshot == self._snapshot:
+            return False
+        self._snapshot = snapshot
+        return True
+
+    def load(self) -> Dict:
+        env = self._snapshot if self._snapshot is not None else self._read()
+        tenant = {}
+        secrets = env.get(self.prefix + 'WEBHOOK_SECRETS') or env.get(self.prefix + 'WEBHOOK_SECRET')
+        if secrets:
+            tenant['webhook_secrets'] = [secret.strip() for secret in secrets.split(',') if secret.strip()]
+        if env.get(self.prefix + 'API_KEY'):
+            tenant['api_key'] = env[self.prefix + 'API_KEY']
+
+        raw = {'tenants': {self.tenant: tenant}}
+        disabled = env.get(self.prefix + 'DISABLED_EVENT_TYPES')
+        if disabled:
+            raw['disabled_event_types'] = [event_type.strip() for event_type in disabled.split(',')]
+        if env.get(self.prefix + 'COALESCE_WINDOW'):
+            raw['coalesce_window'] = float(env[self.prefix + 'COALESCE_WINDOW'])
+        return raw
+
+
+class ConfigWatcher:
+    """
+    Poll a config source and swap in a new RuntimeConfig when it changes or
+    when a rotated-out secret expires. Subscribers are called with the new
+    config after the swap; `current` is always a complete snapshot.
+    """
+
+    def __init__(self, source, interval: float = 2.0):
+        self.source = source
+        self.interval = interval
+        self.current: Optional[RuntimeConfig] = None
+        self.reloads = 0
+        self.errors = 0
+        self._raw: Optional[Dict] = None
+        self._subscribers: List[Callable[[RuntimeConfig], None]] = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback: Callable[[RuntimeConfig], None]) -> None:
+        self._subscribers.append(callback)
+        if self.current is not None:
+            callback(self.current)
+
+    def poll(self) -> bool:
+        """
+        Check the source once. Returns True if a new config was applied.
+        """
+        try:
+            if self.source.changed():
+                self._raw = self.source.load()
+            if self._raw is None:
+                return False
+            config = build_config(self._raw)
+        except Exception as e:
+            # Keep serving with the last good config
+            self.errors += 1
+            print(f"Error loading runtime config: {str(e)}")
+            return False
+
+        if self.current is not None and config.key() == self.current.key():
+            return False
+
+        self.current = config
+        self.reloads += 1
+        for callback in self._subscribers:
+            try:
+                callback(config)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error applying runtime config: {str(e)}")
+        return True
+
+    def start(self) -> 'ConfigWatcher':
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name='config-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.poll()
+
+
+def apply_to_tenants(registry, admission=None) -> Callable[[RuntimeConfig], None]:
+    """
+    Subscriber that pushes a RuntimeConfig into live tenants and the admission
+    controller. Every change is a plain attribute assignment, so requests in
+    flight finish with the values they started with.
+    """
+
+    def apply(config: RuntimeConfig) -> None:
+        for name, tenant in registry.tenants.items():
+            handler = tenant.handler
+            settings = config.tenants.get(name, {})
+
+            if settings.get('webhook_secrets'):
+                tenant.webhook_secret = settings['webhook_secrets'][0]
+                handler.set_webhook_secrets(settings['webhook_secrets'])
+
+            if settings.get('api_key') and settings['api_key'] != tenant.api_key:
+                client = StripeClient(
+                    settings['api_key'],
+                    api_base=tenant.stripe_client.api_base,
+                    stripe_account=tenant.stripe_client.stripe_account,
+                    state_store=tenant.stripe_client.state_store
+                )
+                tenant.api_key = settings['api_key']
+                tenant.stripe_client = client
+                handler.stripe_client = client
+
+            handler.disabled_event_types = config.disabled_event_types
+            if config.coalesce_window and handler.coalescer is not None:
+                handler.coalescer.window_seconds = config.coalesce_window
+            if config.archive_flush_rows and handler.archive is not None:
+                handler.archive.flush_rows = config.archive_flush_rows
+
+        if admission is not None:
+            for field in ('latency_target', 'min_limit', 'max_limit', 'backoff_ratio', 'retry_after'):
+                if field in config.admission:
+                    setattr(admission, field, config.admission[field])
+
+    return apply
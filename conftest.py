@@ -0,0 +1,23 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def wait_for():
+    """
+    Poll a condition until it holds, failing the test after `timeout` seconds.
+    """
+    def wait(condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError("condition not met in time")
+            time.sleep(0.005)
+
+    return wait
+
+
+@pytest.fixture
+def quiet(monkeypatch):
+    monkeypatch.setattr('builtins.print', lambda *args, **kwargs: None)
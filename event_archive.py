@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+# pyarrow is optional and slow to import, so it is only loaded once an
+# archive or query is actually created
+pa = ds = pq = None
+
+ARCHIVE_COLUMNS = ('event_id', 'type', 'created', 'object_id', 'customer', 'amount', 'currency')
+
+# Which field holds the money amount for each object type
+AMOUNT_FIELDS = {
+    'payment_intent': 'amount_received',
+    'invoice': 'amount_paid',
+}
+
+
+def _require_pyarrow():
+    global pa, ds, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow is required for the event archive (pip install pyarrow)")
+    pa, ds, pq = pyarrow, pyarrow.dataset, pyarrow.parquet
+
+
+def event_to_row(event) -> Dict:
+    """
+    Flatten a Stripe event into one archive row.
+    """
+    data_object = event['data']['object']
+    amount_field = AMOUNT_FIELDS.get(data_object.get('object'), 'amount')
+    return {
+        'event_id': event.get('id'),
+        'type': event.get('type'),
+        'created': int(event.get('created') or time.time()),
+        'object_id': data_object.get('id'),
+        'customer': data_object.get('customer'),
+        'amount': data_object.get(amount_field),
+        'currency': data_object.get('currency'),
+    }
+
+
+def _schema():
+    return pa.schema([
+        ('event_id', pa.string()),
+        ('type', pa.string()),
+        ('created', pa.int64()),
+        ('object_id', pa.string()),
+        ('customer', pa.string()),
+        ('amount', pa.int64()),
+        ('currency', pa.string()),
+    ])
+
+
+class EventArchive:
+    """
+    Append-only columnar archive of processed events, partitioned by hour.
+
+    Rows are buffered in memory and written by a background thread, so the
+    webhook path only pays for building a small dict.
+    """
+
+    def __init__(self, root_dir: str, file_format: str = 'parquet', flush_rows: int = 5000,
+                 flush_interval: float = 5.0):
+        _require_pyarrow()
+        if file_format not in ('parquet', 'arrow'):
+            raise ValueError(f"Unsupported archive format: {file_format}")
+
+        self.root_dir = root_dir
+        self.file_format = file_format
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.schema = _schema()
+        self.rows_written = 0
+        self.files_written = 0
+
+        self._buffers: Dict[str, List[Dict]] = {}
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._sequence = 0
+
+        self._writer = threading.Thread(target=self._run, name='event-archive', daemon=True)
+        self._writer.start()
+
+    def append(self, event) -> None:
+        """
+        Buffer one processed event for the archive.
+        """
+        row = event_to_row(event)
+        partition = EventArchive.partition_for(row['created'])
+
+        with self._lock:
+            self._buffers.setdefault(partition, []).append(row)
+            self._buffered += 1
+            full = self._buffered >= self.flush_rows
+
+        if full:
+            self._wakeup.set()
+
+    @staticmethod
+    def partition_for(created: int) -> str:
+        """
+        Hourly partition directory, in hive layout so readers can prune it.
+        """
+        hour = datetime.fromtimestamp(created, tz=timezone.utc)
+        return f"date={hour:%Y-%m-%d}/hour={hour:%H}"
+
+    def flush(self) -> None:
+        """
+        Write every buffered row to a new file in its partition.
+        """
+        with self._lock:
+            buffers = self._buffers
+            self._buffers = {}
+            self._buffered = 0
+
+        for partition, rows in buffers.items():
+            try:
+                self._write_partition(partition, rows)
+            except Exception as e:
+                print(f"Error writing event archive partition {partition}: {str(e)}")
+
+    def close(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+        self._writer.join()
+        self.flush()
+
+    def _write_partition(self, partition: str, rows: List[Dict]) -> None:
+        directory = os.path.join(self.root_dir, partition)
+        os.makedirs(directory, exist_ok=True)
+
+        self._sequence += 1
+        extension = 'parquet' if self.file_format == 'parquet' else 'arrow'
+        name = f"part-{int(time.time() * 1000)}-{os.getpid()}-{self._sequence}.{extension}"
+        path = os.path.join(directory, name)
+        tmp_path = path + '.tmp'
+
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        if self.file_format == 'parquet':
+            pq.write_table(table, tmp_path)
+        else:
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, self.schema) as writer:
+                writer.write_table(table)
+
+        # Readers never see a half-written file
+        os.replace(tmp_path, path)
+        self.rows_written += len(rows)
+        self.files_written += 1
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+class ArchiveQuery:
+    """
+    Vectorized aggregations over the archive, run entirely outside the
+    database the webhook handlers write to.
+    """
+
+    def __init__(self, root_dir: str, file_format: str = 'parquet'):
+        _require_pyarrow()
+        self.dataset = ds.dataset(
+            root_dir,
+            format='parquet' if file_format == 'parquet' else 'ipc',
+            partitioning='hive',
+            exclude_invalid_files=True,
+        )
+
+    def _filter(self, event_types: Optional[Iterable[str]] = None, start: Optional[int] = None,
+                end: Optional[int] = None, customer: Optional[str] = None):
+        expression = None
+        conditions = []
+        if event_types:
+            conditions.append(ds.field('type').isin(list(event_types)))
+        if start is not None:
+            conditions.append(ds.field('created') >= start)
+        if end is not None:
+            conditions.append(ds.field('created') < end)
+        if customer is not None:
+            conditions.append(ds.field('customer') == customer)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def table(self, columns: Optional[List[str]] = None, **filters):
+        """
+        Load the matching rows as an Arrow table.
+        """
+        return self.dataset.to_table(columns=columns, filter=self._filter(**filters))
+
+    def aggregate(self, group_by: List[str], event_types: Optional[Iterable[str]] = None,
+                  start: Optional[int] = None, end: Optional[int] = None,
+                  customer: Optional[str] = None) -> List[Dict]:
+        """
+        Sum, count and average `amount` grouped by any of type, currency or customer.
+        """
+        unknown = set(group_by) - set(ARCHIVE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot group by: {', '.join(sorted(unknown))}")
+
+        table = self.table(
+            columns=list(set(group_by) | {'amount'}),
+            event_types=event_types, start=start, end=end, customer=customer,
+        )
+        result = table.group_by(group_by).aggregate([
+            ('amount', 'sum'),
+            ('amount', 'count'),
+            ('amount', 'mean'),
+        ])
+        return result.to_pylist()
+
+    def revenue_by_currency(self, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """
+        Revenue from payment_intent.succeeded events, per currency.
+        """
+        return self.aggregate(['currency'], event_types=['payment_intent.succeeded'], start=start, end=end)
@@ -0,0 +1,196 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+# A single invoice produces these within milliseconds of each other and every
+# one of them ends in the same Invoice.objects.update_or_create call.
+# invoice.payment_succeeded is left out: its handler also writes the outbox
+# notification, which would be lost if a later event were folded over it.
+DEFAULT_COALESCED_TYPES = (
+    'invoice.updated',
+    'invoice.paid',
+)
+
+# When two events carry the same `created` second, the one further along the
+# invoice lifecycle is treated as the latest state.
+EVENT_TYPE_RANK = {
+    'invoice.updated': 0,
+    'invoice.paid': 1,
+    'invoice.payment_succeeded': 2,
+}
+
+
+class EventCoalescer:
+    """
+    Hold events for the same Stripe object for a short window and run the
+    downstream handler once with the latest state.
+    """
+
+    def __init__(self, dispatch: Callable[[str, Dict], None], window_seconds: float = 0.25,
+                 event_types: Iterable[str] = DEFAULT_COALESCED_TYPES,
+                 on_processed: Optional[Callable[[str], None]] = None, flush_workers: int = 4):
+        """
+        `dispatch` is called as dispatch(event_type, data_object) once per window,
+        with the latest event's trace as a third argument when it is traced;
+        if it returns False the events are held for another window.
+        `on_processed` is called with every event id that was folded into it.
+        Closed windows are dispatched on up to `flush_workers` threads.
+        """
+        self.dispatch = dispatch
+        self.window_seconds = window_seconds
+        self.event_types = frozenset(event_types)
+        self.on_processed = on_processed
+        self._pending: Dict[str, List[Dict]] = {}
+        # When each open window closes, and a heap of the same for the flusher
+        self._deadlines: Dict[str, float] = {}
+        self._heap: List = []
+        # Traces of the pending events by object id and event id
+        self._traces: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self.events_received = 0
+        self.dispatches = 0
+        self.requeues = 0
+
+        # One thread closes every window, however many objects are pending
+        self._dispatcher = ThreadPoolExecutor(max_workers=flush_workers, thread_name_prefix='coalescer-dispatch')
+        self._flusher = threading.Thread(target=self._run, name='coalescer-flush', daemon=True)
+        self._flusher.start()
+
+    def accepts(self, event) -> bool:
+        """
+        Return True if the event type is one this coalescer should hold back.
+        """
+        return event.get('type') in self.event_types and bool(event['data']['object'].get('id'))
+
+    def submit(self, event, trace=None) -> None:
+        """
+        Queue an event; the first event for an object opens its window.
+        """
+        object_id = event['data']['object']['id']
+
+        with self._lock:
+            self.events_received += 1
+            if trace is not None:
+                self._traces.setdefault(object_id, {})[event.get('id')] = trace
+            bucket = self._pending.get(object_id)
+            if bucket is not None:
+                bucket.append(event)
+                return
+            self._open_window(object_id, [event])
+
+    def _open_window(self, object_id: str, events: List[Dict]) -> None:
+        # Called with the lock held
+        self._pending[object_id] = events
+        deadline = time.monotonic() + self.window_seconds
+        self._deadlines[object_id] = deadline
+        heapq.heappush(self._heap, (deadline, object_id))
+        if self._heap[0][1] == object_id:
+            # Earlier than anything the flusher is waiting for
+            self._cond.notify()
+
+    def _requeue(self, object_id: str, events: List[Dict], traces: Dict[str, object]) -> None:
+        with self._lock:
+            self.requeues += 1
+            if traces:
+                self._traces.setdefault(object_id, {}).update(traces)
+            bucket = self._pending.get(object_id)
+            if bucket is not None:
+                # Newer events arrived meanwhile; keep them after these
+                bucket[:0] = events
+                return
+            self._open_window(object_id, events)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, object_id = self._heap[0]
+                    remaining = deadline - time.monotonic()
+                    if remaining > 0:
+                        self._cond.wait(remaining)
+                        continue
+                    heapq.heappop(self._heap)
+                    # Skip windows that flush() already closed
+                    if self._deadlines.get(object_id) == deadline:
+                        break
+            self._dispatcher.submit(self.flush_object, object_id)
+
+    def flush_object(self, object_id: str) -> None:
+        """
+        Close the window for one object and dispatch its latest state.
+        """
+        with self._lock:
+            events = self._pending.pop(object_id, None)
+            self._deadlines.pop(object_id, None)
+            traces = self._traces.pop(object_id, {})
+
+        if not events:
+            return
+
+        latest = EventCoalescer.latest_event(events)
+        trace = traces.get(latest.get('id'))
+
+        try:
+            if trace is None:
+                accepted = self.dispatch(latest['type'], latest['data']['object'])
+            else:
+                accepted = self.dispatch(latest['type'], latest['data']['object'], trace)
+        except Exception as e:
+            accepted = False
+            print(f"Error dispatching coalesced events for {object_id}: {str(e)}")
+            if trace is not None:
+                trace.end('error')
+        else:
+            if accepted is False:
+                # The lane is full: hold the events (and their traces) for
+                # another window instead of dropping them
+                self._requeue(object_id, events, traces)
+                return
+            self.dispatches += 1
+
+        # Events folded into the latest one end their trace here
+        for folded in traces.values():
+            if folded is not trace:
+                folded.end('coalesced')
+
+        # Failed events are not recorded, so a redelivery is handled again
+        if self.on_processed is not None and accepted is not False:
+            for event in events:
+                self.on_processed(event.get('id'))
+
+    def flush(self) -> None:
+        """
+        Dispatch everything still waiting, e.g. before the worker shuts down,
+        and return once those dispatches have finished.
+        """
+        with self._lock:
+            object_ids = list(self._pending)
+
+        futures = [self._dispatcher.submit(self.flush_object, object_id) for object_id in object_ids]
+        for future in futures:
+            future.result()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    @staticmethod
+    def latest_event(events: List[Dict]) -> Dict:
+        """
+        Pick the event describing the newest object state. Stripe events carry
+        a full snapshot of the object, so the newest one already is the merge.
+        """
+        return max(
+            enumerate(events),
+            key=lambda item: (
+                item[1].get('created') or 0,
+                EVENT_TYPE_RANK.get(item[1].get('type'), 0),
+                item[0],
+            ),
+        )[1]
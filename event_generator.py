@@ -0,0 +1,294 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from signature import sign_payload
+
+# Every event type WebhookHandler has a handler for, weighted roughly like a
+# subscription business during a billing run.
+DEFAULT_TYPE_MIX = {
+    'invoice.updated': 30,
+    'invoice.paid': 20,
+    'invoice.payment_succeeded': 20,
+    'payment_intent.succeeded': 15,
+    'customer.subscription.created': 6,
+    'customer.subscription.deleted': 3,
+    'customer.created': 6,
+}
+
+CURRENCIES = ('usd', 'eur', 'gbp', 'cad', 'aud', 'jpy')
+
+
+class EventGenerator:
+    """
+    Deterministic source of Stripe-shaped webhook events.
+
+    The same seed and settings always yield the same events in the same order,
+    including which ones are duplicated or delivered out of order.
+    """
+
+    def __init__(self, seed: int = 0, type_mix: Optional[Dict[str, float]] = None, customers: int = 1000,
+                 line_items: tuple = (1, 3), duplicate_rate: float = 0.0, out_of_order_rate: float = 0.0,
+                 max_reorder_distance: int = 5, start_time: int = 1700000000, events_per_second: float = 50.0):
+        self.rng = random.Random(seed)
+        self.type_mix = type_mix or DEFAULT_TYPE_MIX
+        unknown = set(self.type_mix) - set(DEFAULT_TYPE_MIX)
+        if unknown:
+            raise ValueError(f"Unsupported event type(s): {', '.join(sorted(unknown))}")
+
+        self.types = list(self.type_mix)
+        self.weights = [self.type_mix[event_type] for event_type in self.types]
+        self.customers = [self._customer(index) for index in range(customers)]
+        self.line_items = line_items
+        self.duplicate_rate = duplicate_rate
+        self.out_of_order_rate = out_of_order_rate
+        self.max_reorder_distance = max_reorder_distance
+        self.clock = float(start_time)
+        self.tick = 1.0 / events_per_second
+        self.sequence = 0
+        # Open invoices that later paid/payment_succeeded events settle, so the
+        # same invoice id shows up in bursts the way it does from Stripe
+        self.open_invoices = deque(maxlen=64)
+
+    def _id(self, prefix: str) -> str:
+        return f"{prefix}_{self.rng.getrandbits(64):016x}"
+
+    def _customer(self, index: int) -> Dict:
+        return {
+            'id': f"cus_{index:010d}",
+            'object': 'customer',
+            'email': f"customer{index}@example.com",
+            'name': f"Customer {index}",
+            'description': None,
+            'metadata': {},
+        }
+
+    def _lines(self) -> List[Dict]:
+        count = self.rng.randint(*self.line_items)
+        return [
+            {
+                'id': self._id('il'),
+                'object': 'line_item',
+                'amount': self.rng.randint(100, 50000),
+                'quantity': 1,
+                'price': {
+                    'id': f"price_{self.rng.randint(1, 50):04d}",
+                    'product': f"prod_{self.rng.randint(1, 20):04d}",
+                    'recurring': {'interval': 'month', 'interval_count': 1},
+                },
+            }
+            for _ in range(count)
+        ]
+
+    def _object(self, event_type: str, created: int) -> Dict:
+        customer = self.rng.choice(self.customers)
+
+        if event_type == 'customer.created':
+            return dict(customer, created=created)
+
+        if event_type.startswith('customer.subscription.'):
+            lines = self._lines()
+            return {
+                'id': self._id('sub'),
+                'object': 'subscription',
+                'created': created,
+                'customer': customer['id'],
+                'status': 'canceled' if event_type.endswith('deleted') else 'active',
+                'current_period_start': created,
+                'current_period_end': created + 30 * 86400,
+                'items': {'object': 'list', 'data': [{'id': line['id'], 'price': line['price']} for line in lines]},
+                'metadata': {},
+            }
+
+        if event_type.startswith('invoice.'):
+            paid = event_type != 'invoice.updated'
+            if paid and self.open_invoices and self.rng.random() < 0.8:
+                # Settling an invoice keeps the `created` it was opened with
+                invoice = dict(self.open_invoices[self.rng.randrange(len(self.open_invoices))])
+                invoice.update(status='paid', amount_paid=invoice['amount_due'])
+                return invoice
+
+            lines = self._lines()
+            total = sum(line['amount'] for line in lines)
+            invoice = {
+                'id': self._id('in'),
+                'object': 'invoice',
+                'created': created,
+                'customer': customer['id'],
+                'customer_email': customer['email'],
+                'subscription': self._id('sub'),
+                'status': 'paid' if paid else 'open',
+                'amount_due': total,
+                'amount_paid': total if paid else 0,
+                'currency': self.rng.choice(CURRENCIES),
+                'lines': {'object': 'list', 'data': lines},
+            }
+            if not paid:
+                self.open_invoices.append(invoice)
+            return invoice
+
+        amount = self.rng.randint(100, 100000)
+        return {
+            'id': self._id('pi'),
+            'object': 'payment_intent',
+            'created': created,
+            'amount': amount,
+            'amount_received': amount,
+            'currency': self.rng.choice(CURRENCIES),
+            'customer': customer['id'],
+            'status': 'succeeded',
+            'metadata': {'order_id': str(self.rng.randint(1, 10 ** 9))},
+        }
+
+    def _next_event(self) -> Dict:
+        self.clock += self.tick
+        self.sequence += 1
+        created = int(self.clock)
+        event_type = self.rng.choices(self.types, self.weights)[0]
+        return {
+            'id': self._id('evt'),
+            'object': 'event',
+            'api_version': '2024-06-20',
+            'type': event_type,
+            'created': created,
+            'livemode': False,
+            'pending_webhooks': 1,
+            'data': {'object': self._object(event_type, created)},
+        }
+
+    def events(self, count: int) -> Iterator[Dict]:
+        """
+        Yield `count` deliveries, duplicates and reordering included.
+        """
+        held: List[List] = []  # [remaining_distance, event]
+        produced = 0
+
+        while produced < count:
+            event = self._next_event()
+
+            if self.out_of_order_rate and self.rng.random() < self.out_of_order_rate:
+                held.append([self.rng.randint(1, self.max_reorder_distance), event])
+            else:
+                yield event
+                produced += 1
+                if self.duplicate_rate and produced < count and self.rng.random() < self.duplicate_rate:
+                    yield event
+                    produced += 1
+
+            for item in list(held):
+                item[0] -= 1
+                if item[0] <= 0 and produced < count:
+                    held.remove(item)
+                    yield item[1]
+                    produced += 1
+
+    def write_jsonl(self, path: str, count: int) -> int:
+        """
+        Write deliveries to a JSONL file ("-" for stdout).
+        """
+        written = 0
+        stream = sys.stdout if path == '-' else open(path, 'w')
+        try:
+            for event in self.events(count):
+                stream.write(json.dumps(event, separators=(',', ':')))
+                stream.write('\n')
+                written += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        return written
+
+    def stream_to(self, url: str, webhook_secret: str, count: int, concurrency: int = 8,
+                  rate: Optional[float] = None) -> Dict:
+        """
+        POST signed deliveries to a webhook endpoint and report status counts
+        and throughput. `rate` caps deliveries per second.
+        """
+        statuses: Dict[str, int] = {}
+        lock = threading.Lock()
+
+        def send(event):
+            payload = json.dumps(event, separators=(',', ':'))
+            request = urllib.request.Request(url, data=payload.encode('utf-8'), method='POST', headers={
+                'Content-Type': 'application/json',
+                # Signed at send time so the timestamp stays inside Stripe's tolerance
+                'Stripe-Signature': sign_payload(payload, webhook_secret),
+            })
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    status = str(response.status)
+            except urllib.error.HTTPError as e:
+                status = str(e.code)
+            except Exception as e:
+                status = type(e).__name__
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for index, event in enumerate(self.events(count)):
+                if rate:
+                    delay = started + index / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                pool.submit(send, event)
+        elapsed = time.perf_counter() - started
+
+        return {
+            'sent': count,
+            'seconds': round(elapsed, 3),
+            'events_per_second': round(count / elapsed, 1) if elapsed else None,
+            'statuses': statuses,
+        }
+
+
+def parse_type_mix(value: str) -> Dict[str, float]:
+    """
+    Parse "invoice.paid=5,payment_intent.succeeded=2" into a weight mapping.
+    """
+    mix = {}
+    for item in value.split(','):
+        event_type, _, weight = item.partition('=')
+        mix[event_type.strip()] = float(weight or 1)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Stripe webhook traffic.")
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mix', type=parse_type_mix, default=None,
+                        help="Weights per type, e.g. invoice.paid=5,payment_intent.succeeded=2")
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--min-lines', type=int, default=1)
+    parser.add_argument('--max-lines', type=int, default=3)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0)
+    parser.add_argument('--out-of-order-rate', type=float, default=0.0)
+    parser.add_argument('--output', default=None, help="JSONL file to write, '-' for stdout")
+    parser.add_argument('--url', default=None, help="Webhook endpoint to stream to")
+    parser.add_argument('--webhook-secret', default='whsec_test')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=None, help="Max deliveries per second")
+    args = parser.parse_args()
+
+    generator = EventGenerator(
+        seed=args.seed,
+        type_mix=args.mix,
+        customers=args.customers,
+        line_items=(args.min_lines, args.max_lines),
+        duplicate_rate=args.duplicate_rate,
+        out_of_order_rate=args.out_of_order_rate,
+    )
+
+    if args.url:
+        print(json.dumps(generator.stream_to(args.url, args.webhook_secret, args.count, args.concurrency, args.rate)))
+    else:
+        generator.write_jsonl(args.output or '-', args.count)
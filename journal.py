@@ -0,0 +1,355 @@
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# length, crc32 of the payload, sequence number
+RECORD_HEADER = struct.Struct('<IIQ')
+
+SEGMENT_NAME = re.compile(r'^wal-(\d{20})\.log$')
+
+ZERO_CHUNK = bytes(1 << 20)
+
+
+class Segment:
+    """
+    One preallocated, memory-mapped journal file holding records from
+    `base_seq` on.
+    """
+
+    def __init__(self, path: str, base_seq: int, size: int):
+        self.path = path
+        self.base_seq = base_seq
+        self.last_seq = base_seq - 1
+        self.position = 0
+        with open(path, 'a+b') as f:
+            if os.fstat(f.fileno()).st_size < size:
+                f.truncate(size)
+            self.size = os.fstat(f.fileno()).st_size
+            self.mm = mmap.mmap(f.fileno(), self.size)
+        # Byte range written since the last msync
+        self.dirty_from: Optional[int] = None
+
+    def fits(self, length: int) -> bool:
+        return self.position + RECORD_HEADER.size + length <= self.size
+
+    def write(self, seq: int, payload: bytes) -> None:
+        start = self.position
+        RECORD_HEADER.pack_into(self.mm, start, len(payload), zlib.crc32(payload), seq)
+        end = start + RECORD_HEADER.size + len(payload)
+        self.mm[start + RECORD_HEADER.size:end] = payload
+        self.position = end
+        self.last_seq = seq
+        if self.dirty_from is None:
+            self.dirty_from = start
+
+    def recover(self, expected_seq: int) -> List[Tuple[int, bytes]]:
+        """
+        Read records up to the first empty slot or damaged record, e.g. one
+        torn by a crash. Everything after it is zeroed so new appends start
+        from a clean end.
+        """
+        records = []
+        position = 0
+        while position + RECORD_HEADER.size <= self.size:
+            length, crc, seq = RECORD_HEADER.unpack_from(self.mm, position)
+            end = position + RECORD_HEADER.size + length
+            if length == 0 or end > self.size or seq != expected_seq:
+                break
+            payload = bytes(self.mm[position + RECORD_HEADER.size:end])
+            if zlib.crc32(payload) != crc:
+                break
+            records.append((seq, payload))
+            expected_seq += 1
+            position = end
+
+        self.position = position
+        self.last_seq = expected_seq - 1
+        # Pages are written back in any order, so a crash can leave data
+        # beyond the first hole too
+        for tail in range(position, self.size, len(ZERO_CHUNK)):
+            chunk = ZERO_CHUNK[:self.size - tail]
+            if self.mm[tail:tail + len(chunk)] != chunk:
+                self.mm[tail:tail + len(chunk)] = chunk
+        return records
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+class Journal:
+    """
+    Segmented, memory-mapped write-ahead log of raw webhook payloads.
+
+    append() copies a payload into the active segment and returns its
+    sequence number; wait_durable() blocks until a background thread has
+    msynced it. The thread syncs everything appended since its last pass in
+    one go, so concurrent requests share each sync (group commit).
+    ack() marks a sequence number as handled; fully acknowledged segments
+    are deleted, and on restart recovered() returns the unacknowledged tail.
+    """
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024, commit_delay: float = 0.0,
+                 checkpoint_interval: float = 1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        # Extra time to wait for more appends before each sync
+        self.commit_delay = commit_delay
+        self.checkpoint_interval = checkpoint_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self.acked_upto = self._read_checkpoint()
+        self._acked = set()
+        self._saved_checkpoint = self.acked_upto
+        self.syncs = 0
+        self.synced_records = 0
+
+        self.segments: List[Segment] = []
+        self._recovered: List[Tuple[int, bytes]] = []
+        expected_seq = None
+        for name in sorted(os.listdir(directory)):
+            match = SEGMENT_NAME.match(name)
+            if match is None:
+                continue
+            base_seq = int(match.group(1))
+            if expected_seq is not None and base_seq != expected_seq:
+                print(f"Error recovering journal: {name} does not follow sequence {expected_seq - 1}")
+            segment = Segment(os.path.join(directory, name), base_seq, segment_size)
+            records = segment.recover(base_seq)
+            self._recovered.extend(record for record in records if record[0] > self.acked_upto)
+            self.segments.append(segment)
+            expected_seq = segment.last_seq + 1
+
+        self.next_seq = max(expected_seq or 1, self.acked_upto + 1)
+        if not self.segments or self.segments[-1].last_seq + 1 != self.next_seq:
+            self.segments.append(self._new_segment(self.next_seq, segment_size))
+        self.durable_seq = self.next_seq - 1
+
+        self.dead_letters = 0
+        self._dead_letter_lock = threading.Lock()
+
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='journal-sync', daemon=True)
+        self._thread.start()
+
+    def _new_segment(self, base_seq: int, size: int) -> Segment:
+        return Segment(os.path.join(self.directory, f"wal-{base_seq:020d}.log"), base_seq, size)
+
+    def _dead_letter_path(self) -> str:
+        return os.path.join(self.directory, 'dead-letter.jsonl')
+
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.directory, 'checkpoint')
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(self._checkpoint_path()) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, acked_upto: int) -> None:
+        # A stale checkpoint only means replaying a few handled events again
+        temp_path = self._checkpoint_path() + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(str(acked_upto))
+        os.replace(temp_path, self._checkpoint_path())
+
+    # Writing
+
+    def append(self, payload: bytes) -> int:
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Journal is closed")
+            active = self.segments[-1]
+            if not active.fits(len(payload)):
+                # Oversized payloads get a segment of their own size
+                size = max(self.segment_size, RECORD_HEADER.size * 2 + len(payload))
+                active = self._new_segment(self.next_seq, size)
+                self.segments.append(active)
+            seq = self.next_seq
+            self.next_seq += 1
+            active.write(seq, payload)
+            self._cond.notify_all()
+        return seq
+
+    def wait_durable(self, seq: int, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            self._cond.wait_for(lambda: self.durable_seq >= seq or self._stopped, timeout)
+            return self.durable_seq >= seq
+
+    def ack(self, seq: int) -> None:
+        """
+        Mark a record as handled. Records are acknowledged out of order by
+        concurrent workers; the watermark only moves over a gap-free prefix.
+        """
+        with self._cond:
+            if seq <= self.acked_upto:
+                return
+            self._acked.add(seq)
+            while self.acked_upto + 1 in self._acked:
+                self.acked_upto += 1
+                self._acked.discard(self.acked_upto)
+
+    def dead_letter(self, seq: int, payload: bytes, reason: str) -> bool:
+        """
+        Move a record that failed for good into dead-letter.jsonl and
+        acknowledge it, so it neither holds back the watermark nor runs again
+        on every restart. Returns False, leaving the record unacknowledged, if
+        the dead letter could not be written.
+        """
+        line = json.dumps({
+            'seq': seq,
+            'reason': reason,
+            'failed_at': time.time(),
+            'payload': payload.decode('utf-8', errors='replace'),
+        }, separators=(',', ':'))
+        try:
+            with self._dead_letter_lock:
+                with open(self._dead_letter_path(), 'a') as f:
+                    f.write(line + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.dead_letters += 1
+        except Exception as e:
+            print(f"Error writing journal record {seq} to the dead letter file: {str(e)}")
+            return False
+        self.ack(seq)
+        return True
+
+    def recovered(self) -> List[Tuple[int, bytes]]:
+        """
+        The records found at startup that were never acknowledged, handed out
+        once for replay.
+        """
+        with self._cond:
+            records, self._recovered = self._recovered, []
+        return records
+
+    # Background sync, checkpoint and compaction
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.next_seq - 1 > self.durable_seq or self._stopped,
+                                    self.checkpoint_interval)
+                stopped = self._stopped
+            if self.commit_delay and not stopped:
+                time.sleep(self.commit_delay)
+
+            with self._cond:
+                target = self.next_seq - 1
+                dirty = [segment for segment in self.segments if segment.dirty_from is not None]
+                # Positions are read under the lock, so the sync covers every
+                # record up to `target`
+                ranges = [(segment, segment.dirty_from, segment.position) for segment in dirty]
+                for segment in dirty:
+                    segment.dirty_from = None
+
+            try:
+                for segment, start, end in ranges:
+                    # msync needs a page-aligned start
+                    aligned = start - start % mmap.PAGESIZE
+                    segment.mm.flush(aligned, end - aligned)
+            except Exception as e:
+                print(f"Error syncing journal: {str(e)}")
+                with self._cond:
+                    for segment, start, end in ranges:
+                        segment.dirty_from = start if segment.dirty_from is None else min(start, segment.dirty_from)
+                continue
+
+            with self._cond:
+                if target > self.durable_seq:
+                    self.syncs += 1
+                    self.synced_records += target - self.durable_seq
+                    self.durable_seq = target
+                self._cond.notify_all()
+
+            self._compact()
+            if stopped:
+                return
+
+    def _compact(self) -> None:
+        with self._cond:
+            acked_upto = self.acked_upto
+            done = [segment for segment in self.segments[:-1] if segment.last_seq <= acked_upto]
+
+        if acked_upto != self._saved_checkpoint:
+            try:
+                self._write_checkpoint(acked_upto)
+                self._saved_checkpoint = acked_upto
+            except Exception as e:
+                print(f"Error writing journal checkpoint: {str(e)}")
+                return
+
+        # Only once the checkpoint covers them, so a restart never replays
+        # from before a deleted segment
+        with self._cond:
+            self.segments = [segment for segment in self.segments if segment not in done]
+        for segment in done:
+            segment.close()
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+        for segment in self.segments:
+            segment.close()
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            return {
+                'next_seq': self.next_seq,
+                'durable_seq': self.durable_seq,
+                'acked_upto': self.acked_upto,
+                'unacked': self.next_seq - 1 - self.acked_upto,
+                'segments': len(self.segments),
+                'syncs': self.syncs,
+                'avg_group_commit': round(self.synced_records / self.syncs, 2) if self.syncs else 0.0,
+                'dead_letters': self.dead_letters,
+            }
+
+
+class JournalEntry:
+    """
+    Travels with an event through the coalescer, lanes and handlers in place
+    of its trace, acknowledging the journal record once the handler is done
+    and passing stage stamps on to the real trace, if any.
+
+    `redelivered` is set for live deliveries: Stripe gets a 503 for those
+    when a lane rejects them and sends them again, so the record is simply
+    acknowledged.
+    """
+
+    __slots__ = ('journal', 'seq', 'payload', 'trace', 'redelivered')
+
+    def __init__(self, journal: Journal, seq: int, payload: bytes, trace=None, redelivered: bool = False):
+        self.journal = journal
+        self.seq = seq
+        self.payload = payload
+        self.trace = trace
+        self.redelivered = redelivered
+
+    def mark(self, stage: str) -> None:
+        if self.trace is not None:
+            self.trace.mark(stage)
+
+    def end(self, status: str = 'ok') -> None:
+        if status in ('ok', 'coalesced') or (status == 'rejected' and self.redelivered):
+            self.journal.ack(self.seq)
+        else:
+            # Nothing else will retry it; keep it for inspection instead
+            self.journal.dead_letter(self.seq, self.payload, status)
+        if self.trace is not None:
+            self.trace.end(status)
@@ -0,0 +1,90 @@
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+def adapt_single(handler: Callable[[Dict], None]) -> Callable[[List[Dict]], None]:
+    """
+    Turn a one-object handler such as handle_invoice_paid(invoice) into a
+    batch handler that calls it once per object, in order.
+    """
+
+    def handle_batch(data_objects: List[Dict]) -> None:
+        for data_object in data_objects:
+            handler(data_object)
+
+    handle_batch.__name__ = f"{getattr(handler, '__name__', 'handler')}_batch"
+    return handle_batch
+
+
+def dedupe_latest(data_objects: List[Dict], created: Optional[Sequence[Optional[int]]] = None) -> List[Dict]:
+    """
+    Keep one object per id. One upsert statement cannot touch the same row
+    twice.
+
+    `created` holds the `created` time of each object's event, in the same
+    order. Stripe does not deliver in order, so the object from the newest
+    event wins, and the later delivery breaks ties; without `created` the
+    last one delivered wins.
+    """
+    if created is None:
+        created = [None] * len(data_objects)
+    by_id = {}
+    for data_object, event_created in zip(data_objects, created):
+        object_id = data_object.get('id')
+        kept = by_id.get(object_id)
+        if kept is None or (event_created or 0) >= (kept[1] or 0):
+            by_id[object_id] = (data_object, event_created)
+    return [data_object for data_object, _ in by_id.values()]
+
+
+class AdaptiveBatchSizer:
+    """
+    Pick how many queued events of one type a worker takes at once.
+
+    The batch grows with the backlog, so a quiet queue is handled one event
+    at a time, and is capped so a batch is expected to finish within
+    `latency_target` given the per-event cost measured for that type.
+    """
+
+    def __init__(self, latency_target: float = 0.2, min_size: int = 1, max_size: int = 500,
+                 smoothing: float = 0.2):
+        if min_size < 1 or max_size < min_size:
+            raise ValueError("Batch sizes need 1 <= min_size <= max_size")
+        self.latency_target = latency_target
+        self.min_size = min_size
+        self.max_size = max_size
+        self.smoothing = smoothing
+        # Moving average of handler seconds per event, by event type
+        self.cost_per_event: Dict[str, float] = {}
+        self.batches = 0
+        self.events = 0
+        self._lock = threading.Lock()
+
+    def size(self, event_type: str, queue_depth: int) -> int:
+        limit = self.max_size
+        cost = self.cost_per_event.get(event_type)
+        if cost:
+            limit = min(limit, int(self.latency_target / cost))
+        return max(self.min_size, min(queue_depth, limit))
+
+    def observe(self, event_type: str, size: int, seconds: float) -> None:
+        if size < 1:
+            return
+        cost = seconds / size
+        with self._lock:
+            self.batches += 1
+            self.events += size
+            previous = self.cost_per_event.get(event_type)
+            self.cost_per_event[event_type] = (
+                cost if previous is None else previous + self.smoothing * (cost - previous)
+            )
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'avg_batch_size': round(self.events / self.batches, 2) if self.batches else 0.0,
+                'cost_ms_per_event': {
+                    event_type: round(cost * 1000, 3) for event_type, cost in self.cost_per_event.items()
+                },
+            }
@@ -0,0 +1,385 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlparse
+
+from signature import sign_payload
+
+
+def parse_form(body: str) -> Dict:
+    """
+    Decode Stripe's form encoding, e.g. items[0][price]=price_1, into nested
+    dicts and lists.
+    """
+    result: Dict = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = re.findall(r'[^\[\]]+', key)
+        target = result
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return _indexed_to_lists(result)
+
+
+def _indexed_to_lists(value):
+    if not isinstance(value, dict):
+        return value
+    if value and all(key.isdigit() for key in value):
+        return [_indexed_to_lists(value[key]) for key in sorted(value, key=int)]
+    return {key: _indexed_to_lists(item) for key, item in value.items()}
+
+
+class FaultProfile:
+    """
+    Latency and error injection applied to every API request.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_limit_rate: float = 0.0,
+                 server_error_rate: float = 0.0, slow_rate: float = 0.0, slow_ms: float = 2000.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+
+    def delay_seconds(self, rng: random.Random) -> float:
+        delay = self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if self.slow_rate and rng.random() < self.slow_rate:
+            delay += self.slow_ms
+        return max(delay, 0.0) / 1000.0
+
+    def pick_error(self, rng: random.Random) -> Optional[int]:
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.server_error_rate:
+            return rng.choice((500, 502, 503))
+        return None
+
+
+PROFILES = {
+    'none': FaultProfile(),
+    'realistic': FaultProfile(latency_ms=120, jitter_ms=60, rate_limit_rate=0.005,
+                              server_error_rate=0.001, slow_rate=0.01, slow_ms=1500),
+    'degraded': FaultProfile(latency_ms=400, jitter_ms=200, rate_limit_rate=0.05,
+                             server_error_rate=0.02, slow_rate=0.05, slow_ms=5000),
+    'rate_limited': FaultProfile(latency_ms=50, rate_limit_rate=0.3),
+}
+
+
+class MockStripe:
+    """
+    In-memory store of customers, subscriptions, invoices and payment intents
+    that emits signed webhook events for every change.
+    """
+
+    def __init__(self, webhook_url: Optional[str] = None, webhook_secret: str = 'whsec_test',
+                 profile: Optional[FaultProfile] = None, seed: Optional[int] = None,
+                 delivery_workers: int = 8):
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.profile = profile or PROFILES['none']
+        self.rng = random.Random(seed)
+        self.objects: Dict[str, Dict[str, Dict]] = {
+            'customers': {},
+            'subscriptions': {},
+            'invoices': {},
+            'payment_intents': {},
+        }
+        # Responses by Idempotency-Key, replayed for repeated requests like Stripe does
+        self.idempotent_responses: Dict[str, Dict] = {}
+        self.idempotency_lock = threading.Lock()
+        self.events_sent = 0
+        self.delivery_failures = 0
+        self._lock = threading.Lock()
+        self._delivery = ThreadPoolExecutor(max_workers=delivery_workers, thread_name_prefix='mock-webhook')
+
+    def new_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}_{self.rng.getrandbits(64):016x}"
+
+    # Resources
+
+    def create_customer(self, params: Dict) -> Dict:
+        customer = {
+            'id': self.new_id('cus'),
+            'object': 'customer',
+            'created': int(time.time()),
+            'email': params.get('email'),
+            'name': params.get('name'),
+            'description': params.get('description'),
+            'metadata': params.get('metadata', {}),
+        }
+        self.objects['customers'][customer['id']] = customer
+        self.emit('customer.created', customer)
+        return customer
+
+    def create_payment_intent(self, params: Dict) -> Dict:
+        amount = int(params.get('amount', 0))
+        payment_intent = {
+            'id': self.new_id('pi'),
+            'object': 'payment_intent',
+            'created': int(time.time()),
+            'amount': amount,
+            'amount_received': amount,
+            'currency': params.get('currency', 'usd'),
+            'customer': params.get('customer'),
+            'description': params.get('description'),
+            'status': 'succeeded',
+            'metadata': params.get('metadata', {}),
+        }
+        self.objects['payment_intents'][payment_intent['id']] = payment_intent
+        # The mock confirms immediately
+        self.emit('payment_intent.succeeded', payment_intent)
+        return payment_intent
+
+    def create_subscription(self, params: Dict) -> Dict:
+        items = params.get('items') or []
+        now = int(time.time())
+        subscription = {
+            'id': self.new_id('sub'),
+            'object': 'subscription',
+            'created': now,
+            'customer': params.get('customer'),
+            'status': 'trialing' if params.get('trial_period_days') else 'active',
+            'current_period_start': now,
+            'current_period_end': now + 30 * 86400,
+            'items': {
+                'object': 'list',
+                'data': [{'id': self.new_id('si'), 'price': {'id': item.get('price')}} for item in items],
+            },
+            'metadata': params.get('metadata', {}),
+        }
+        self.objects['subscriptions'][subscription['id']] = subscription
+        self.emit('customer.subscription.created', subscription)
+
+        invoice = self.create_invoice({'customer': subscription['customer']}, subscription=subscription)
+        self.pay_invoice(invoice)
+        return subscription
+
+    def create_invoice(self, params: Dict, subscription: Optional[Dict] = None) -> Dict:
+        customer = self.objects['customers'].get(params.get('customer'), {})
+        lines = []
+        if subscription is not None:
+            lines = [{'price': item['price'], 'amount': 0} for item in subscription['items']['data']]
+        invoice = {
+            'id': self.new_id('in'),
+            'object': 'invoice',
+            'created': int(time.time()),
+            'customer': params.get('customer'),
+            'customer_email': customer.get('email'),
+            'description': params.get('description'),
+            'subscription': subscription['id'] if subscription else None,
+            'status': 'open',
+            'amount_paid': 0,
+            'currency': 'usd',
+            'lines': {'object': 'list', 'data': lines},
+        }
+        self.objects['invoices'][invoice['id']] = invoice
+        self.emit('invoice.updated', invoice)
+        return invoice
+
+    def pay_invoice(self, invoice: Dict) -> Dict:
+        invoice['status'] = 'paid'
+        invoice['amount_paid'] = sum(line.get('amount', 0) for line in invoice['lines']['data'])
+        self.emit('invoice.paid', invoice)
+        self.emit('invoice.payment_succeeded', invoice)
+        return invoice
+
+    def delete(self, collection: str, object_id: str) -> Optional[Dict]:
+        obj = self.objects[collection].pop(object_id, None)
+        if obj is None:
+            return None
+        if collection == 'subscriptions':
+            obj['status'] = 'canceled'
+            self.emit('customer.subscription.deleted', obj)
+            return obj
+        return {'id': object_id, 'object': obj['object'], 'deleted': True}
+
+    # Webhooks
+
+    def emit(self, event_type: str, data_object: Dict) -> None:
+        """
+        Build an event for the object and deliver it in the background.
+        """
+        event = {
+            'id': self.new_id('evt'),
+            'object': 'event',
+            'type': event_type,
+            'created': int(time.time()),
+            'livemode': False,
+            'data': {'object': json.loads(json.dumps(data_object))},
+        }
+        if self.webhook_url:
+            self._delivery.submit(self.deliver, event)
+
+    def deliver(self, event: Dict) -> Optional[int]:
+        payload = json.dumps(event)
+        request = urllib.request.Request(
+            self.webhook_url,
+            data=payload.encode('utf-8'),
+            method='POST',
+            headers={
+                'Content-Type': 'application/json',
+                'Stripe-Signature': sign_payload(payload, self.webhook_secret),
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                self.events_sent += 1
+                return response.status
+        except Exception as e:
+            self.delivery_failures += 1
+            print(f"Error delivering {event['type']} to {self.webhook_url}: {str(e)}")
+            return None
+
+    def shutdown(self) -> None:
+        self._delivery.shutdown(wait=True)
+
+
+class MockStripeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the subset of the Stripe REST API used by StripeClient.
+    """
+
+    server_version = 'MockStripe/1.0'
+    mock: MockStripe = None
+
+    CREATE = {
+        'customers': 'create_customer',
+        'payment_intents': 'create_payment_intent',
+        'subscriptions': 'create_subscription',
+        'invoices': 'create_invoice',
+    }
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _route(self):
+        match = re.match(r'^/v1/(\w+)(?:/([\w]+))?/?$', urlparse(self.path).path)
+        if match is None or match.group(1) not in self.mock.objects:
+            return None, None
+        return match.group(1), match.group(2)
+
+    def _send(self, status: int, body: Dict, headers: Optional[Dict] = None) -> None:
+        encoded = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.send_header('Request-Id', f"req_{self.mock.rng.getrandbits(48):012x}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _error(self, status: int, error_type: str, message: str, headers: Optional[Dict] = None) -> None:
+        self._send(status, {'error': {'type': error_type, 'message': message}}, headers)
+
+    def _apply_profile(self) -> bool:
+        """
+        Sleep for the injected latency and answer with an injected error if one
+        was rolled. Returns True when the request was already answered.
+        """
+        profile = self.mock.profile
+        time.sleep(profile.delay_seconds(self.mock.rng))
+        status = profile.pick_error(self.mock.rng)
+        if status == 429:
+            self._error(429, 'rate_limit_error', 'Too many requests', {'Retry-After': '1'})
+            return True
+        if status is not None:
+            self._error(status, 'api_error', 'Injected server error')
+            return True
+        return False
+
+    def do_POST(self):
+        if self._apply_profile():
+            return
+        collection, object_id = self._route()
+        if collection is None or object_id is not None:
+            return self._error(404, 'invalid_request_error', f"Unrecognized request URL ({self.path})")
+
+        length = int(self.headers.get('Content-Length') or 0)
+        params = parse_form(self.rfile.read(length).decode('utf-8'))
+        create = getattr(self.mock, self.CREATE[collection])
+        idempotency_key = self.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return self._send(200, create(params))
+
+        # Concurrent retries with one key must create the object only once
+        with self.mock.idempotency_lock:
+            replayed = idempotency_key in self.mock.idempotent_responses
+            if not replayed:
+                self.mock.idempotent_responses[idempotency_key] = create(params)
+            body = self.mock.idempotent_responses[idempotency_key]
+        self._send(200, body, {'Idempotent-Replayed': 'true'} if replayed else None)
+
+    def do_GET(self):
+        if self._apply_profile():
+            return
+        collection, object_id = self._route()
+        if collection is None:
+            return self._error(404, 'invalid_request_error', f"Unrecognized request URL ({self.path})")
+
+        if object_id is None:
+            data = list(self.mock.objects[collection].values())
+            return self._send(200, {'object': 'list', 'data': data, 'has_more': False})
+
+        obj = self.mock.objects[collection].get(object_id)
+        if obj is None:
+            return self._error(404, 'invalid_request_error', f"No such object: '{object_id}'")
+        self._send(200, obj)
+
+    def do_DELETE(self):
+        if self._apply_profile():
+            return
+        collection, object_id = self._route()
+        if collection is None or object_id is None:
+            return self._error(404, 'invalid_request_error', f"Unrecognized request URL ({self.path})")
+
+        obj = self.mock.delete(collection, object_id)
+        if obj is None:
+            return self._error(404, 'invalid_request_error', f"No such object: '{object_id}'")
+        self._send(200, obj)
+
+
+def start_mock_server(mock: MockStripe, host: str = '127.0.0.1', port: int = 12111) -> ThreadingHTTPServer:
+    """
+    Start the mock API in a background thread. Point the SDK at it with
+    StripeClient(api_key, api_base=f"http://{host}:{port}").
+    """
+    handler = type('BoundMockStripeRequestHandler', (MockStripeRequestHandler,), {'mock': mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='mock-stripe', daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Stripe API for offline testing.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--webhook-url', default=None, help="Endpoint that receives signed events")
+    parser.add_argument('--webhook-secret', default='whsec_test')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='none')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    mock = MockStripe(args.webhook_url, args.webhook_secret, PROFILES[args.profile], seed=args.seed)
+    server = start_mock_server(mock, args.host, args.port)
+    print(f"Mock Stripe API listening on http://{args.host}:{args.port} (profile: {args.profile})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        mock.shutdown()
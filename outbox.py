@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+# Django model backing the outbox table, as "app_label.ModelName". It needs:
+#   topic = CharField(max_length=100)
+#   payload = JSONField()
+#   created_at = DateTimeField(auto_now_add=True)
+#   published_at = DateTimeField(null=True, db_index=True)
+#   claimed_until = DateTimeField(null=True)
+#   attempts = PositiveIntegerField(default=0)
+# The handlers only write outbox rows when it is set.
+OUTBOX_MODEL = os.environ.get('STRIPE_WEBHOOK_OUTBOX_MODEL')
+
+
+def outbox_enabled() -> bool:
+    return bool(OUTBOX_MODEL)
+
+
+def get_outbox_model():
+    if not OUTBOX_MODEL:
+        raise LookupError("STRIPE_WEBHOOK_OUTBOX_MODEL is not set")
+    return apps.get_model(OUTBOX_MODEL)
+
+
+def enqueue_outbox_message(topic: str, payload: Dict):
+    """
+    Write a notification for downstream services. Call it inside the same
+    transaction.atomic() block as the handler's update_or_create so the row
+    only exists if the handler's write committed.
+    """
+    return get_outbox_model().objects.create(topic=topic, payload=payload)
+
+
+def enqueue_outbox_messages(topic: str, payloads: List[Dict]):
+    """
+    Batch form of enqueue_outbox_message: one INSERT for all the payloads.
+    """
+    model = get_outbox_model()
+    return model.objects.bulk_create([model(topic=topic, payload=payload) for payload in payloads])
+
+
+class OutboxSink(ABC):
+    """
+    Destination for published outbox messages. `publish` gets a whole batch
+    and must raise if any of it was not delivered.
+    """
+
+    @abstractmethod
+    def publish(self, messages: List[Dict]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FileSink(OutboxSink):
+    """
+    Append messages as JSON lines to a local file.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def publish(self, messages: List[Dict]) -> None:
+        self._file.write(''.join(json.dumps(message, default=str) + '\n' for message in messages))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class UnixSocketSink(OutboxSink):
+    """
+    Stream messages as JSON lines over a Unix domain socket, reconnecting
+    after a failure.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        return sock
+
+    def publish(self, messages: List[Dict]) -> None:
+        data = ''.join(json.dumps(message, default=str) + '\n' for message in messages).encode('utf-8')
+        if self._sock is None:
+            self._sock = self._connect()
+        try:
+            self._sock.sendall(data)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class HttpSink(OutboxSink):
+    """
+    POST each batch as a JSON array to an HTTP endpoint.
+    """
+
+    def __init__(self, url: str, timeout: float = 10.0, headers: Optional[Dict] = None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json'}
+        self.headers.update(headers or {})
+
+    def publish(self, messages: List[Dict]) -> None:
+        body = json.dumps(messages, default=str).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, method='POST', headers=self.headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"Outbox sink {self.url} answered {response.status}")
+
+
+def sink_from_uri(uri: str) -> OutboxSink:
+    """
+    Build a sink from file:/path, unix:/path or an http(s):// URL.
+    """
+    if uri.startswith('file:'):
+        return FileSink(uri[len('file:'):])
+    if uri.startswith('unix:'):
+        return UnixSocketSink(uri[len('unix:'):])
+    if uri.startswith(('http://', 'https://')):
+        return HttpSink(uri)
+    raise ValueError(f"Unsupported outbox sink: {uri}")
+
+
+class OutboxRelay:
+    """
+    Publish committed outbox rows to every sink in batches.
+
+    Rows are marked published only after every sink accepted the batch, so a
+    crash or sink error means redelivery, never loss (at-least-once).
+    Consumers should de-duplicate on the message id.
+
+    A batch is claimed for `claim_timeout` seconds in a short transaction and
+    published after it commits, so no row lock is held during sink I/O. Rows
+    of a relay that died mid-publish are picked up again once the claim
+    expires.
+    """
+
+    def __init__(self, sinks: List[OutboxSink], batch_size: int = 500, poll_interval: float = 0.5,
+                 max_backoff: float = 30.0, claim_timeout: float = 60.0):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.published = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_lag_seconds = 0.0
+        self._started = time.monotonic()
+        self._stopped = threading.Event()
+
+    def relay_once(self) -> int:
+        """
+        Publish one batch. Returns the number of messages published.
+        """
+        model = get_outbox_model()
+        now = timezone.now()
+        with transaction.atomic():
+            # skip_locked lets several relays share the table without
+            # claiming the same rows at the same time
+            rows = list(
+                model.objects.select_for_update(skip_locked=True)
+                .filter(published_at__isnull=True)
+                .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+                .order_by('id')[:self.batch_size]
+            )
+            if not rows:
+                return 0
+
+            ids = [row.pk for row in rows]
+            model.objects.filter(pk__in=ids).update(claimed_until=now + timedelta(seconds=self.claim_timeout))
+
+        messages = [
+            {'id': row.pk, 'topic': row.topic, 'payload': row.payload, 'created_at': row.created_at}
+            for row in rows
+        ]
+        try:
+            for sink in self.sinks:
+                sink.publish(messages)
+        except Exception:
+            # Release the claim so the next attempt does not wait for it
+            model.objects.filter(pk__in=ids).update(attempts=F('attempts') + 1, claimed_until=None)
+            raise
+
+        published_at = timezone.now()
+        model.objects.filter(pk__in=ids).update(published_at=published_at, claimed_until=None)
+
+        self.published += len(rows)
+        self.batches += 1
+        self.last_lag_seconds = (published_at - rows[0].created_at).total_seconds()
+        return len(rows)
+
+    def run(self) -> None:
+        """
+        Relay until stop() is called, backing off while sinks are failing.
+        """
+        backoff = self.poll_interval
+        while not self._stopped.is_set():
+            try:
+                count = self.relay_once()
+                backoff = self.poll_interval
+            except Exception as e:
+                self.failures += 1
+                print(f"Error relaying outbox batch: {str(e)}")
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            # A full batch means there is a backlog; keep draining
+            if count < self.batch_size:
+                self._stopped.wait(self.poll_interval)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        for sink in self.sinks:
+            sink.close()
+
+    def metrics(self) -> Dict:
+        elapsed = time.monotonic() - self._started
+        return {
+            'published': self.published,
+            'batches': self.batches,
+            'failures': self.failures,
+            'messages_per_second': round(self.published / elapsed, 1) if elapsed else 0.0,
+            'avg_batch_size': round(self.published / self.batches, 1) if self.batches else 0.0,
+            'last_lag_seconds': round(self.last_lag_seconds, 3),
+        }
+
+
+if __name__ == "__main__":
+    import django
+
+    parser = argparse.ArgumentParser(description="Relay outbox rows to downstream sinks.")
+    parser.add_argument('--sink', action='append', required=True,
+                        help="file:/path, unix:/path or http(s)://url; repeat for several sinks")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--metrics-interval', type=float, default=60.0)
+    args = parser.parse_args()
+    if not outbox_enabled():
+        parser.error("set STRIPE_WEBHOOK_OUTBOX_MODEL to the outbox model label")
+
+    # Needs DJANGO_SETTINGS_MODULE pointing at the project that owns the outbox table
+    django.setup()
+
+    relay = OutboxRelay([sink_from_uri(uri) for uri in args.sink], args.batch_size, args.poll_interval)
+
+    def report():
+        while not relay._stopped.wait(args.metrics_interval):
+            print(json.dumps(relay.metrics()))
+
+    threading.Thread(target=report, daemon=True).start()
+    try:
+        relay.run()
+    except KeyboardInterrupt:
+        relay.stop()
+        print(json.dumps(relay.metrics()))
@@ -0,0 +1,185 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterable, List
+
+
+class HandlerPlugin(ABC):
+    """
+    Base class for webhook business rules.
+
+    Subclasses declare the event types they handle, how long one call may
+    take, how many calls may run at once and where they run:
+    'thread' (a pool of `concurrency` threads) or 'process' (a pool of
+    `concurrency` processes, for CPU-heavy or untrusted code).
+    """
+
+    name = None
+    event_types: Iterable[str] = ()
+    timeout: float = 10.0
+    concurrency: int = 4
+    executor: str = 'thread'
+
+    @abstractmethod
+    def handle(self, event_type: str, data_object: Dict, deadline: float) -> None:
+        """
+        Process one event. `deadline` is a time.time() timestamp; long calls
+        such as stripe.Product.retrieve should pass what is left of it as
+        their own timeout, since a thread cannot be killed from outside.
+        """
+
+
+class FunctionPlugin(HandlerPlugin):
+    """
+    Wrap a plain `func(data_object)` handler, e.g. one of the WebhookHandler
+    static handlers, as a plugin.
+    """
+
+    def __init__(self, name: str, event_types: Iterable[str], func: Callable[[Dict], None],
+                 timeout: float = 10.0, concurrency: int = 4, executor: str = 'thread'):
+        self.name = name
+        self.event_types = tuple(event_types)
+        self.func = func
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.executor = executor
+
+    def handle(self, event_type: str, data_object: Dict, deadline: float) -> None:
+        self.func(data_object)
+
+
+def _run_plugin(plugin: HandlerPlugin, event_type: str, data_object: Dict, deadline: float) -> None:
+    # Module level so process pools can pickle it
+    plugin.handle(event_type, data_object, deadline)
+
+
+class PluginSlot:
+    """
+    Runtime state for one plugin: its own executor, concurrency semaphore and
+    counters, so nothing it does can use another plugin's capacity.
+    """
+
+    def __init__(self, plugin: HandlerPlugin):
+        if plugin.executor not in ('thread', 'process'):
+            raise ValueError(f"Plugin {plugin.name} has unknown executor {plugin.executor!r}")
+        self.plugin = plugin
+        self.name = plugin.name or type(plugin).__name__
+        self.semaphore = threading.BoundedSemaphore(plugin.concurrency)
+        self.lock = threading.Lock()
+        self.pool = self._new_pool()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def _new_pool(self):
+        if self.plugin.executor == 'process':
+            return ProcessPoolExecutor(max_workers=self.plugin.concurrency)
+        return ThreadPoolExecutor(max_workers=self.plugin.concurrency, thread_name_prefix=f"plugin-{self.name}")
+
+    def reset_process_pool(self) -> None:
+        """
+        Kill an overrunning process plugin. ProcessPoolExecutor cannot stop a
+        single task, so the plugin's whole pool is terminated and replaced;
+        other plugins are untouched.
+        """
+        with self.lock:
+            pool = self.pool
+            self.pool = self._new_pool()
+        for process in list(getattr(pool, '_processes', {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def finished(self, seconds: float) -> None:
+        with self.lock:
+            self.calls += 1
+            self.total_seconds += seconds
+        self.semaphore.release()
+
+    def metrics(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'avg_ms': round(self.total_seconds / self.calls * 1000, 3) if self.calls else 0.0,
+        }
+
+
+class PluginRuntime:
+    """
+    Run every plugin registered for an event type and enforce each plugin's
+    timeout and concurrency limit independently.
+    """
+
+    def __init__(self, plugins: Iterable[HandlerPlugin]):
+        self.slots: List[PluginSlot] = [PluginSlot(plugin) for plugin in plugins]
+        self.by_type: Dict[str, List[PluginSlot]] = {}
+        for slot in self.slots:
+            for event_type in slot.plugin.event_types:
+                self.by_type.setdefault(event_type, []).append(slot)
+
+    def handles(self, event_type: str) -> bool:
+        return event_type in self.by_type
+
+    def dispatch(self, event_type: str, data_object: Dict) -> None:
+        """
+        Start all plugins for the event, then wait for each up to its own
+        deadline. A slow or saturated plugin only delays this call until its
+        own timeout and never holds back the start of the others.
+        """
+        running = []
+        waiting = []
+        for slot in self.by_type.get(event_type, ()):
+            started = time.monotonic()
+            if slot.semaphore.acquire(blocking=False):
+                self._start(slot, event_type, data_object, started, running)
+            else:
+                waiting.append((slot, started))
+
+        # Plugins at their concurrency limit wait for a free slot only after
+        # every other plugin is already running; the wait counts against
+        # their timeout
+        for slot, started in waiting:
+            remaining = slot.plugin.timeout - (time.monotonic() - started)
+            if remaining > 0 and slot.semaphore.acquire(timeout=remaining):
+                self._start(slot, event_type, data_object, started, running)
+            else:
+                slot.rejected += 1
+                print(f"Plugin {slot.name} is at its concurrency limit, skipping {event_type}")
+
+        for slot, future, started in running:
+            remaining = slot.plugin.timeout - (time.monotonic() - started)
+            try:
+                future.result(timeout=max(remaining, 0))
+            except FutureTimeout:
+                slot.timeouts += 1
+                print(f"Plugin {slot.name} timed out after {slot.plugin.timeout}s on {event_type}")
+                if not future.cancel() and slot.plugin.executor == 'process':
+                    slot.reset_process_pool()
+            except Exception as e:
+                slot.errors += 1
+                print(f"Error in plugin {slot.name} for {event_type}: {str(e)}")
+
+    def _start(self, slot: PluginSlot, event_type: str, data_object: Dict, started: float, running: List) -> None:
+        deadline = time.time() + slot.plugin.timeout - (time.monotonic() - started)
+        try:
+            future = slot.pool.submit(_run_plugin, slot.plugin, event_type, data_object, deadline)
+        except Exception as e:
+            slot.semaphore.release()
+            slot.errors += 1
+            print(f"Error starting plugin {slot.name}: {str(e)}")
+            return
+        # The slot is only freed when the call really ends, so a plugin that
+        # ignores its deadline is capped at its own concurrency
+        future.add_done_callback(lambda _, slot=slot, started=started: slot.finished(time.monotonic() - started))
+        running.append((slot, future, started))
+
+    def shutdown(self) -> None:
+        for slot in self.slots:
+            slot.pool.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> Dict[str, Dict]:
+        return {slot.name: slot.metrics() for slot in self.slots}
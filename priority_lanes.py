@@ -0,0 +1,239 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+from tracing import current_trace
+
+
+class Lane:
+    """
+    One priority class: the event types it carries, its share of workers when
+    several lanes are busy (weight) and a hard cap on handlers running at once.
+    """
+
+    def __init__(self, name: str, event_types: Iterable[str], weight: int = 1, concurrency: int = 1,
+                 max_queue: Optional[int] = None):
+        if weight < 1 or concurrency < 1:
+            raise ValueError("Lane weight and concurrency must be at least 1")
+        self.name = name
+        self.event_types = frozenset(event_types)
+        self.weight = weight
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+
+        self.queue = deque()
+        self.in_flight = 0
+        self.current_weight = 0
+        self.processed = 0
+        self.rejected = 0
+        self.wait_samples = deque(maxlen=2048)
+        self.max_wait = 0.0
+
+    def has_capacity(self) -> bool:
+        return bool(self.queue) and self.in_flight < self.concurrency
+
+    def metrics(self) -> Dict:
+        samples = sorted(self.wait_samples)
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+
+        return {
+            'queued': len(self.queue),
+            'in_flight': self.in_flight,
+            'processed': self.processed,
+            'rejected': self.rejected,
+            'wait_ms_p50': percentile(0.50),
+            'wait_ms_p95': percentile(0.95),
+            'wait_ms_p99': percentile(0.99),
+            'wait_ms_max': round(self.max_wait * 1000, 3),
+        }
+
+
+# Payment confirmations unlock customer orders; invoice churn can wait.
+DEFAULT_LANES = (
+    Lane('payments', ['payment_intent.succeeded'], weight=8, concurrency=8),
+    Lane('lifecycle', ['customer.created', 'customer.subscription.created', 'customer.subscription.deleted'],
+         weight=3, concurrency=4),
+    Lane('invoices', ['invoice.paid', 'invoice.payment_succeeded', 'invoice.updated'], weight=1, concurrency=2),
+)
+
+
+class LaneScheduler:
+    """
+    Per-lane queues drained by a shared worker pool.
+
+    Workers pick the next lane with smooth weighted round robin over the lanes
+    that have work and free concurrency, so a flood in one lane only takes its
+    weighted share of the workers and can never exceed its own limit.
+
+    With `dispatch_batch` and a `batch_sizer` (see micro_batching.py) a worker
+    takes several queued events of the same type at once and hands them over
+    as dispatch_batch(event_type, data_objects, traces, created), where
+    `created` holds each event's Stripe creation time.
+    """
+
+    def __init__(self, dispatch: Callable[[str, Dict], None], lanes: Iterable[Lane] = DEFAULT_LANES,
+                 default_lane: Optional[str] = None, workers: Optional[int] = None,
+                 on_complete: Optional[Callable[[str, float], None]] = None,
+                 dispatch_batch: Optional[Callable[[str, List[Dict], List, List], None]] = None,
+                 batch_sizer=None):
+        self.dispatch = dispatch
+        self.dispatch_batch = dispatch_batch
+        self.batch_sizer = batch_sizer
+        # Called with (event_type, handler seconds) after every dispatch
+        self.on_complete = on_complete
+        self.lanes: List[Lane] = [
+            Lane(lane.name, lane.event_types, lane.weight, lane.concurrency, lane.max_queue) for lane in lanes
+        ]
+        self.lanes_by_name = {lane.name: lane for lane in self.lanes}
+        self.lanes_by_type = {}
+        for lane in self.lanes:
+            for event_type in lane.event_types:
+                self.lanes_by_type[event_type] = lane
+        self.default_lane = self.lanes_by_name[default_lane] if default_lane else self.lanes[-1]
+
+        self._cond = threading.Condition()
+        self._stopped = False
+        # Fewer workers than the lanes' combined concurrency, so busy lanes
+        # compete and the weights decide who runs next
+        worker_count = workers or max(lane.concurrency for lane in self.lanes)
+        self._workers = [
+            threading.Thread(target=self._work, name=f"lane-worker-{index}", daemon=True)
+            for index in range(worker_count)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def lane_for(self, event_type: str) -> Lane:
+        return self.lanes_by_type.get(event_type, self.default_lane)
+
+    def submit(self, event_type: str, data_object: Dict, trace=None, created: Optional[int] = None) -> bool:
+        """
+        Queue an event on its lane. Returns False if the lane is full. A
+        trace travels with the event and is current while it is dispatched;
+        `created`, the event's Stripe creation time, is handed to batches.
+        """
+        lane = self.lane_for(event_type)
+        with self._cond:
+            if lane.max_queue is not None and len(lane.queue) >= lane.max_queue:
+                lane.rejected += 1
+                return False
+            lane.queue.append((event_type, data_object, time.monotonic(), trace, created))
+            self._cond.notify()
+        return True
+
+    def _pick_lane(self) -> Optional[Lane]:
+        # Smooth weighted round robin (as in nginx) over eligible lanes
+        eligible = [lane for lane in self.lanes if lane.has_capacity()]
+        if not eligible:
+            return None
+        total = 0
+        best = None
+        for lane in eligible:
+            lane.current_weight += lane.weight
+            total += lane.weight
+            if best is None or lane.current_weight > best.current_weight:
+                best = lane
+        best.current_weight -= total
+        return best
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                lane = self._pick_lane()
+                while lane is None:
+                    if self._stopped:
+                        return
+                    self._cond.wait()
+                    lane = self._pick_lane()
+
+                batch = self._take(lane)
+                lane.in_flight += 1
+                now = time.monotonic()
+                for item in batch:
+                    waited = now - item[2]
+                    lane.wait_samples.append(waited)
+                    if waited > lane.max_wait:
+                        lane.max_wait = waited
+
+            event_type = batch[0][0]
+            for item in batch:
+                if item[3] is not None:
+                    item[3].mark('dequeue')
+            started = time.monotonic()
+            try:
+                if self.batch_sizer is not None and self.dispatch_batch is not None:
+                    self.dispatch_batch(event_type, [item[1] for item in batch], [item[3] for item in batch],
+                                        [item[4] for item in batch])
+                else:
+                    token = current_trace.set(batch[0][3])
+                    try:
+                        self.dispatch(event_type, batch[0][1])
+                    finally:
+                        current_trace.reset(token)
+            except Exception as e:
+                print(f"Error processing {event_type} in lane {lane.name}: {str(e)}")
+            finally:
+                elapsed = time.monotonic() - started
+                if self.batch_sizer is not None:
+                    self.batch_sizer.observe(event_type, len(batch), elapsed)
+                if self.on_complete is not None:
+                    self.on_complete(event_type, elapsed)
+                with self._cond:
+                    lane.in_flight -= 1
+                    lane.processed += len(batch)
+                    # A slot opened up in this lane; wake a worker to use it
+                    self._cond.notify()
+
+    def _take(self, lane: Lane) -> List:
+        """
+        Pop the next event and, when batching, more queued events of the same
+        type. Other events keep their place; the scan is bounded so a mixed
+        queue never costs more than a few batch lengths per pick.
+        """
+        first = lane.queue.popleft()
+        batch = [first]
+        if self.batch_sizer is None or self.dispatch_batch is None:
+            return batch
+
+        limit = self.batch_sizer.size(first[0], len(lane.queue) + 1)
+        skipped = []
+        scanned = 0
+        while lane.queue and len(batch) < limit and scanned < limit * 4:
+            item = lane.queue.popleft()
+            scanned += 1
+            if item[0] == first[0]:
+                batch.append(item)
+            else:
+                skipped.append(item)
+        lane.queue.extendleft(reversed(skipped))
+        return batch
+
+    def stop(self, drain: bool = True, timeout: Optional[float] = None) -> None:
+        """
+        Stop the workers, by default after every queued event was handled.
+        """
+        if drain:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            with self._cond:
+                while any(lane.queue or lane.in_flight for lane in self.lanes):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(0.05 if remaining is None else min(remaining, 0.05))
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def queue_depth(self) -> int:
+        return sum(len(lane.queue) for lane in self.lanes)
+
+    def metrics(self) -> Dict[str, Dict]:
+        with self._cond:
+            return {lane.name: lane.metrics() for lane in self.lanes}
@@ -0,0 +1,157 @@
+import re
+from dataclasses import MISSING, dataclass, field, fields
+from typing import Any, Dict, Optional, Tuple
+
+# Matches one step of a field path: a key, optionally followed by list indexes,
+# e.g. "lines", "data[0]" or "tiers[0][1]"
+_PATH_STEP = re.compile(r'^([A-Za-z_][A-Za-z0-9_]*)((?:\[\d+\])*)$')
+_PATH_INDEX = re.compile(r'\[(\d+)\]')
+
+
+@dataclass(slots=True)
+class CustomerRecord:
+    customer_id: Optional[str]
+    email: Optional[str]
+    name: Optional[str]
+    description: Optional[str]
+
+
+@dataclass(slots=True)
+class InvoiceRecord:
+    invoice_id: Optional[str]
+    customer_id: Optional[str]
+    customer_email: Optional[str]
+    subscription_id: Optional[str]
+    price_id: Optional[str]
+    user: Any = None
+
+
+@dataclass(slots=True)
+class PaymentIntentRecord:
+    payment_id: Optional[str]
+    amount: Optional[int]
+    currency: Optional[str]
+    customer_id: Optional[str]
+    status: Optional[str]
+    metadata: Dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class SubscriptionRecord:
+    subscription_id: Optional[str]
+    customer_id: Optional[str]
+    status: Optional[str]
+    price_id: Optional[str]
+    user: Any = None
+
+
+def compile_path(path: str) -> Tuple:
+    """
+    Compile a dotted field path such as "lines.data[0].price.id" into the
+    tuple of dict keys and list indexes it walks.
+    """
+    steps = []
+    for part in path.split('.'):
+        match = _PATH_STEP.match(part)
+        if match is None:
+            raise ValueError(f"Invalid field path {path!r} at {part!r}")
+        steps.append(match.group(1))
+        steps.extend(int(index) for index in _PATH_INDEX.findall(match.group(2)))
+    return tuple(steps)
+
+
+def resolve_path(obj, steps: Tuple, default=None):
+    """
+    Walk a compiled path through a Stripe object, returning `default` as soon
+    as a key or index is missing.
+    """
+    for step in steps:
+        try:
+            obj = obj[step]
+        except (KeyError, IndexError, TypeError):
+            return default
+        if obj is None:
+            return default
+    return obj
+
+
+class RecordSchema:
+    """
+    Field-path mapping for one record class, compiled once at import time.
+
+    Every path must name a field of the record and every record field without
+    a default must have a path, so a mistyped or missing field fails when the
+    module is loaded instead of on the first matching event.
+    """
+
+    def __init__(self, record_cls, paths: Dict[str, str], computed: Tuple[str, ...] = ()):
+        self.record_cls = record_cls
+        record_fields = {f.name: f for f in fields(record_cls)}
+
+        unknown = set(paths) - set(record_fields)
+        if unknown:
+            raise TypeError(f"{record_cls.__name__} has no field(s): {', '.join(sorted(unknown))}")
+
+        missing = [
+            name for name, f in record_fields.items()
+            if name not in paths and name not in computed
+            and f.default is MISSING and f.default_factory is MISSING
+        ]
+        if missing:
+            raise TypeError(f"{record_cls.__name__} field(s) without a path: {', '.join(missing)}")
+
+        self._getters = []
+        for name, path in paths.items():
+            f = record_fields[name]
+            default = None if f.default is MISSING else f.default
+            factory = None if f.default_factory is MISSING else f.default_factory
+            steps = compile_path(path)
+            self._getters.append((name, steps[0] if len(steps) == 1 else None, steps, default, factory))
+
+    def extract(self, obj, **extra):
+        """
+        Build a record from a Stripe object. `extra` fills computed fields.
+        """
+        values = extra
+        for name, key, steps, default, factory in self._getters:
+            if key is not None:
+                # Single-key paths are the common case; skip the path walk
+                value = obj.get(key)
+            else:
+                value = resolve_path(obj, steps)
+            if value is None:
+                value = factory() if factory is not None else default
+            values[name] = value
+        return self.record_cls(**values)
+
+
+CUSTOMER_SCHEMA = RecordSchema(CustomerRecord, {
+    'customer_id': 'id',
+    'email': 'email',
+    'name': 'name',
+    'description': 'description',
+})
+
+INVOICE_SCHEMA = RecordSchema(InvoiceRecord, {
+    'invoice_id': 'id',
+    'customer_id': 'customer',
+    'customer_email': 'customer_email',
+    'subscription_id': 'subscription',
+    'price_id': 'lines.data[0].price.id',
+})
+
+PAYMENT_INTENT_SCHEMA = RecordSchema(PaymentIntentRecord, {
+    'payment_id': 'id',
+    'amount': 'amount_received',
+    'currency': 'currency',
+    'customer_id': 'customer',
+    'status': 'status',
+    'metadata': 'metadata',
+})
+
+SUBSCRIPTION_SCHEMA = RecordSchema(SubscriptionRecord, {
+    'subscription_id': 'id',
+    'customer_id': 'customer',
+    'status': 'status',
+    'price_id': 'items.data[0].price.id',
+})
@@ -0,0 +1,61 @@
+import json
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+
+
+class StaticResponse:
+    """
+    A webhook outcome encoded once at import time. Each entry point sends
+    the prebuilt form it needs, so nothing is encoded per request: `flask`
+    is a (body, status, headers) tuple for a Flask view, and
+    `asgi_start`/`asgi_body` are the two ASGI send() messages.
+    """
+
+    __slots__ = ('status', 'body', 'headers', 'flask', 'asgi_start', 'asgi_body')
+
+    def __init__(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+        self.status = int(status)
+        self.body = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.headers: Tuple[Tuple[str, str], ...] = (
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(self.body))),
+        ) + tuple((headers or {}).items())
+
+        self.flask = (self.body, self.status, list(self.headers))
+        self.asgi_start = {
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in self.headers],
+        }
+        self.asgi_body = {'type': 'http.response.body', 'body': self.body}
+
+    def __repr__(self):
+        return f"<StaticResponse {self.status} {self.body.decode('utf-8')}>"
+
+
+SUCCESS = StaticResponse(HTTPStatus.OK, {'status': 'success'})
+# Still a 2xx, or Stripe would keep retrying an event we already have
+DUPLICATE = StaticResponse(HTTPStatus.OK, {'status': 'duplicate'})
+INVALID_PAYLOAD = StaticResponse(HTTPStatus.BAD_REQUEST, {'error': 'Invalid payload'})
+INVALID_SIGNATURE = StaticResponse(HTTPStatus.BAD_REQUEST, {'error': 'Invalid signature'})
+UNKNOWN_TENANT = StaticResponse(HTTPStatus.NOT_FOUND, {'error': 'Unknown tenant'})
+NOT_FOUND = StaticResponse(HTTPStatus.NOT_FOUND, {'error': 'Not found'})
+JOURNAL_UNAVAILABLE = StaticResponse(HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'Journal unavailable'})
+# The event's lane is full; it is not recorded, so Stripe's retry is handled
+LANE_FULL = StaticResponse(HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'Lane full'}, {'Retry-After': '1'})
+
+# Shed responses differ only in Retry-After, so one is built per value
+_SHED: Dict[int, StaticResponse] = {}
+
+
+def shed(retry_after: int) -> StaticResponse:
+    """
+    The 503 sent when the admission controller sheds a delivery.
+    """
+    response = _SHED.get(retry_after)
+    if response is None:
+        response = _SHED.setdefault(
+            retry_after,
+            StaticResponse(HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'Overloaded'}, {'Retry-After': str(retry_after)})
+        )
+    return response
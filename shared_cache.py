@@ -0,0 +1,263 @@
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Optional
+
+MAGIC = b'SWCACHE1'
+
+# magic, slots, key_size, value_size, ways
+TABLE_HEADER = struct.Struct('<8sIHHH')
+TABLE_HEADER_SIZE = 64
+
+# seqlock version, clock reference bit, key length, value length, key hash, expiry (0 = never)
+SLOT_HEADER = struct.Struct('<IB3xHHQd')
+
+
+def key_hash(key: bytes) -> int:
+    # Python's hash() is salted per process, so workers would disagree
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+
+class SharedCache:
+    """
+    Fixed-size hash table in a named shared memory block, shared by every
+    worker process on the host.
+
+    Each key may live in one of `ways` consecutive slots. Reads take no lock:
+    every slot carries a seqlock version that writers make odd while they
+    change it, and a reader retries or misses if the version moved under it.
+    Writes are serialized within a process by a lock and across processes
+    by an flock. When all slots of a key are taken, CLOCK eviction picks the
+    first one not read since the hand last passed it.
+    """
+
+    def __init__(self, name: str, slots: int = 65536, key_size: int = 64, value_size: int = 64, ways: int = 8):
+        self.name = name
+        self.local_hits = 0
+        self.local_misses = 0
+        self.evictions = 0
+        size = TABLE_HEADER_SIZE + slots * self._slot_size(key_size, value_size)
+
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            created = True
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory(name)
+            created = False
+        # The block outlives any one worker; only close() by the last user
+        # or unlink() removes it, not the resource tracker of whoever made it
+        resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        self.buf = self.shm.buf
+        self._thread_lock = threading.Lock()
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f"{name}.cache.lock"), 'a+b')
+        if created:
+            with self._write_lock():
+                TABLE_HEADER.pack_into(self.buf, 0, MAGIC, slots, key_size, value_size, ways)
+        self._attach()
+
+    @staticmethod
+    def _slot_size(key_size: int, value_size: int) -> int:
+        size = SLOT_HEADER.size + key_size + value_size
+        return size + (-size % 8)
+
+    def _attach(self, timeout: float = 5.0) -> None:
+        # Another worker may have created the block a moment ago and not
+        # written the header yet
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._write_lock():
+                magic, slots, key_size, value_size, ways = TABLE_HEADER.unpack_from(self.buf, 0)
+            if magic == MAGIC:
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Shared cache {self.name} was never initialized")
+            time.sleep(0.01)
+        self.slots = slots
+        self.key_size = key_size
+        self.value_size = value_size
+        self.ways = min(ways, slots)
+        self.slot_size = self._slot_size(key_size, value_size)
+
+    def _write_lock(self):
+        return _FileLock(self._thread_lock, self._lock_file)
+
+    def _offset(self, index: int) -> int:
+        return TABLE_HEADER_SIZE + index * self.slot_size
+
+    def _candidates(self, hashed: int):
+        start = hashed % self.slots
+        for way in range(self.ways):
+            yield (start + way) % self.slots
+
+    # Reads
+
+    def get(self, key: str) -> Optional[bytes]:
+        encoded = key.encode('utf-8')
+        hashed = key_hash(encoded)
+        buf = self.buf
+        for index in self._candidates(hashed):
+            offset = self._offset(index)
+            for _ in range(3):
+                version, _, key_len, value_len, slot_hash, expires_at = SLOT_HEADER.unpack_from(buf, offset)
+                if version & 1:
+                    continue
+                if slot_hash != hashed or key_len != len(encoded):
+                    break
+                start = offset + SLOT_HEADER.size
+                slot_key = bytes(buf[start:start + key_len])
+                value = bytes(buf[start + self.key_size:start + self.key_size + value_len])
+                if struct.unpack_from('<I', buf, offset)[0] != version:
+                    # Rewritten while we read it
+                    continue
+                if slot_key != encoded or (expires_at and expires_at < time.time()):
+                    break
+                # A racy single-byte store; at worst it spares an entry once
+                buf[offset + 4] = 1
+                self.local_hits += 1
+                return value
+        self.local_misses += 1
+        return None
+
+    def get_json(self, key: str):
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    # Writes
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        """
+        Store a value. Returns False if the key or value is larger than the
+        slots were sized for.
+        """
+        encoded = key.encode('utf-8')
+        if len(encoded) > self.key_size or len(value) > self.value_size:
+            return False
+        hashed = key_hash(encoded)
+        expires_at = time.time() + ttl if ttl else 0.0
+
+        with self._write_lock():
+            index = self._find_slot(encoded, hashed)
+            self._write_slot(index, encoded, hashed, value, expires_at)
+        return True
+
+    def set_json(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        return self.set(key, json.dumps(value, separators=(',', ':')).encode('utf-8'), ttl)
+
+    def delete(self, key: str) -> None:
+        encoded = key.encode('utf-8')
+        hashed = key_hash(encoded)
+        with self._write_lock():
+            for index in self._candidates(hashed):
+                if self._slot_holds(index, encoded, hashed):
+                    self._write_slot(index, b'', 0, b'', 0.0)
+
+    def _slot_holds(self, index: int, encoded: bytes, hashed: int) -> bool:
+        offset = self._offset(index)
+        _, _, key_len, _, slot_hash, _ = SLOT_HEADER.unpack_from(self.buf, offset)
+        start = offset + SLOT_HEADER.size
+        return slot_hash == hashed and bytes(self.buf[start:start + key_len]) == encoded
+
+    def _find_slot(self, encoded: bytes, hashed: int) -> int:
+        """
+        The slot already holding the key, else a free or expired one, else a
+        CLOCK victim. Called with the write lock held.
+        """
+        now = time.time()
+        free = None
+        for index in self._candidates(hashed):
+            offset = self._offset(index)
+            _, _, key_len, _, slot_hash, expires_at = SLOT_HEADER.unpack_from(self.buf, offset)
+            if slot_hash == hashed and self._slot_holds(index, encoded, hashed):
+                return index
+            if free is None and (slot_hash == 0 or (expires_at and expires_at < now)):
+                free = index
+        if free is not None:
+            return free
+
+        # Two sweeps always find a victim: the first clears reference bits
+        for _ in range(2):
+            for index in self._candidates(hashed):
+                offset = self._offset(index)
+                if self.buf[offset + 4]:
+                    self.buf[offset + 4] = 0
+                else:
+                    self.evictions += 1
+                    return index
+        return next(self._candidates(hashed))
+
+    def _write_slot(self, index: int, encoded: bytes, hashed: int, value: bytes, expires_at: float) -> None:
+        offset = self._offset(index)
+        buf = self.buf
+        version = struct.unpack_from('<I', buf, offset)[0]
+        # Odd while the slot is inconsistent, so readers skip it
+        struct.pack_into('<I', buf, offset, (version + 1) & 0xFFFFFFFF)
+        start = offset + SLOT_HEADER.size
+        buf[start:start + len(encoded)] = encoded
+        buf[start + self.key_size:start + self.key_size + len(value)] = value
+        struct.pack_into('<B3xHHQd', buf, offset + 4, 0, len(encoded), len(value), hashed, expires_at)
+        struct.pack_into('<I', buf, offset, (version + 2) & 0xFFFFFFFF)
+
+    # Lifecycle
+
+    def metrics(self) -> Dict:
+        # Counters are per process; the table itself is shared
+        return {
+            'slots': self.slots,
+            'bytes': self.shm.size,
+            'hits': self.local_hits,
+            'misses': self.local_misses,
+            'evictions': self.evictions,
+        }
+
+    def close(self) -> None:
+        self.buf = None
+        self.shm.close()
+        self._lock_file.close()
+
+    def unlink(self) -> None:
+        """
+        Remove the block for good, e.g. on deploy; attached workers keep
+        their mapping until they close it.
+        """
+        shared_memory.SharedMemory(self.name).unlink()
+        try:
+            os.remove(self._lock_file.name)
+        except FileNotFoundError:
+            pass
+
+
+class _FileLock:
+    """
+    Exclusive flock, which works across unrelated worker processes. flock
+    belongs to the open file, which all threads of a process share, so the
+    thread lock is taken first to keep those apart.
+    """
+
+    def __init__(self, thread_lock: threading.Lock, file):
+        self.thread_lock = thread_lock
+        self.file = file
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            self.thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.thread_lock.release()
@@ -0,0 +1,485 @@
+import argparse
+import atexit
+import contextlib
+import gc
+import json
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from event_generator import EventGenerator
+from signature import sign_payload
+
+# Frames that belong to the measurement rather than to the worker
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+TABLES = ('Invoice', 'Subscription', 'PaymentIntent', 'Customer', 'OutboxMessage')
+
+
+def setup_database(customers: int) -> Dict[str, type]:
+    """
+    Stand up a RAM-backed SQLite database with the models the handlers use,
+    seed a user per generated customer, and install the models into
+    webhook_handler and outbox in place of the application's.
+    """
+    import django
+    from django.conf import settings
+    from django.db.backends.signals import connection_created
+
+    # A file on tmpfs rather than ":memory:": lane workers write from their
+    # own threads, and only a real file gets SQLite's WAL and busy timeout
+    # instead of "database table is locked"
+    directory = tempfile.mkdtemp(prefix='soak-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    atexit.register(shutil.rmtree, directory, True)
+
+    def tune(sender, connection, **kwargs):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA synchronous=OFF')
+
+    options = {'timeout': 30}
+    if django.VERSION >= (5, 1):
+        # Take the write lock up front, or a read that later writes fails
+        # with "database is locked" without waiting
+        options['transaction_mode'] = 'IMMEDIATE'
+
+    if not settings.configured:
+        settings.configure(
+            # This module doubles as the app that owns the soak models
+            INSTALLED_APPS=['soak'],
+            DATABASES={'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(directory, 'soak.sqlite3'),
+                'OPTIONS': options,
+            }},
+            USE_TZ=True,
+        )
+        django.setup()
+    connection_created.connect(tune)
+
+    from django.db import connection, models
+
+    class User(models.Model):
+        email = models.CharField(max_length=255, db_index=True)
+        stripe_customer_id = models.CharField(max_length=255, db_index=True)
+
+        class Meta:
+            app_label = 'soak'
+
+    class Customer(models.Model):
+        stripe_customer_id = models.CharField(max_length=255, unique=True)
+        email = models.CharField(max_length=255, null=True)
+        name = models.CharField(max_length=255, null=True)
+        description = models.TextField(null=True)
+
+        class Meta:
+            app_label = 'soak'
+
+    class Subscription(models.Model):
+        stripe_subscription_id = models.CharField(max_length=255, unique=True)
+        customer_id = models.CharField(max_length=255, null=True)
+        status = models.CharField(max_length=50, null=True)
+
+        class Meta:
+            app_label = 'soak'
+
+    class Invoice(models.Model):
+        stripe_invoice_id = models.CharField(max_length=255, unique=True)
+        customer_id = models.CharField(max_length=255, null=True)
+
+        class Meta:
+            app_label = 'soak'
+
+    class PaymentIntent(models.Model):
+        stripe_payment_intent_id = models.CharField(max_length=255, unique=True)
+        amount = models.BigIntegerField(null=True)
+        currency = models.CharField(max_length=10, null=True)
+        customer_id = models.CharField(max_length=255, null=True)
+        status = models.CharField(max_length=50, null=True)
+        metadata = models.JSONField(default=dict)
+
+        class Meta:
+            app_label = 'soak'
+
+    class OutboxMessage(models.Model):
+        topic = models.CharField(max_length=100)
+        payload = models.JSONField()
+        created_at = models.DateTimeField(auto_now_add=True)
+        published_at = models.DateTimeField(null=True, db_index=True)
+        attempts = models.PositiveIntegerField(default=0)
+        claimed_until = models.DateTimeField(null=True)
+
+        class Meta:
+            app_label = 'soak'
+
+    found = {model.__name__: model for model in (User, Customer, Subscription, Invoice, PaymentIntent, OutboxMessage)}
+    with connection.schema_editor() as editor:
+        for model in found.values():
+            editor.create_model(model)
+
+    User.objects.bulk_create([
+        User(email=f"customer{index}@example.com", stripe_customer_id=f"cus_{index:010d}")
+        for index in range(customers)
+    ])
+
+    import outbox
+    import webhook_handler
+    for name in ('User', 'Customer', 'Subscription', 'Invoice', 'PaymentIntent'):
+        setattr(webhook_handler, name, found[name])
+    outbox.OUTBOX_MODEL = 'soak.OutboxMessage'
+    return found
+
+
+def read_rss() -> int:
+    """
+    Current resident set size in bytes (peak RSS where /proc is missing).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def fit_trend(times: List[float], values: List[float]) -> Dict[str, float]:
+    """
+    Least-squares slope per hour and how well a straight line explains the
+    samples (r²). Steady growth has a clear slope and a high r²; a sawtooth
+    from caches filling and emptying does not.
+    """
+    count = len(times)
+    if count < 3:
+        return {'per_hour': 0.0, 'r2': 0.0}
+    mean_t = sum(times) / count
+    mean_v = sum(values) / count
+    var_t = sum((t - mean_t) ** 2 for t in times)
+    var_v = sum((v - mean_v) ** 2 for v in values)
+    if not var_t or not var_v:
+        return {'per_hour': 0.0, 'r2': 0.0}
+    cov = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values))
+    slope = cov / var_t
+    return {'per_hour': round(slope * 3600, 1), 'r2': round(cov * cov / (var_t * var_v), 3)}
+
+
+class HandlerOutput:
+    """
+    Stands in for stdout while the handlers run: per-event prints are
+    dropped, and "Error ..." lines are counted by their message prefix so
+    the report shows which broad except blocks fired.
+    """
+
+    MAX_KINDS = 50
+
+    def __init__(self):
+        self.errors: Dict[str, int] = {}
+
+    def write(self, text: str) -> int:
+        if text.startswith('Error'):
+            # "batch of 3" and "batch of 4" are the same failure
+            kind = re.sub(r'\d+', 'N', text.split(':', 1)[0])
+            if kind in self.errors or len(self.errors) < self.MAX_KINDS:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+class SoakRun:
+    """
+    Drives a WebhookHandler with signed synthetic deliveries for a fixed
+    time, sampling RSS, traced Python memory, live object count and
+    throughput every `interval` seconds, and diffing tracemalloc snapshots
+    between samples.
+    """
+
+    def __init__(self, handler, generator: EventGenerator, webhook_secret: str, duration: float,
+                 interval: float = 60.0, warmup: Optional[float] = None, rate: Optional[float] = None,
+                 frames: int = 1, top: int = 10, truncate=None):
+        self.handler = handler
+        self.generator = generator
+        self.webhook_secret = webhook_secret
+        self.duration = duration
+        self.interval = interval
+        # Caches fill up at first (processed event ids, state store,
+        # coalescer buckets); growth during warmup is not a trend
+        self.warmup = max(interval, duration * 0.1) if warmup is None else warmup
+        self.rate = rate
+        self.frames = frames
+        self.top = top
+        # Called after each sample to empty the tables, so the in-process
+        # database doesn't show up as worker growth
+        self.truncate = truncate
+        self.output = HandlerOutput()
+        self.samples: List[Dict] = []
+        self.intervals: List[Dict] = []
+        self.events = 0
+        self.elapsed = 0.0
+        self.statuses: Dict[int, int] = {}
+
+    def deliveries(self):
+        while True:
+            for event in self.generator.events(10000):
+                yield json.dumps(event, separators=(',', ':'))
+
+    def run(self) -> None:
+        tracemalloc.start(self.frames)
+        started = time.monotonic()
+        next_sample = started
+        previous = None
+        statuses = self.statuses
+
+        with contextlib.redirect_stdout(self.output):
+            for payload in self.deliveries():
+                now = time.monotonic()
+                if now >= next_sample:
+                    previous = self.sample(now - started, previous)
+                    next_sample = now + self.interval
+                    if now - started >= self.duration:
+                        break
+                if self.rate:
+                    delay = started + self.events / self.rate - now
+                    if delay > 0:
+                        time.sleep(delay)
+
+                response = self.handler.handle_webhook(payload.encode('utf-8'),
+                                                       sign_payload(payload, self.webhook_secret))
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+                self.events += 1
+
+        tracemalloc.stop()
+        self.elapsed = time.monotonic() - started
+
+    def sample(self, elapsed: float, previous) -> tracemalloc.Snapshot:
+        if self.handler.scheduler is not None:
+            # Queued events would read as growth
+            deadline = time.monotonic() + 30
+            while self.handler.scheduler.queue_depth() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        gc.collect()
+        traced, _ = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+        last = self.samples[-1] if self.samples else None
+        events_per_second = None
+        if last is not None and elapsed > last['t']:
+            events_per_second = round((self.events - last['events']) / (elapsed - last['t']), 1)
+        self.samples.append({
+            't': round(elapsed, 1),
+            'events': self.events,
+            'events_per_second': events_per_second,
+            'rss': read_rss(),
+            'traced': traced,
+            'objects': len(gc.get_objects()),
+            'errors': sum(self.output.errors.values()),
+        })
+
+        if previous is not None:
+            self.intervals.append({
+                't': round(elapsed, 1),
+                'top': [
+                    {
+                        'site': str(stat.traceback[0]) if self.frames == 1 else '\n'.join(stat.traceback.format()),
+                        'size_diff': stat.size_diff,
+                        'count_diff': stat.count_diff,
+                    }
+                    for stat in snapshot.compare_to(previous, 'traceback')[:self.top]
+                ],
+            })
+
+        sample = self.samples[-1]
+        print(f"t={sample['t']:>8}s events={sample['events']:>9} eps={sample['events_per_second']} "
+              f"rss={sample['rss'] / 1e6:.1f}MB traced={sample['traced'] / 1e6:.1f}MB "
+              f"objects={sample['objects']} errors={sample['errors']}", file=sys.stderr)
+
+        if self.truncate is not None:
+            try:
+                self.truncate()
+            except Exception as e:
+                print(f"Error truncating soak tables: {str(e)}", file=sys.stderr)
+        return snapshot
+
+    def report(self, rss_threshold: float = 10e6, traced_threshold: float = 2e6, objects_threshold: float = 10000,
+               throughput_drop: float = 0.15) -> Dict:
+        """
+        Flag steady growth of RSS, traced memory or live objects beyond the
+        per-hour thresholds, a throughput drop between the first and last
+        third of the run, and allocation sites that grew in most intervals.
+        """
+        elapsed = self.elapsed
+        steady = [sample for sample in self.samples if sample['t'] >= self.warmup]
+        times = [sample['t'] for sample in steady]
+
+        trends = {}
+        half = len(steady) // 2
+        for key, threshold in (('rss', rss_threshold), ('traced', traced_threshold), ('objects', objects_threshold)):
+            values = [sample[key] for sample in steady]
+            trend = fit_trend(times, values)
+            # A cache that filled up and then levelled off grows over the
+            # whole window but not over its second half; a leak grows in both
+            trend['recent_per_hour'] = fit_trend(times[half:], values[half:])['per_hour']
+            trend['flagged'] = (trend['per_hour'] > threshold and trend['r2'] >= 0.5
+                                and trend['recent_per_hour'] > threshold)
+            trends[key] = trend
+
+        rates = [sample['events_per_second'] for sample in steady if sample['events_per_second']]
+        throughput = {'first': None, 'last': None, 'change': None, 'flagged': False}
+        if len(rates) >= 3:
+            third = len(rates) // 3
+            first = sum(rates[:third]) / third
+            last = sum(rates[-third:]) / third
+            throughput = {
+                'first': round(first, 1),
+                'last': round(last, 1),
+                'change': round(last / first - 1, 3),
+                'flagged': last < first * (1 - throughput_drop),
+            }
+
+        # A site that leaks shows up growing interval after interval
+        sites: Dict[str, Dict] = {}
+        steady_intervals = [interval for interval in self.intervals if interval['t'] >= self.warmup]
+        for interval in steady_intervals:
+            for stat in interval['top']:
+                site = sites.setdefault(stat['site'], {'site': stat['site'], 'intervals_grown': 0, 'total_growth': 0})
+                site['total_growth'] += stat['size_diff']
+                if stat['size_diff'] > 0:
+                    site['intervals_grown'] += 1
+        growing = sorted(
+            (site for site in sites.values()
+             if steady_intervals and site['total_growth'] > 0
+             and site['intervals_grown'] >= 0.75 * len(steady_intervals) and len(steady_intervals) >= 3),
+            key=lambda site: site['total_growth'],
+            reverse=True
+        )
+
+        return {
+            'seconds': round(elapsed, 1),
+            'events': self.events,
+            'events_per_second': round(self.events / elapsed, 1) if elapsed else None,
+            'statuses': self.statuses,
+            'warmup_seconds': self.warmup,
+            'trends': trends,
+            'throughput': throughput,
+            'growing_sites': growing[:self.top],
+            'handler_errors': dict(self.output.errors),
+            'flagged': any(trend['flagged'] for trend in trends.values()) or throughput['flagged'] or bool(growing),
+            'samples': self.samples,
+            'intervals': self.intervals,
+        }
+
+
+def print_report(report: Dict) -> None:
+    print(f"{report['events']} events in {report['seconds']}s ({report['events_per_second']}/s), "
+          f"statuses {report['statuses']}")
+    for key, trend in report['trends'].items():
+        marker = 'GROWING' if trend['flagged'] else 'ok'
+        print(f"  {key:8} {trend['per_hour']:>14}/h  recent {trend['recent_per_hour']:>14}/h  "
+              f"r2={trend['r2']:<6} {marker}")
+    throughput = report['throughput']
+    if throughput['first'] is not None:
+        marker = 'REGRESSED' if throughput['flagged'] else 'ok'
+        print(f"  throughput {throughput['first']} -> {throughput['last']}/s ({throughput['change']:+.1%}) {marker}")
+    if report['growing_sites']:
+        print("allocation sites growing in most intervals:")
+        for site in report['growing_sites']:
+            print(f"  {site['total_growth']:>12} B  {site['intervals_grown']} intervals  {site['site']}")
+    if report['handler_errors']:
+        print("handler errors:")
+        for kind, count in sorted(report['handler_errors'].items(), key=lambda item: -item[1]):
+            print(f"  {count:>9}  {kind}")
+    print('LEAK OR REGRESSION SUSPECTED' if report['flagged'] else 'no growth or regression detected')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Soak-test WebhookHandler with synthetic traffic against an in-memory database."
+    )
+    parser.add_argument('--duration', type=float, default=3600, help="Seconds to run")
+    parser.add_argument('--interval', type=float, default=60, help="Seconds between samples")
+    parser.add_argument('--warmup', type=float, default=None, help="Seconds excluded from trends (default 10%%)")
+    parser.add_argument('--rate', type=float, default=None, help="Max deliveries per second")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--out-of-order-rate', type=float, default=0.01)
+    parser.add_argument('--lanes', action='store_true', help="Handle events on the default priority lanes")
+    parser.add_argument('--micro-batch', type=float, default=None, help="Batch latency target in seconds")
+    parser.add_argument('--coalesce-window', type=float, default=None)
+    parser.add_argument('--state-store', action='store_true', help="Keep an in-memory StateStore")
+    parser.add_argument('--keep-rows', action='store_true', help="Don't empty the tables after each sample")
+    parser.add_argument('--frames', type=int, default=1, help="Traceback depth per allocation site")
+    parser.add_argument('--top', type=int, default=10, help="Allocation sites kept per interval")
+    parser.add_argument('--rss-threshold', type=float, default=10.0, help="RSS growth flagged, in MB per hour")
+    parser.add_argument('--traced-threshold', type=float, default=2.0,
+                        help="Traced Python memory growth flagged, in MB per hour")
+    parser.add_argument('--objects-threshold', type=float, default=10000,
+                        help="Live object growth flagged, per hour")
+    parser.add_argument('--throughput-drop', type=float, default=0.15,
+                        help="Throughput drop flagged, as a fraction of the early rate")
+    parser.add_argument('--output', default=None, help="Write the full JSON report here")
+    args = parser.parse_args()
+
+    models = setup_database(args.customers)
+
+    from micro_batching import AdaptiveBatchSizer
+    from priority_lanes import DEFAULT_LANES
+    from state_store import StateStore
+    from webhook_handler import WebhookHandler
+
+    secret = 'whsec_soak'
+    handler = WebhookHandler(
+        secret,
+        coalesce_window=args.coalesce_window,
+        lanes=DEFAULT_LANES if args.lanes else None,
+        state_store=StateStore(':memory:') if args.state_store else None,
+        micro_batch=AdaptiveBatchSizer(latency_target=args.micro_batch) if args.micro_batch else None,
+    )
+
+    def truncate():
+        for name in TABLES:
+            models[name].objects.all().delete()
+
+    run = SoakRun(
+        handler,
+        EventGenerator(seed=args.seed, customers=args.customers, duplicate_rate=args.duplicate_rate,
+                       out_of_order_rate=args.out_of_order_rate),
+        secret,
+        args.duration,
+        interval=args.interval,
+        warmup=args.warmup,
+        rate=args.rate,
+        frames=args.frames,
+        top=args.top,
+        truncate=None if args.keep_rows else truncate,
+    )
+    run.run()
+    if handler.scheduler is not None:
+        handler.scheduler.stop()
+
+    report = run.report(
+        rss_threshold=args.rss_threshold * 1e6,
+        traced_threshold=args.traced_threshold * 1e6,
+        objects_threshold=args.objects_threshold,
+        throughput_drop=args.throughput_drop,
+    )
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if report['flagged'] else 0)
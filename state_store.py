@@ -0,0 +1,164 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+# Stripe object types kept in the store
+TRACKED_OBJECTS = ('customer', 'subscription', 'invoice', 'payment_intent')
+
+ACTIVE_SUBSCRIPTION_STATUSES = ('active', 'trialing')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    object_type TEXT NOT NULL,
+    id TEXT NOT NULL,
+    customer TEXT,
+    status TEXT,
+    created INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (object_type, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS objects_customer ON objects (customer, object_type);
+"""
+
+
+class StateStore:
+    """
+    Embedded SQLite store of the latest customer, subscription, invoice and
+    payment intent snapshots, kept current from the webhook stream.
+
+    Each thread reads through its own connection; writes go through one
+    connection under a lock. In WAL mode readers never wait for the writer.
+    """
+
+    def __init__(self, path: str = 'stripe_state.sqlite3'):
+        if path == ':memory:':
+            # A shared-cache URI so every thread's connection sees the same data
+            path = f"file:stripe-state-{id(self)}?mode=memory&cache=shared"
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, uri=self.path.startswith('file:'), check_same_thread=False,
+                                     isolation_level=None)
+        if not self.path.startswith('file:'):
+            connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    # Writes
+
+    def put(self, obj: Dict, created: Optional[int] = None) -> bool:
+        """
+        Store a snapshot unless a newer one is already stored, so late or
+        redelivered events never roll an object back. Returns True if stored.
+        """
+        object_type = obj.get('object')
+        if object_type not in TRACKED_OBJECTS or not obj.get('id'):
+            return False
+        created = created if created is not None else obj.get('created') or 0
+
+        with self._write_lock:
+            cursor = self._writer.execute(
+                """
+                INSERT INTO objects (object_type, id, customer, status, created, data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (object_type, id) DO UPDATE SET
+                    customer = excluded.customer,
+                    status = excluded.status,
+                    created = excluded.created,
+                    data = excluded.data
+                WHERE excluded.created >= objects.created
+                """,
+                (
+                    object_type,
+                    obj['id'],
+                    obj.get('customer') if object_type != 'customer' else obj['id'],
+                    obj.get('status'),
+                    created,
+                    json.dumps(obj, separators=(',', ':'), default=str),
+                ),
+            )
+            return cursor.rowcount > 0
+
+    def apply_event(self, event: Dict) -> bool:
+        """
+        Record the object carried by a webhook event, stamped with the event's
+        creation time.
+        """
+        data_object = event.get('data', {}).get('object') or {}
+        if event.get('type') == 'customer.deleted':
+            data_object = dict(data_object, deleted=True)
+        return self.put(data_object, event.get('created'))
+
+    # Reads
+
+    def get(self, object_type: str, object_id: str) -> Optional[Dict]:
+        row = self._reader().execute(
+            'SELECT data FROM objects WHERE object_type = ? AND id = ?', (object_type, object_id)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def get_customer(self, customer_id: str) -> Optional[Dict]:
+        return self.get('customer', customer_id)
+
+    def get_subscription(self, subscription_id: str) -> Optional[Dict]:
+        return self.get('subscription', subscription_id)
+
+    def get_invoice(self, invoice_id: str) -> Optional[Dict]:
+        return self.get('invoice', invoice_id)
+
+    def get_payment_intent(self, payment_intent_id: str) -> Optional[Dict]:
+        return self.get('payment_intent', payment_intent_id)
+
+    def subscription_status(self, subscription_id: str) -> Optional[str]:
+        row = self._reader().execute(
+            "SELECT status FROM objects WHERE object_type = 'subscription' AND id = ?", (subscription_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def is_subscription_active(self, subscription_id: str) -> Optional[bool]:
+        """
+        True/False from the local snapshot, or None if the subscription is unknown.
+        """
+        status = self.subscription_status(subscription_id)
+        return None if status is None else status in ACTIVE_SUBSCRIPTION_STATUSES
+
+    def customer_objects(self, customer_id: str, object_type: str) -> List[Dict]:
+        """
+        All stored objects of one type for a customer, e.g. their subscriptions.
+        """
+        rows = self._reader().execute(
+            'SELECT data FROM objects WHERE customer = ? AND object_type = ? ORDER BY created DESC',
+            (customer_id, object_type),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def active_subscriptions(self, customer_id: str) -> List[Dict]:
+        return [
+            subscription for subscription in self.customer_objects(customer_id, 'subscription')
+            if subscription.get('status') in ACTIVE_SUBSCRIPTION_STATUSES
+        ]
+
+    def metrics(self) -> Dict:
+        count = self._reader().execute('SELECT COUNT(*) FROM objects').fetchone()[0]
+        return {'objects': count, 'hits': self.hits, 'misses': self.misses}
+
+    def close(self) -> None:
+        self._writer.close()
@@ -1,23 +1,85 @@
-import stripe
-from typing import Optional, Dict
+import json
+import time
+from typing import Dict, Iterable, Optional
+
+# Importing the Stripe SDK takes the better part of a second, so it is loaded
+# on first use (or up front by warmup.prewarm) instead of at import time.
+stripe = None
+
+
+def load_stripe():
+    """
+    Import the Stripe SDK once and return it.
+    """
+    global stripe
+    if stripe is None:
+        import stripe as stripe_sdk
+        stripe = stripe_sdk
+    return stripe
+
+
+def to_plain(obj) -> Dict:
+    """
+    Turn a StripeObject tree into plain dicts and lists, the shape webhook
+    events and the state store hand out.
+    """
+    return json.loads(str(obj))
+
 
 class StripeClient:
-    def __init__(self, api_key: str):
-        """
-        Initialize the Stripe utility with your API key.
-        """
-        stripe.api_key = api_key
+    def __init__(self, api_key: str, api_base: Optional[str] = None, stripe_account: Optional[str] = None,
+                 max_network_retries: Optional[int] = None, state_store=None):
+        """
+        Initialize the Stripe utility with your API key. Pass `api_base` to talk
+        to another API host, e.g. the local mock in mock_stripe_server.py, and
+        `stripe_account` to act on a Connect account.
+
+        Each instance owns its own HTTP connection pool and never touches the
+        global stripe.api_key, so several accounts can share one process.
+
+        With a `state_store` (see state_store.py) the retrieve_* methods answer
+        from the local snapshots kept by the webhook handler and only call the
+        API for objects the store has not seen yet. Either way they return
+        plain dicts.
+        """
+        self.api_key = api_key
+        self.api_base = api_base
+        self.stripe_account = stripe_account
+        self.max_network_retries = max_network_retries
+        self.state_store = state_store
+        self.client = None
+        self._api = None
+
+    @property
+    def api(self):
+        """
+        The v1 API services, built on first use. Because this loads the SDK,
+        the `stripe.error` names used by the methods below are always bound by
+        the time one of their calls can raise.
+        """
+        if self._api is None:
+            load_stripe()
+            self.client = stripe.StripeClient(
+                self.api_key,
+                stripe_account=self.stripe_account,
+                base_addresses={'api': self.api_base} if self.api_base else {},
+                max_network_retries=self.max_network_retries,
+                http_client=stripe.RequestsClient(),
+            )
+            # Newer SDKs group the v1 services under StripeClient.v1
+            self._api = getattr(self.client, 'v1', self.client)
+        return self._api
 
     def create_customer(self, email: str, name: Optional[str] = None, description: Optional[str] = None) -> Dict:
         """
         Create a Stripe customer.
         """
         try:
-            return stripe.Customer.create(
-                email=email,
-                name=name,
-                description=description
-            )
+            return self.api.customers.create(params={
+                'email': email,
+                'name': name,
+                'description': description
+            })
         except stripe.error.StripeError as e:
             print(f"Error creating customer: {e.user_message}")
             return {}
@@ -28,12 +90,12 @@ class StripeClient:
         Create a payment intent.
         """
         try:
-            return stripe.PaymentIntent.create(
-                amount=amount,
-                currency=currency,
-                customer=customer_id,
-                description=description
-            )
+            return self.api.payment_intents.create(params={
+                'amount': amount,
+                'currency': currency,
+                'customer': customer_id,
+                'description': description
+            })
         except stripe.error.StripeError as e:
             print(f"Error creating payment intent: {e.user_message}")
             return {}
@@ -55,20 +117,16 @@ class StripeClient:
 
     def retrieve_customer(self, customer_id: str) -> Dict:
         """
-        Retrieve details of a customer.
+        Retrieve details of a customer, from the state store when it has one.
         """
-        try:
-            return stripe.Customer.retrieve(customer_id)
-        except stripe.error.StripeError as e:
-            print(f"Error retrieving customer: {e.user_message}")
-            return {}
+        return self._retrieve('customer', customer_id)
 
     def delete_customer(self, customer_id: str) -> Dict:
         """
         Delete a customer.
         """
         try:
-            return stripe.Customer.delete(customer_id)
+            return self.api.customers.delete(customer_id)
         except stripe.error.StripeError as e:
             print(f"Error deleting customer: {e.user_message}")
             return {}
@@ -78,31 +136,27 @@ class StripeClient:
         Create a subscription for a customer.
         """
         try:
-            return stripe.Subscription.create(
-                customer=customer_id,
-                items=[{"price": price_id}],
-                trial_period_days=trial_period_days
-            )
+            return self.api.subscriptions.create(params={
+                'customer': customer_id,
+                'items': [{"price": price_id}],
+                'trial_period_days': trial_period_days
+            })
         except stripe.error.StripeError as e:
             print(f"Error creating subscription: {e.user_message}")
             return {}
 
     def retrieve_subscription(self, subscription_id: str) -> Dict:
         """
-        Retrieve details of a subscription.
+        Retrieve details of a subscription, from the state store when it has one.
         """
-        try:
-            return stripe.Subscription.retrieve(subscription_id)
-        except stripe.error.StripeError as e:
-            print(f"Error retrieving subscription: {e.user_message}")
-            return {}
+        return self._retrieve('subscription', subscription_id)
 
     def cancel_subscription(self, subscription_id: str) -> Dict:
         """
         Cancel a subscription.
         """
         try:
-            return stripe.Subscription.delete(subscription_id)
+            return self.api.subscriptions.cancel(subscription_id)
         except stripe.error.StripeError as e:
             print(f"Error canceling subscription: {e.user_message}")
             return {}
@@ -112,24 +166,48 @@ class StripeClient:
         Create an invoice for a customer.
         """
         try:
-            return stripe.Invoice.create(
-                customer=customer_id,
-                description=description,
-                auto_advance=True  # Automatically finalize the invoice
-            )
+            return self.api.invoices.create(params={
+                'customer': customer_id,
+                'description': description,
+                'auto_advance': True  # Automatically finalize the invoice
+            })
         except stripe.error.StripeError as e:
             print(f"Error creating invoice: {e.user_message}")
             return {}
 
     def retrieve_invoice(self, invoice_id: str) -> Dict:
         """
-        Retrieve details of an invoice.
+        Retrieve details of an invoice, from the state store when it has one.
         """
+        return self._retrieve('invoice', invoice_id)
+
+    def _retrieve(self, object_type: str, object_id: str) -> Dict:
+        if self.state_store is not None:
+            cached = self.state_store.get(object_type, object_id)
+            if cached is not None:
+                return cached
+        # The snapshot is at least as new as the moment we asked for it, so
+        # that is its version rather than the object's creation time
+        fetched_at = int(time.time())
         try:
-            return stripe.Invoice.retrieve(invoice_id)
+            # customers, subscriptions and invoices
+            found = to_plain(getattr(self.api, object_type + 's').retrieve(object_id))
         except stripe.error.StripeError as e:
-            print(f"Error retrieving invoice: {e.user_message}")
+            print(f"Error retrieving {object_type}: {e.user_message}")
             return {}
+        if self.state_store is not None:
+            self.state_store.put(found, fetched_at)
+        return found
+
+    def bulk_provision(self, rows: Iterable[Dict], checkpoint_path: str, results_path: Optional[str] = None,
+                       **options) -> Dict:
+        """
+        Create customers and subscriptions for many rows at once; see
+        bulk_provisioning.BulkProvisioner for the options. Safe to re-run
+        with the same checkpoint after an interruption.
+        """
+        from bulk_provisioning import BulkProvisioner
+        return BulkProvisioner(self, checkpoint_path, results_path, **options).run(rows)
 
 # Example usage
 if __name__ == "__main__":
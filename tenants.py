@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from responses import UNKNOWN_TENANT
+from stripe_client import StripeClient
+from webhook_handler import WebhookHandler
+
+
+class Tenant:
+    """
+    One Stripe account (or Connect platform) served by this process, with its
+    own webhook secret, API client, handler queues and metrics.
+    """
+
+    def __init__(self, name: str, api_key: str, webhook_secret: str, accounts: Iterable[str] = (),
+                 stripe_account: Optional[str] = None, api_base: Optional[str] = None, lanes=None,
+                 coalesce_window: Optional[float] = None, archive=None, plugins=None, state_store=None,
+                 tracer=None, micro_batch=None, journal=None, shared_cache=None):
+        self.name = name
+        self.api_key = api_key
+        self.webhook_secret = webhook_secret
+        # Connect account ids whose events belong to this tenant
+        self.accounts = frozenset(accounts)
+        self.state_store = state_store
+        self.stripe_client = StripeClient(api_key, api_base=api_base, stripe_account=stripe_account,
+                                          state_store=state_store)
+        self.handler = WebhookHandler(
+            webhook_secret,
+            self.stripe_client,
+            coalesce_window=coalesce_window,
+            archive=archive,
+            lanes=lanes,
+            plugins=plugins,
+            state_store=state_store,
+            tracer=tracer,
+            micro_batch=micro_batch,
+            journal=journal,
+            shared_cache=shared_cache
+        )
+
+    def metrics(self) -> Dict:
+        handler = self.handler
+        return {
+            'queue_depth': handler.queue_depth(),
+            'processed_event_ids': len(handler.processed_event_ids),
+            'lanes': handler.scheduler.metrics() if handler.scheduler is not None else {},
+            'plugins': handler.plugin_runtime.metrics() if handler.plugin_runtime is not None else {},
+            'state_store': self.state_store.metrics() if self.state_store is not None else {},
+            'tracing': handler.tracer.report() if handler.tracer is not None else {},
+            'journal': handler.journal.metrics() if handler.journal is not None else {},
+            'shared_cache': handler.shared_cache.metrics() if handler.shared_cache is not None else {},
+            'batching': (handler.scheduler.batch_sizer.metrics()
+                         if handler.scheduler is not None and handler.scheduler.batch_sizer is not None else {}),
+        }
+
+
+class TenantRegistry:
+    """
+    Map endpoint paths and Connect `account` ids to tenants.
+    """
+
+    def __init__(self, tenants: Iterable[Tenant] = (), default: Optional[str] = None):
+        self._lock = threading.Lock()
+        self.tenants: Dict[str, Tenant] = {}
+        self.by_account: Dict[str, Tenant] = {}
+        self.default = default
+        for tenant in tenants:
+            self.register(tenant)
+
+    def register(self, tenant: Tenant) -> None:
+        with self._lock:
+            self.tenants[tenant.name] = tenant
+            for account in tenant.accounts:
+                self.by_account[account] = tenant
+            if self.default is None:
+                self.default = tenant.name
+
+    def get(self, name: str) -> Optional[Tenant]:
+        return self.tenants.get(name)
+
+    def resolve(self, payload: str, name: Optional[str] = None) -> Optional[Tenant]:
+        """
+        Pick the tenant for a delivery: the endpoint path wins, then the
+        event's Connect `account`, then the default tenant.
+        """
+        if name is not None:
+            return self.tenants.get(name)
+
+        if self.by_account:
+            # Only peek at the account field; the handler does the full parse
+            # after verifying the signature with this tenant's secret
+            try:
+                account = json.loads(payload).get('account')
+            except (ValueError, AttributeError):
+                account = None
+            if account and account in self.by_account:
+                return self.by_account[account]
+
+        return self.tenants.get(self.default) if self.default else None
+
+    def handle_webhook(self, payload, sig_header, name: Optional[str] = None):
+        tenant = self.resolve(payload, name)
+        if tenant is None:
+            return UNKNOWN_TENANT
+        return tenant.handler.handle_webhook(payload, sig_header)
+
+    def queue_depth(self) -> int:
+        return sum(tenant.handler.queue_depth() for tenant in self.tenants.values())
+
+    def metrics(self) -> Dict[str, Dict]:
+        return {name: tenant.metrics() for name, tenant in self.tenants.items()}
+
+    @classmethod
+    def from_config(cls, config: Dict, lanes=None, coalesce_window: Optional[float] = None,
+                    archive_dir: Optional[str] = None, plugins=None, tracer=None,
+                    batch_latency_target: Optional[float] = None) -> 'TenantRegistry':
+        """
+        Build a registry from {"default": ..., "tenants": [{"name", "api_key",
+        "webhook_secret", "accounts", "stripe_account", "state_store",
+        "batch_latency_target", "journal_dir", "shared_cache"}, ...]}.
+        "state_store" is the path of that tenant's SQLite snapshot file;
+        "batch_latency_target" (seconds) turns on adaptive micro-batching;
+        "journal_dir" holds that tenant's write-ahead journal; "shared_cache"
+        names the shared memory block its workers share processed events in.
+
+        `coalesce_window`, `archive_dir` and `batch_latency_target` are
+        process-wide defaults; an entry's own value wins, and without one each
+        tenant archives to its own subdirectory of `archive_dir`. `lanes` and
+        `plugins` apply to every tenant, each with its own queues and plugin
+        pools.
+        """
+        tenants: List[Tenant] = []
+        for entry in config.get('tenants', []):
+            entry_archive_dir = entry.get('archive_dir')
+            if entry_archive_dir is None and archive_dir:
+                entry_archive_dir = os.path.join(archive_dir, entry['name'])
+            archive = None
+            if entry_archive_dir:
+                # pyarrow is only loaded when some tenant archives
+                from event_archive import EventArchive
+                archive = EventArchive(entry_archive_dir)
+            state_store = None
+            if entry.get('state_store'):
+                from state_store import StateStore
+                state_store = StateStore(entry['state_store'])
+            micro_batch = None
+            entry_latency_target = entry.get('batch_latency_target', batch_latency_target)
+            if entry_latency_target:
+                from micro_batching import AdaptiveBatchSizer
+                micro_batch = AdaptiveBatchSizer(latency_target=entry_latency_target)
+            journal = None
+            if entry.get('journal_dir'):
+                from journal import Journal
+                journal = Journal(entry['journal_dir'])
+            shared_cache = None
+            if entry.get('shared_cache'):
+                from shared_cache import SharedCache
+                shared_cache = SharedCache(entry['shared_cache'])
+
+            tenants.append(Tenant(
+                entry['name'],
+                entry['api_key'],
+                entry['webhook_secret'],
+                accounts=entry.get('accounts', ()),
+                stripe_account=entry.get('stripe_account'),
+                api_base=entry.get('api_base'),
+                lanes=lanes,
+                coalesce_window=entry.get('coalesce_window', coalesce_window),
+                archive=archive,
+                plugins=plugins,
+                state_store=state_store,
+                tracer=tracer,
+                micro_batch=micro_batch,
+                journal=journal,
+                shared_cache=shared_cache,
+            ))
+        return cls(tenants, default=config.get('default'))
+
+    @classmethod
+    def from_file(cls, path: str, lanes=None, coalesce_window: Optional[float] = None,
+                  archive_dir: Optional[str] = None, plugins=None, tracer=None,
+                  batch_latency_target: Optional[float] = None) -> 'TenantRegistry':
+        with open(path) as f:
+            return cls.from_config(json.load(f), lanes=lanes, coalesce_window=coalesce_window,
+                                   archive_dir=archive_dir, plugins=plugins, tracer=tracer,
+                                   batch_latency_target=batch_latency_target)
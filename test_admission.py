@@ -0,0 +1,62 @@
+import pytest
+
+from admission import AdmissionController
+
+
+def test_sheds_once_outstanding_work_reaches_the_cap():
+    depth = [0]
+    admission = AdmissionController(initial_limit=4, queue_depth=lambda: depth[0])
+    assert all(admission.try_acquire() for _ in range(3))
+    depth[0] = 1
+    assert not admission.try_acquire()
+    assert admission.shed == 1
+
+    admission.release()
+    assert admission.try_acquire()
+    assert admission.metrics()['in_flight'] == 3
+
+
+def test_fast_completions_grow_the_cap_additively():
+    admission = AdmissionController(initial_limit=10, latency_target=0.5)
+    for _ in range(10):
+        admission.observe(0.01)
+    assert admission.limit == pytest.approx(11, abs=0.1)
+
+
+def test_slow_completion_cuts_the_cap_once_per_interval():
+    admission = AdmissionController(initial_limit=100, latency_target=60, backoff_ratio=0.5)
+    admission.observe(120)
+    assert admission.limit == 50
+    # Already-queued slow completions right after do not collapse it further
+    admission.observe(120)
+    assert admission.limit == 50
+
+
+def test_cap_stays_within_bounds():
+    admission = AdmissionController(initial_limit=5, min_limit=4, max_limit=6, latency_target=0.0,
+                                    backoff_ratio=0.1)
+    admission.observe(1.0)
+    assert admission.limit == 4
+    admission.latency_target = 10.0
+    for _ in range(100):
+        admission.observe(0.0)
+    assert admission.limit == 6
+
+
+def test_release_with_latency_feeds_the_cap():
+    admission = AdmissionController(initial_limit=10, latency_target=0.5)
+    assert admission.try_acquire()
+    admission.release(0.01)
+    assert admission.in_flight == 0
+    assert admission.limit > 10
+
+
+def test_retry_after_scales_with_overload():
+    depth = [0]
+    admission = AdmissionController(initial_limit=10, queue_depth=lambda: depth[0], retry_after=5,
+                                    max_retry_after=30)
+    assert admission.retry_after_seconds() == 5
+    depth[0] = 30
+    assert admission.retry_after_seconds() == 15
+    depth[0] = 1000
+    assert admission.retry_after_seconds() == 30
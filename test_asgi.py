@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('stripe')
+
+import asgi
+from responses import INVALID_SIGNATURE, UNKNOWN_TENANT
+
+
+def call(method, path, body=b''):
+    sent = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': []}
+    asyncio.run(asgi.application(scope, receive, send))
+    return sent
+
+
+def test_unknown_tenant_gets_the_static_404_and_frees_its_slot(monkeypatch):
+    observed = []
+    monkeypatch.setattr(asgi.admission, 'observe', observed.append)
+    sent = call('POST', '/webhook/nobody', b'{}')
+    assert sent == [UNKNOWN_TENANT.asgi_start, UNKNOWN_TENANT.asgi_body]
+    assert asgi.admission.in_flight == 0
+    # No tenant handled it, so no handler latency is reported
+    assert observed == []
+
+
+def test_inline_tenant_reports_its_latency(monkeypatch):
+    observed = []
+    monkeypatch.setattr(asgi.admission, 'observe', observed.append)
+    sent = call('POST', '/webhook', b'{}')
+    assert sent == [INVALID_SIGNATURE.asgi_start, INVALID_SIGNATURE.asgi_body]
+    # The default tenant has no lanes, so the request time is its latency
+    assert len(observed) == 1
+
+
+def test_metrics_route():
+    start, body = call('GET', '/metrics')
+    assert start['status'] == 200
+    assert set(json.loads(body['body'])) == {'admission', 'tenants'}
@@ -0,0 +1,107 @@
+import csv
+import threading
+
+import pytest
+
+pytest.importorskip('stripe')
+
+from bulk_provisioning import BulkProvisioner
+from mock_stripe_server import MockStripe, start_mock_server
+from stripe_client import StripeClient
+
+
+@pytest.fixture
+def server():
+    mock = MockStripe()
+    server = start_mock_server(mock, port=0)
+    yield mock, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    mock.shutdown()
+
+
+def provisioner(url, tmp_path, **kwargs):
+    return BulkProvisioner(StripeClient('sk_test', api_base=url),
+                           checkpoint_path=str(tmp_path / 'checkpoint.jsonl'),
+                           results_path=str(tmp_path / 'results.csv'), rate=1000, concurrency=4, **kwargs)
+
+
+def read_results(tmp_path):
+    with open(tmp_path / 'results.csv', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+ROWS = [
+    {'email': 'a@example.com', 'name': 'A', 'price_id': 'price_basic'},
+    {'email': 'b@example.com', 'name': 'B'},
+]
+
+
+def test_rerun_skips_provisioned_rows(server, tmp_path, quiet):
+    mock, url = server
+    first = provisioner(url, tmp_path).run(ROWS)
+    assert first['provisioned'] == 2
+    assert len(mock.objects['customers']) == 2
+    assert len(mock.objects['subscriptions']) == 1
+
+    second = provisioner(url, tmp_path).run(ROWS)
+    assert (second['provisioned'], second['skipped']) == (0, 2)
+    assert len(mock.objects['customers']) == 2
+    assert {row['key']: row['status'] for row in read_results(tmp_path)} == {
+        'a@example.com': 'ok', 'b@example.com': 'ok'}
+
+
+def test_lost_checkpoint_does_not_duplicate_customers(server, tmp_path, quiet):
+    mock, url = server
+    provisioner(url, tmp_path).run(ROWS)
+    (tmp_path / 'checkpoint.jsonl').unlink()
+
+    # Same namespace, same idempotency keys: Stripe replays the first objects
+    summary = provisioner(url, tmp_path).run(ROWS)
+    assert summary['provisioned'] == 2
+    assert len(mock.objects['customers']) == 2
+    assert len(mock.objects['subscriptions']) == 1
+
+
+def test_concurrent_requests_with_one_key_create_one_object(server, tmp_path):
+    mock, url = server
+    client = StripeClient('sk_test', api_base=url)
+    client.api
+    barrier = threading.Barrier(8)
+    ids = []
+
+    def create():
+        barrier.wait()
+        customer = client.api.customers.create(params={'email': 'a@example.com'},
+                                               options={'idempotency_key': 'same'})
+        ids.append(customer['id'])
+
+    threads = [threading.Thread(target=create) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 1
+    assert len(mock.objects['customers']) == 1
+
+
+def test_rows_without_key_appear_in_results(server, tmp_path, quiet):
+    mock, url = server
+    summary = provisioner(url, tmp_path).run(ROWS + [{'name': 'No email'}])
+    assert (summary['provisioned'], summary['failed']) == (2, 1)
+    failed = [row for row in read_results(tmp_path) if row['status'] == 'failed']
+    assert len(failed) == 1
+    assert failed[0]['error'].startswith('Missing email')
+
+
+def test_unexpected_worker_errors_are_counted(server, tmp_path, quiet, monkeypatch):
+    mock, url = server
+    bulk = provisioner(url, tmp_path)
+
+    def record(entry):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(bulk.checkpoint, 'record', record)
+    summary = bulk.run(ROWS)
+    assert summary['failed'] == 2
+    assert {row['key']: row['error'] for row in read_results(tmp_path)} == {
+        'a@example.com': 'disk full', 'b@example.com': 'disk full'}
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+pytest.importorskip('stripe')
+
+from admission import AdmissionController
+from config import ConfigWatcher, EnvSource, FileSource, active_secrets, apply_to_tenants, build_config
+from tenants import TenantRegistry
+
+
+def test_expired_secrets_are_dropped():
+    entries = ['whsec_new', {'secret': 'whsec_old', 'expires_at': 100}, {'secret': 'whsec_any'}]
+    assert active_secrets(entries, now=50) == ['whsec_new', 'whsec_old', 'whsec_any']
+    assert active_secrets(entries, now=100) == ['whsec_new', 'whsec_any']
+
+
+@pytest.mark.parametrize('raw', [
+    {'tenants': {'acme': {'webhook_secrets': [{'secret': 'whsec_old', 'expires_at': 1}]}}},
+    {'coalesce_window': 0},
+    {'archive_flush_rows': 0},
+])
+def test_invalid_configs_are_rejected(raw):
+    with pytest.raises(ValueError):
+        build_config(raw, now=10)
+
+
+def test_env_source_reads_prefixed_settings(monkeypatch):
+    monkeypatch.setenv('STRIPE_WEBHOOK_SECRETS', 'whsec_new, whsec_old')
+    monkeypatch.setenv('STRIPE_DISABLED_EVENT_TYPES', 'invoice.updated')
+    source = EnvSource()
+    assert source.changed()
+    config = build_config(source.load())
+    assert config.tenants['default']['webhook_secrets'] == ['whsec_new', 'whsec_old']
+    assert config.disabled_event_types == frozenset(['invoice.updated'])
+    assert not source.changed()
+
+
+@pytest.fixture
+def registry():
+    return TenantRegistry.from_config({'tenants': [
+        {'name': 'acme', 'api_key': 'sk_acme', 'webhook_secret': 'whsec_old'},
+    ]})
+
+
+def test_rotated_secret_is_applied_to_the_live_tenant(tmp_path, registry):
+    path = tmp_path / 'runtime.json'
+    path.write_text(json.dumps({
+        'tenants': {'acme': {'webhook_secrets': ['whsec_new', 'whsec_old']}},
+        'disabled_event_types': ['invoice.updated'],
+        'admission': {'latency_target': 0.25},
+    }))
+    admission = AdmissionController()
+    watcher = ConfigWatcher(FileSource(str(path)))
+    watcher.subscribe(apply_to_tenants(registry, admission))
+
+    assert watcher.poll()
+    handler = registry.get('acme').handler
+    assert handler.webhook_secrets == ('whsec_new', 'whsec_old')
+    assert registry.get('acme').webhook_secret == 'whsec_new'
+    assert handler.disabled_event_types == frozenset(['invoice.updated'])
+    assert admission.latency_target == 0.25
+    # Nothing changed, so nothing is applied again
+    assert not watcher.poll()
+
+
+def test_new_api_key_swaps_the_client(tmp_path, registry):
+    path = tmp_path / 'runtime.json'
+    path.write_text(json.dumps({'tenants': {'acme': {'api_key': 'sk_rotated'}}}))
+    tenant = registry.get('acme')
+    before = tenant.stripe_client
+    watcher = ConfigWatcher(FileSource(str(path)))
+    watcher.subscribe(apply_to_tenants(registry))
+    assert watcher.poll()
+    assert tenant.stripe_client is not before
+    assert tenant.handler.stripe_client is tenant.stripe_client
+    assert tenant.api_key == 'sk_rotated'
+
+
+def test_bad_edit_keeps_the_last_good_config(tmp_path, registry, quiet):
+    path = tmp_path / 'runtime.json'
+    path.write_text(json.dumps({'tenants': {'acme': {'webhook_secrets': ['whsec_new']}}}))
+    watcher = ConfigWatcher(FileSource(str(path)))
+    watcher.subscribe(apply_to_tenants(registry))
+    assert watcher.poll()
+
+    path.write_text('{"tenants": ')
+    assert not watcher.poll()
+    assert watcher.errors == 1
+    assert registry.get('acme').handler.webhook_secrets == ('whsec_new',)
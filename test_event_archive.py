@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from event_archive import ArchiveQuery, EventArchive
+
+HOUR = 3600
+START = 1700000000 - 1700000000 % HOUR
+
+
+def payment(event_id, created, amount, currency='usd', customer='cus_1'):
+    return {
+        'id': event_id,
+        'type': 'payment_intent.succeeded',
+        'created': created,
+        'data': {'object': {'id': f"pi_{event_id}", 'object': 'payment_intent', 'customer': customer,
+                            'amount_received': amount, 'currency': currency}},
+    }
+
+
+@pytest.fixture(params=['parquet', 'arrow'])
+def archive_dir(tmp_path, request):
+    archive = EventArchive(str(tmp_path), file_format=request.param, flush_interval=60)
+    archive.append(payment('evt_1', START, 1000))
+    archive.append(payment('evt_2', START + 10, 500, currency='eur', customer='cus_2'))
+    archive.append(payment('evt_3', START + HOUR, 2000))
+    archive.append({
+        'id': 'evt_4', 'type': 'invoice.paid', 'created': START,
+        'data': {'object': {'id': 'in_1', 'object': 'invoice', 'customer': 'cus_1', 'amount_paid': 700,
+                            'currency': 'usd'}},
+    })
+    archive.close()
+    return str(tmp_path), request.param
+
+
+def test_rows_are_partitioned_by_hour(archive_dir, tmp_path):
+    partitions = sorted(path.parent.relative_to(tmp_path).as_posix() for path in tmp_path.glob('*/*/part-*'))
+    assert len(partitions) == 2
+    assert partitions[0].startswith('date=') and '/hour=' in partitions[0]
+    assert not list(tmp_path.glob('**/*.tmp'))
+
+
+def test_revenue_by_currency_only_counts_payments(archive_dir):
+    root, file_format = archive_dir
+    rows = ArchiveQuery(root, file_format).revenue_by_currency()
+    totals = {row['currency']: (row['amount_sum'], row['amount_count']) for row in rows}
+    assert totals == {'usd': (3000, 2), 'eur': (500, 1)}
+
+
+def test_aggregate_filters_by_time_and_customer(archive_dir):
+    root, file_format = archive_dir
+    query = ArchiveQuery(root, file_format)
+    first_hour = query.aggregate(['type'], start=START, end=START + HOUR, customer='cus_1')
+    assert {row['type']: row['amount_sum'] for row in first_hour} == {
+        'payment_intent.succeeded': 1000,
+        'invoice.paid': 700,
+    }
+    with pytest.raises(ValueError):
+        query.aggregate(['amount_due'])
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        EventArchive(str(tmp_path), file_format='csv')
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from event_coalescer import EventCoalescer
+
+
+def invoice_event(event_id, event_type, invoice_id='in_1', created=100):
+    return {
+        'id': event_id,
+        'type': event_type,
+        'created': created,
+        'data': {'object': {'id': invoice_id, 'object': 'invoice', 'event': event_id}},
+    }
+
+
+def test_payment_succeeded_is_not_coalesced():
+    coalescer = EventCoalescer(lambda *args: None)
+    assert coalescer.accepts(invoice_event('evt_1', 'invoice.updated'))
+    assert not coalescer.accepts(invoice_event('evt_2', 'invoice.payment_succeeded'))
+
+
+def test_window_dispatches_latest_event_once(wait_for):
+    dispatched = []
+    processed = []
+    coalescer = EventCoalescer(lambda event_type, obj: dispatched.append((event_type, obj['event'])),
+                               window_seconds=0.05, on_processed=processed.append)
+    coalescer.submit(invoice_event('evt_1', 'invoice.updated', created=100))
+    coalescer.submit(invoice_event('evt_2', 'invoice.paid', created=101))
+    wait_for(lambda: len(processed) == 2)
+    time.sleep(0.05)
+    assert dispatched == [('invoice.paid', 'evt_2')]
+    assert sorted(processed) == ['evt_1', 'evt_2']
+
+
+def test_many_windows_share_one_flusher_thread(wait_for):
+    dispatched = []
+    lock = threading.Lock()
+
+    def dispatch(event_type, obj):
+        with lock:
+            dispatched.append(obj['id'])
+
+    threads_before = threading.active_count()
+    coalescer = EventCoalescer(dispatch, window_seconds=0.2, flush_workers=2)
+    for index in range(2000):
+        coalescer.submit(invoice_event(f"evt_{index}", 'invoice.updated', invoice_id=f"in_{index}"))
+    # The flusher, plus dispatch workers that only start once windows close
+    assert threading.active_count() - threads_before <= 3
+
+    wait_for(lambda: len(dispatched) == 2000)
+    assert sorted(dispatched) == sorted(f"in_{index}" for index in range(2000))
+    assert coalescer.pending_count() == 0
+
+
+def test_windows_close_in_deadline_order(wait_for):
+    dispatched = []
+    coalescer = EventCoalescer(lambda event_type, obj: dispatched.append(obj['id']), window_seconds=0.05,
+                               flush_workers=1)
+    coalescer.submit(invoice_event('evt_1', 'invoice.updated', invoice_id='in_a'))
+    time.sleep(0.02)
+    coalescer.submit(invoice_event('evt_2', 'invoice.updated', invoice_id='in_b'))
+    wait_for(lambda: len(dispatched) == 2)
+    assert dispatched == ['in_a', 'in_b']
+
+
+def test_flush_closes_windows_early_without_double_dispatch():
+    dispatched = []
+    coalescer = EventCoalescer(lambda event_type, obj: dispatched.append(obj['id']), window_seconds=0.1)
+    coalescer.submit(invoice_event('evt_1', 'invoice.updated'))
+    coalescer.flush()
+    assert dispatched == ['in_1']
+    time.sleep(0.15)
+    assert dispatched == ['in_1']
+
+
+def test_failed_dispatch_leaves_events_unrecorded(quiet):
+    processed = []
+
+    def dispatch(event_type, obj):
+        raise RuntimeError("handler failed")
+
+    coalescer = EventCoalescer(dispatch, window_seconds=10, on_processed=processed.append)
+    coalescer.submit(invoice_event('evt_1', 'invoice.updated'))
+    coalescer.flush()
+    assert processed == []
+    assert coalescer.pending_count() == 0
+
+
+def test_rejected_dispatch_is_held_for_another_window(wait_for):
+    attempts = []
+    processed = []
+
+    def dispatch(event_type, obj):
+        attempts.append(obj['event'])
+        # The first attempt finds the lane full
+        return len(attempts) > 1
+
+    coalescer = EventCoalescer(dispatch, window_seconds=0.02, on_processed=processed.append)
+    coalescer.submit(invoice_event('evt_1', 'invoice.updated', created=100))
+    wait_for(lambda: attempts)
+    coalescer.submit(invoice_event('evt_2', 'invoice.paid', created=101))
+    wait_for(lambda: len(processed) == 2)
+    assert attempts[-1] == 'evt_2'
+    assert coalescer.requeues >= 1
+    assert coalescer.pending_count() == 0
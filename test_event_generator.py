@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from event_generator import EventGenerator, parse_type_mix
+
+
+def test_same_seed_yields_same_deliveries():
+    settings = dict(customers=50, duplicate_rate=0.1, out_of_order_rate=0.1)
+    first = list(EventGenerator(seed=7, **settings).events(500))
+    second = list(EventGenerator(seed=7, **settings).events(500))
+    assert first == second
+    assert first != list(EventGenerator(seed=8, **settings).events(500))
+
+
+def test_count_includes_duplicates_and_reordered_events():
+    events = list(EventGenerator(seed=1, duplicate_rate=0.2, out_of_order_rate=0.2,
+                                 events_per_second=1).events(300))
+    assert len(events) == 300
+    ids = [event['id'] for event in events]
+    assert len(set(ids)) < len(ids)
+    created = [event['created'] for event in events]
+    assert created != sorted(created)
+
+
+def test_settled_invoices_keep_their_creation_time():
+    generator = EventGenerator(seed=3, type_mix={'invoice.updated': 1, 'invoice.paid': 1})
+    opened = {}
+    settled = 0
+    for event in generator.events(400):
+        invoice = event['data']['object']
+        if event['type'] == 'invoice.updated':
+            opened[invoice['id']] = invoice['created']
+        elif invoice['id'] in opened:
+            assert invoice['created'] == opened[invoice['id']]
+            assert invoice['status'] == 'paid'
+            settled += 1
+    assert settled
+
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(ValueError):
+        EventGenerator(type_mix={'charge.refunded': 1})
+
+
+def test_jsonl_output(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    assert EventGenerator(seed=2).write_jsonl(str(path), 20) == 20
+    lines = path.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == list(EventGenerator(seed=2).events(20))
+
+
+def test_parse_type_mix():
+    assert parse_type_mix('invoice.paid=5, customer.created') == {'invoice.paid': 5.0, 'customer.created': 1.0}
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+
+import pytest
+
+import webhook_handler
+from journal import Journal, JournalEntry
+from priority_lanes import Lane
+from webhook_handler import WebhookHandler
+
+
+def event_payload(event_id, event_type='payment_intent.succeeded'):
+    return json.dumps({
+        'id': event_id,
+        'type': event_type,
+        'data': {'object': {'id': f"pi_{event_id}", 'object': 'payment_intent'}},
+    }).encode('utf-8')
+
+
+def read_dead_letters(directory):
+    path = os.path.join(directory, 'dead-letter.jsonl')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_unacknowledged_records_are_recovered(tmp_path):
+    journal = Journal(str(tmp_path), segment_size=4096)
+    seqs = [journal.append(event_payload(f"evt_{index}")) for index in range(3)]
+    assert journal.wait_durable(seqs[-1], timeout=5)
+    journal.ack(seqs[0])
+    journal.close()
+
+    reopened = Journal(str(tmp_path), segment_size=4096)
+    assert [seq for seq, _ in reopened.recovered()] == seqs[1:]
+    reopened.close()
+
+
+def test_failed_record_does_not_pin_the_watermark(tmp_path):
+    journal = Journal(str(tmp_path), segment_size=4096)
+    payloads = [event_payload(f"evt_{index}") for index in range(3)]
+    entries = [JournalEntry(journal, journal.append(payload), payload) for payload in payloads]
+    assert journal.wait_durable(entries[-1].seq, timeout=5)
+
+    entries[0].end()
+    entries[1].end('error')
+    entries[2].end()
+
+    assert journal.acked_upto == entries[2].seq
+    assert journal.metrics()['unacked'] == 0
+    dead = read_dead_letters(str(tmp_path))
+    assert [(record['seq'], record['reason']) for record in dead] == [(entries[1].seq, 'error')]
+    assert dead[0]['payload'].encode('utf-8') == payloads[1]
+    journal.close()
+
+    # Nothing handled, failed or not, runs again after a restart
+    reopened = Journal(str(tmp_path), segment_size=4096)
+    assert reopened.recovered() == []
+    reopened.close()
+
+
+def test_rejected_live_delivery_is_acknowledged_without_dead_letter(tmp_path):
+    journal = Journal(str(tmp_path), segment_size=4096)
+    payload = event_payload('evt_live')
+    entry = JournalEntry(journal, journal.append(payload), payload, redelivered=True)
+    entry.end('rejected')
+    assert journal.acked_upto == entry.seq
+    assert read_dead_letters(str(tmp_path)) == []
+    journal.close()
+
+
+def test_replay_after_crash_dead_letters_failed_records(tmp_path, monkeypatch, quiet, wait_for):
+    # A previous run accepted three events and crashed before handling them
+    journal = Journal(str(tmp_path), segment_size=4096)
+    seqs = [
+        journal.append(event_payload('evt_ok')),
+        journal.append(event_payload('evt_bad')),
+        journal.append(b'not json'),
+    ]
+    assert journal.wait_durable(seqs[-1], timeout=5)
+    journal.close()
+
+    handled = []
+
+    def run_handlers(self, event_type, data_object):
+        if data_object['id'] == 'pi_evt_bad':
+            raise RuntimeError("handler failed")
+        handled.append(data_object['id'])
+
+    monkeypatch.setattr(webhook_handler.WebhookHandler, 'run_handlers', run_handlers)
+
+    reopened = Journal(str(tmp_path), segment_size=4096)
+    WebhookHandler('whsec_test', journal=reopened)
+    wait_for(lambda: reopened.acked_upto == seqs[-1])
+
+    assert handled == ['pi_evt_ok']
+    assert [(record['seq'], record['reason']) for record in read_dead_letters(str(tmp_path))] == [
+        (seqs[1], 'error'),
+        (seqs[2], 'invalid'),
+    ]
+    reopened.close()
+
+    # The checkpoint covers every record, so the next restart replays nothing
+    again = Journal(str(tmp_path), segment_size=4096)
+    assert again.recovered() == []
+    again.close()
+
+
+@pytest.mark.parametrize('status', ['ok', 'coalesced'])
+def test_finished_statuses_acknowledge(tmp_path, status):
+    journal = Journal(str(tmp_path), segment_size=4096)
+    payload = event_payload('evt')
+    entry = JournalEntry(journal, journal.append(payload), payload)
+    entry.end(status)
+    assert journal.acked_upto == entry.seq
+    journal.close()
+
+
+def test_replay_waits_for_room_in_a_full_lane(tmp_path, monkeypatch, quiet, wait_for):
+    journal = Journal(str(tmp_path), segment_size=4096)
+    seqs = [journal.append(event_payload(f"evt_{index}")) for index in range(5)]
+    assert journal.wait_durable(seqs[-1], timeout=5)
+    journal.close()
+
+    release = threading.Event()
+    handled = []
+
+    def run_handlers(self, event_type, data_object):
+        release.wait(5)
+        handled.append(data_object['id'])
+
+    monkeypatch.setattr(webhook_handler.WebhookHandler, 'run_handlers', run_handlers)
+    reopened = Journal(str(tmp_path), segment_size=4096)
+    handler = WebhookHandler('whsec_test', journal=reopened,
+                             lanes=[Lane('payments', ['payment_intent.succeeded'], max_queue=1)])
+    try:
+        wait_for(lambda: handler.scheduler.lanes[0].rejected > 0)
+        release.set()
+        wait_for(lambda: reopened.acked_upto == seqs[-1])
+    finally:
+        release.set()
+        handler.scheduler.stop()
+    assert handled == [f"pi_evt_{index}" for index in range(5)]
+    assert read_dead_letters(str(tmp_path)) == []
+    reopened.close()
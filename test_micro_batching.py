@@ -0,0 +1,74 @@
+import pytest
+
+from micro_batching import AdaptiveBatchSizer, adapt_single, dedupe_latest
+
+
+def test_quiet_queue_is_handled_one_at_a_time():
+    sizer = AdaptiveBatchSizer()
+    assert sizer.size('invoice.paid', 0) == 1
+    assert sizer.size('invoice.paid', 1) == 1
+
+
+def test_batch_grows_with_backlog_up_to_max_size():
+    sizer = AdaptiveBatchSizer(max_size=50)
+    assert sizer.size('invoice.paid', 20) == 20
+    assert sizer.size('invoice.paid', 5000) == 50
+
+
+def test_measured_cost_caps_batch_to_latency_target():
+    sizer = AdaptiveBatchSizer(latency_target=0.1, max_size=500)
+    # 10 ms per event fits 10 events in 100 ms
+    sizer.observe('invoice.paid', 5, 0.05)
+    assert sizer.size('invoice.paid', 1000) == 10
+    # Other types are not affected by that cost
+    assert sizer.size('payment_intent.succeeded', 1000) == 500
+
+
+def test_slow_events_still_make_progress():
+    sizer = AdaptiveBatchSizer(latency_target=0.1, min_size=1)
+    sizer.observe('invoice.paid', 1, 2.0)
+    assert sizer.size('invoice.paid', 1000) == 1
+
+
+def test_cost_is_smoothed():
+    sizer = AdaptiveBatchSizer(smoothing=0.5)
+    sizer.observe('invoice.paid', 1, 0.010)
+    sizer.observe('invoice.paid', 1, 0.020)
+    assert sizer.cost_per_event['invoice.paid'] == pytest.approx(0.015)
+    metrics = sizer.metrics()
+    assert metrics['batches'] == 2
+    assert metrics['avg_batch_size'] == 1.0
+    assert metrics['cost_ms_per_event'] == {'invoice.paid': 15.0}
+
+
+def test_empty_batches_are_ignored():
+    sizer = AdaptiveBatchSizer()
+    sizer.observe('invoice.paid', 0, 1.0)
+    assert sizer.metrics()['batches'] == 0
+
+
+def test_invalid_sizes_are_rejected():
+    with pytest.raises(ValueError):
+        AdaptiveBatchSizer(min_size=0)
+    with pytest.raises(ValueError):
+        AdaptiveBatchSizer(min_size=10, max_size=5)
+
+
+def test_dedupe_latest_keeps_newest_event_per_id():
+    objects = [{'id': 'a', 'v': 2}, {'id': 'b', 'v': 1}, {'id': 'a', 'v': 1}]
+    # The later delivery of `a` is an older event
+    assert dedupe_latest(objects, created=[200, 100, 150]) == [{'id': 'a', 'v': 2}, {'id': 'b', 'v': 1}]
+
+
+def test_dedupe_latest_breaks_ties_by_delivery_order():
+    objects = [{'id': 'a', 'v': 1}, {'id': 'b', 'v': 1}, {'id': 'a', 'v': 2}]
+    assert dedupe_latest(objects, created=[100, 100, 100]) == [{'id': 'a', 'v': 2}, {'id': 'b', 'v': 1}]
+    assert dedupe_latest(objects) == [{'id': 'a', 'v': 2}, {'id': 'b', 'v': 1}]
+
+
+def test_adapt_single_calls_handler_in_order():
+    seen = []
+    handle_batch = adapt_single(lambda data_object: seen.append(data_object['id']))
+    handle_batch([{'id': 'a'}, {'id': 'b'}])
+    assert seen == ['a', 'b']
+    assert handle_batch.__name__ == '<lambda>_batch'
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from plugins import FunctionPlugin, HandlerPlugin, PluginRuntime
+
+
+def test_plugin_without_handle_cannot_be_created():
+    class Incomplete(HandlerPlugin):
+        event_types = ('invoice.paid',)
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_every_plugin_for_the_type_runs():
+    seen = []
+    runtime = PluginRuntime([
+        FunctionPlugin('a', ['invoice.paid'], lambda obj: seen.append(('a', obj['id']))),
+        FunctionPlugin('b', ['invoice.paid', 'customer.created'], lambda obj: seen.append(('b', obj['id']))),
+    ])
+    runtime.dispatch('invoice.paid', {'id': 'in_1'})
+    assert sorted(seen) == [('a', 'in_1'), ('b', 'in_1')]
+    assert runtime.handles('customer.created')
+    assert not runtime.handles('invoice.updated')
+
+
+def test_slow_plugin_times_out_without_holding_back_others(quiet):
+    release = threading.Event()
+    fast = []
+    runtime = PluginRuntime([
+        FunctionPlugin('slow', ['invoice.paid'], lambda obj: release.wait(5), timeout=0.05),
+        FunctionPlugin('fast', ['invoice.paid'], lambda obj: fast.append(obj['id'])),
+    ])
+    try:
+        started = time.monotonic()
+        runtime.dispatch('invoice.paid', {'id': 'in_1'})
+        assert time.monotonic() - started < 1
+        assert fast == ['in_1']
+        assert runtime.metrics()['slow']['timeouts'] == 1
+    finally:
+        release.set()
+        runtime.shutdown()
+
+
+def test_errors_stay_inside_the_failing_plugin(quiet):
+    ok = []
+
+    def fail(obj):
+        raise RuntimeError("boom")
+
+    runtime = PluginRuntime([
+        FunctionPlugin('broken', ['invoice.paid'], fail),
+        FunctionPlugin('ok', ['invoice.paid'], lambda obj: ok.append(obj['id'])),
+    ])
+    runtime.dispatch('invoice.paid', {'id': 'in_1'})
+    assert ok == ['in_1']
+    metrics = runtime.metrics()
+    assert metrics['broken']['errors'] == 1
+    assert metrics['ok']['errors'] == 0
+
+
+def test_saturated_plugin_skips_events_past_its_timeout(quiet, wait_for):
+    release = threading.Event()
+    runtime = PluginRuntime([
+        FunctionPlugin('single', ['invoice.paid'], lambda obj: release.wait(5), timeout=0.05, concurrency=1),
+    ])
+    try:
+        # The first call times out but keeps the plugin's only slot busy
+        runtime.dispatch('invoice.paid', {'id': 'in_1'})
+        runtime.dispatch('invoice.paid', {'id': 'in_2'})
+        assert runtime.metrics()['single']['rejected'] == 1
+    finally:
+        release.set()
+    wait_for(lambda: runtime.metrics()['single']['calls'] == 1)
+    runtime.shutdown()
+
+
+def test_unknown_executor_is_rejected():
+    with pytest.raises(ValueError):
+        PluginRuntime([FunctionPlugin('x', ['invoice.paid'], print, executor='fiber')])
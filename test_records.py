@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import pytest
+
+from records import (INVOICE_SCHEMA, PAYMENT_INTENT_SCHEMA, InvoiceRecord, RecordSchema, compile_path,
+                     resolve_path)
+
+
+def test_paths_compile_to_keys_and_indexes():
+    assert compile_path('lines.data[0].price.id') == ('lines', 'data', 0, 'price', 'id')
+    assert compile_path('tiers[0][1]') == ('tiers', 0, 1)
+
+
+@pytest.mark.parametrize('path', ['lines..id', 'data[x]', '0abc', 'lines.data[0'])
+def test_invalid_paths_are_rejected(path):
+    with pytest.raises(ValueError):
+        compile_path(path)
+
+
+def test_missing_steps_resolve_to_default():
+    steps = compile_path('lines.data[0].price.id')
+    assert resolve_path({'lines': {'data': []}}, steps) is None
+    assert resolve_path({'lines': None}, steps, default='none') == 'none'
+    assert resolve_path({'lines': {'data': [{'price': 'price_1'}]}}, steps) is None
+
+
+def test_invoice_extraction_walks_nested_paths():
+    invoice = {
+        'id': 'in_1',
+        'customer': 'cus_1',
+        'customer_email': 'a@example.com',
+        'subscription': 'sub_1',
+        'lines': {'data': [{'price': {'id': 'price_1'}}]},
+    }
+    record = INVOICE_SCHEMA.extract(invoice, user='user')
+    assert record == InvoiceRecord('in_1', 'cus_1', 'a@example.com', 'sub_1', 'price_1', user='user')
+
+
+def test_missing_fields_fall_back_to_field_defaults():
+    record = PAYMENT_INTENT_SCHEMA.extract({'id': 'pi_1', 'metadata': None})
+    assert record.payment_id == 'pi_1'
+    assert record.amount is None
+    assert record.metadata == {}
+    # Records are slotted, so a typo cannot add an attribute
+    with pytest.raises(AttributeError):
+        record.amout = 1
+
+
+@dataclass(slots=True)
+class Sample:
+    sample_id: Optional[str]
+    label: Optional[str]
+
+
+def test_schema_mismatches_fail_at_definition():
+    with pytest.raises(TypeError, match='no field'):
+        RecordSchema(Sample, {'sample_id': 'id', 'label': 'label', 'colour': 'colour'})
+    with pytest.raises(TypeError, match='without a path'):
+        RecordSchema(Sample, {'sample_id': 'id'})
+    RecordSchema(Sample, {'sample_id': 'id'}, computed=('label',))
@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from shared_cache import SharedCache
+
+
+@pytest.fixture
+def switch_often():
+    # Make thread switches inside set() likely rather than rare
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.fixture
+def cache():
+    name = f"test-cache-{os.getpid()}-{threading.get_ident()}"
+    cache = SharedCache(name, slots=262144)
+    yield cache
+    cache.close()
+    cache.unlink()
+
+
+def test_set_get_delete(cache):
+    assert cache.set('evt:1', b'1')
+    assert cache.get('evt:1') == b'1'
+    assert 'evt:2' not in cache
+    cache.delete('evt:1')
+    assert cache.get('evt:1') is None
+
+
+def test_rejects_oversized_entries(cache):
+    assert not cache.set('k' * (cache.key_size + 1), b'1')
+    assert not cache.set('k', b'v' * (cache.value_size + 1))
+
+
+def test_write_lock_excludes_threads_of_one_process(cache, switch_often):
+    inside = []
+    overlaps = []
+
+    def hold():
+        for _ in range(200):
+            with cache._write_lock():
+                inside.append(1)
+                # Give other threads every chance to barge in
+                time.sleep(0)
+                if len(inside) > 1:
+                    overlaps.append(len(inside))
+                inside.pop()
+
+    threads = [threading.Thread(target=hold) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+
+
+def test_concurrent_sets_from_threads_lose_nothing(cache, switch_often):
+    threads_count, per_thread = 8, 1600
+
+    def write(worker):
+        for index in range(per_thread):
+            cache.set(f"evt:{worker}:{index}", f"{worker}:{index}".encode())
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    missing = [
+        (worker, index)
+        for worker in range(threads_count)
+        for index in range(per_thread)
+        if cache.get(f"evt:{worker}:{index}") != f"{worker}:{index}".encode()
+    ]
+    assert missing == []
+    assert cache.evictions == 0
+
+
+def _write_from_process(name, worker, count):
+    cache = SharedCache(name)
+    for index in range(count):
+        cache.set(f"proc:{worker}:{index}", b'1')
+    cache.close()
+
+
+def test_entries_are_shared_between_processes(cache):
+    processes = [
+        multiprocessing.Process(target=_write_from_process, args=(cache.name, worker, 500))
+        for worker in range(3)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+    assert all(cache.get(f"proc:{worker}:{index}") == b'1' for worker in range(3) for index in range(500))
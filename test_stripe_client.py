@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+pytest.importorskip('stripe')
+
+from mock_stripe_server import MockStripe, start_mock_server
+from state_store import StateStore
+from stripe_client import StripeClient
+
+
+@pytest.fixture
+def server():
+    mock = MockStripe()
+    server = start_mock_server(mock, port=0)
+    yield mock, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    mock.shutdown()
+
+
+@pytest.fixture
+def store():
+    store = StateStore(':memory:')
+    yield store
+    store.close()
+
+
+def test_api_and_store_paths_return_plain_dicts(server, store, quiet):
+    mock, url = server
+    client = StripeClient('sk_test', api_base=url, state_store=store)
+    created = client.create_customer('a@example.com', name='A')
+
+    fetched = client.retrieve_customer(created['id'])
+    cached = client.retrieve_customer(created['id'])
+    assert type(fetched) is dict
+    assert type(cached) is dict
+    assert fetched == cached
+
+    plain = StripeClient('sk_test', api_base=url).retrieve_customer(created['id'])
+    assert type(plain) is dict
+    assert plain == fetched
+
+
+def test_api_snapshot_is_versioned_by_fetch_time(server, store, quiet):
+    mock, url = server
+    client = StripeClient('sk_test', api_base=url, state_store=store)
+    customer_id = client.create_customer('a@example.com', name='Before')['id']
+    client.retrieve_customer(customer_id)
+
+    # An event from before the fetch must not roll the snapshot back...
+    stale = {'id': 'evt_old', 'type': 'customer.updated', 'created': int(time.time()) - 60,
+             'data': {'object': {'id': customer_id, 'object': 'customer', 'name': 'Stale', 'created': 0}}}
+    assert not store.apply_event(stale)
+    assert client.retrieve_customer(customer_id)['name'] == 'Before'
+
+    # ...but one from after it replaces it, although the object's own
+    # creation time never changes
+    fresh = dict(stale, id='evt_new', created=int(time.time()) + 60,
+                 data={'object': {'id': customer_id, 'object': 'customer', 'name': 'After', 'created': 0}})
+    assert store.apply_event(fresh)
+    assert client.retrieve_customer(customer_id)['name'] == 'After'
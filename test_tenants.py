@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+pytest.importorskip('stripe')
+
+from priority_lanes import Lane
+from tenants import TenantRegistry
+
+CONFIG = {
+    'default': 'acme',
+    'tenants': [
+        {'name': 'acme', 'api_key': 'sk_acme', 'webhook_secret': 'whsec_acme'},
+        {'name': 'platform', 'api_key': 'sk_platform', 'webhook_secret': 'whsec_platform',
+         'accounts': ['acct_1', 'acct_2'], 'coalesce_window': 0.5},
+    ],
+}
+
+
+def payload(account=None):
+    event = {'id': 'evt_1', 'type': 'customer.created', 'data': {'object': {'id': 'cus_1'}}}
+    if account:
+        event['account'] = account
+    return json.dumps(event)
+
+
+@pytest.fixture
+def registry():
+    return TenantRegistry.from_config(CONFIG)
+
+
+def test_endpoint_path_wins(registry):
+    assert registry.resolve(payload('acct_1'), 'acme').name == 'acme'
+    assert registry.resolve(payload(), 'nobody') is None
+
+
+def test_connect_account_picks_the_tenant(registry):
+    assert registry.resolve(payload('acct_2')).name == 'platform'
+
+
+def test_unknown_accounts_and_bad_payloads_fall_back_to_default(registry):
+    assert registry.resolve(payload('acct_9')).name == 'acme'
+    assert registry.resolve('not json').name == 'acme'
+    assert registry.resolve(payload()).name == 'acme'
+
+
+def test_first_registered_tenant_is_the_default():
+    registry = TenantRegistry.from_config({'tenants': CONFIG['tenants']})
+    assert registry.default == 'acme'
+    assert TenantRegistry().resolve(payload()) is None
+
+
+def test_tenants_are_isolated(registry):
+    acme, platform = registry.get('acme'), registry.get('platform')
+    assert acme.handler is not platform.handler
+    assert acme.stripe_client is not platform.stripe_client
+    assert acme.handler.webhook_secret == 'whsec_acme'
+    assert set(registry.metrics()) == {'acme', 'platform'}
+
+
+def test_process_defaults_apply_unless_the_entry_overrides_them():
+    registry = TenantRegistry.from_config(CONFIG, coalesce_window=2.0)
+    assert registry.get('acme').handler.coalescer.window_seconds == 2.0
+    assert registry.get('platform').handler.coalescer.window_seconds == 0.5
+
+
+def test_archive_dir_is_split_per_tenant(tmp_path):
+    pytest.importorskip('pyarrow')
+    registry = TenantRegistry.from_config(CONFIG, archive_dir=str(tmp_path))
+    assert registry.get('acme').handler.archive.root_dir == str(tmp_path / 'acme')
+    assert registry.get('platform').handler.archive.root_dir == str(tmp_path / 'platform')
+    for tenant in registry.tenants.values():
+        tenant.handler.archive.close()
+
+
+def test_batch_latency_target_defaults_per_tenant():
+    config = {'tenants': [dict(CONFIG['tenants'][0], batch_latency_target=0.5), CONFIG['tenants'][1]]}
+    registry = TenantRegistry.from_config(config, lanes=[Lane('all', [])], batch_latency_target=0.1)
+    try:
+        assert registry.get('acme').handler.scheduler.batch_sizer.latency_target == 0.5
+        assert registry.get('platform').handler.scheduler.batch_sizer.latency_target == 0.1
+    finally:
+        for tenant in registry.tenants.values():
+            tenant.handler.scheduler.stop()
@@ -0,0 +1,120 @@
+import json
+import threading
+
+import pytest
+
+from event_coalescer import EventCoalescer
+from priority_lanes import Lane
+from responses import LANE_FULL
+from signature import sign_payload
+from tracing import FileSpanExporter, SpanExporter, Tracer, report_from_file
+from webhook_handler import WebhookHandler
+
+SECRET = 'whsec_test'
+
+
+def event(event_id, event_type='invoice.updated', object_id='in_1', created=1_700_000_000):
+    return {
+        'id': event_id,
+        'type': event_type,
+        'created': created,
+        'data': {'object': {'id': object_id, 'object': 'invoice'}},
+    }
+
+
+class Recorder:
+    """
+    A Tracer that also keeps the traces it finished.
+    """
+
+    def __init__(self):
+        self.tracer = Tracer()
+        self.finished = []
+        finish = self.tracer.finish
+        self.tracer.finish = lambda trace: (self.finished.append(trace), finish(trace))
+
+    def start(self, event_id, **kwargs):
+        return self.tracer.start(event(event_id, **kwargs), 1_700_000_001 * 1_000_000_000)
+
+    def statuses(self):
+        return {trace.event_id: trace.status for trace in self.finished}
+
+
+def test_span_exporter_requires_write():
+    with pytest.raises(TypeError):
+        SpanExporter()
+
+
+def test_file_exporter_writes_otlp_spans_and_report_reads_them(tmp_path):
+    path = str(tmp_path / 'traces.jsonl')
+    tracer = Tracer(FileSpanExporter(path, interval=0.01))
+    trace = tracer.start(event('evt_1'), 1_700_000_002 * 1_000_000_000)
+    for stage in ('verify', 'enqueue', 'dequeue', 'handler_start'):
+        trace.mark(stage)
+    trace.end()
+    tracer.exporter.shutdown()
+
+    with open(path) as f:
+        spans = [span for line in f for span in json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']]
+    root = spans[0]
+    assert root['name'] == 'stripe.webhook invoice.updated'
+    assert {span['name'] for span in spans[1:]} == {
+        'stripe.delivery', 'webhook.verify', 'webhook.queue', 'webhook.handler'}
+    assert all(span['parentSpanId'] == root['spanId'] for span in spans[1:])
+
+    assert report_from_file(path)['invoice.updated']['stripe.delivery_lag_ms']['p50'] == 2000.0
+    assert tracer.report()['invoice.updated']['delivery_lag_ms']['count'] == 1
+
+
+def test_sampled_out_events_are_not_traced():
+    assert Tracer(sample_rate=0.0).start(event('evt_1'), 0) is None
+
+
+def test_folded_traces_end_once_the_window_is_accepted():
+    recorder = Recorder()
+    answers = [False, True]
+    dispatched = []
+
+    def dispatch(event_type, data_object, trace):
+        dispatched.append(trace.event_id)
+        return answers.pop(0)
+
+    coalescer = EventCoalescer(dispatch, window_seconds=10)
+    coalescer.submit(event('evt_1', created=1), recorder.start('evt_1'))
+    coalescer.submit(event('evt_2', created=2), recorder.start('evt_2'))
+
+    # A full lane keeps both traces open with their events
+    coalescer.flush()
+    assert recorder.finished == []
+    assert coalescer.requeues == 1
+
+    coalescer.flush()
+    assert dispatched == ['evt_2', 'evt_2']
+    # The latest trace is the lane's to end; the folded one ends here
+    assert recorder.statuses() == {'evt_1': 'coalesced'}
+
+
+def test_rejected_delivery_ends_its_trace_as_rejected(monkeypatch, quiet, wait_for):
+    release = threading.Event()
+    monkeypatch.setattr(WebhookHandler, 'run_handlers', lambda self, event_type, data_object: release.wait(5))
+    recorder = Recorder()
+    handler = WebhookHandler(SECRET, lanes=[Lane('payments', ['payment_intent.succeeded'], max_queue=1)],
+                             tracer=recorder.tracer)
+
+    def deliver(event_id):
+        payload = json.dumps(event(event_id, 'payment_intent.succeeded', object_id=f"pi_{event_id}"))
+        return handler.handle_webhook(payload, sign_payload(payload, SECRET))
+
+    try:
+        deliver('evt_1')
+        wait_for(lambda: handler.scheduler.lanes[0].in_flight == 1)
+        deliver('evt_2')
+        assert deliver('evt_3') is LANE_FULL
+        assert recorder.statuses() == {'evt_3': 'rejected'}
+
+        release.set()
+        wait_for(lambda: len(recorder.finished) == 3)
+        assert recorder.statuses() == {'evt_1': 'ok', 'evt_2': 'ok', 'evt_3': 'rejected'}
+    finally:
+        release.set()
+        handler.scheduler.stop()
@@ -0,0 +1,185 @@
+import json
+import threading
+
+import pytest
+
+from micro_batching import AdaptiveBatchSizer
+from priority_lanes import Lane
+from responses import DUPLICATE, INVALID_PAYLOAD, INVALID_SIGNATURE, LANE_FULL, SUCCESS
+from signature import sign_payload
+from webhook_handler import WebhookHandler
+
+SECRET = 'whsec_test'
+
+
+def delivery(event_id, event_type='payment_intent.succeeded'):
+    payload = json.dumps({
+        'id': event_id,
+        'type': event_type,
+        'data': {'object': {'id': f"pi_{event_id}", 'object': 'payment_intent'}},
+    })
+    return payload, sign_payload(payload, SECRET)
+
+
+def test_full_lane_answers_retryable_and_does_not_record_the_event(monkeypatch, quiet, wait_for):
+    release = threading.Event()
+    handled = []
+
+    def dispatch_event(self, event_type, data_object):
+        release.wait(5)
+        handled.append(data_object['id'])
+
+    monkeypatch.setattr(WebhookHandler, 'dispatch_event', dispatch_event)
+    handler = WebhookHandler(SECRET, lanes=[Lane('payments', ['payment_intent.succeeded'], max_queue=1)])
+    try:
+        assert handler.handle_webhook(*delivery('evt_1')) is SUCCESS
+        # The only worker is now busy with evt_1
+        wait_for(lambda: handler.scheduler.lanes[0].in_flight == 1)
+        assert handler.handle_webhook(*delivery('evt_2')) is SUCCESS
+        assert handler.handle_webhook(*delivery('evt_3')) is LANE_FULL
+        assert LANE_FULL.status == 503
+        assert ('Retry-After', '1') in LANE_FULL.headers
+        assert 'evt_3' not in handler.processed_event_ids
+
+        release.set()
+        wait_for(lambda: len(handled) == 2)
+        # Stripe's retry is handled, not answered as a duplicate
+        assert handler.handle_webhook(*delivery('evt_3')) is SUCCESS
+        assert handler.handle_webhook(*delivery('evt_1')) is DUPLICATE
+    finally:
+        release.set()
+        handler.scheduler.stop()
+    assert handled == ['pi_evt_1', 'pi_evt_2', 'pi_evt_3']
+
+
+def test_inline_routing_reports_acceptance(monkeypatch):
+    monkeypatch.setattr(WebhookHandler, 'dispatch_event', lambda self, event_type, data_object: None)
+    handler = WebhookHandler(SECRET)
+    assert handler.route_event('payment_intent.succeeded', {'id': 'pi_1'}) is True
+    assert handler.handle_webhook(*delivery('evt_1')) is SUCCESS
+    assert handler.handle_webhook(*delivery('evt_1')) is DUPLICATE
+
+
+def test_object_less_events_are_invalid_payloads():
+    payload = json.dumps({'id': 'evt_1', 'type': 'invoice.paid', 'data': {}})
+    assert WebhookHandler(SECRET).handle_webhook(payload, sign_payload(payload, SECRET)) is INVALID_PAYLOAD
+
+
+def test_non_ascii_signature_is_an_invalid_signature():
+    payload, _ = delivery('evt_1')
+    response = WebhookHandler(SECRET).handle_webhook(payload, 't=1700000000,v1=\u00e9\u00e9')
+    assert response is INVALID_SIGNATURE
+
+
+def test_scheduler_pool_is_smaller_than_total_lane_concurrency():
+    lanes = [Lane('a', ['x'], concurrency=4), Lane('b', ['y'], concurrency=2)]
+    handler = WebhookHandler(SECRET, lanes=lanes)
+    try:
+        assert len(handler.scheduler._workers) == 4
+    finally:
+        handler.scheduler.stop()
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    """
+    Replace the single-event handlers with a recorder.
+    """
+    calls = []
+    monkeypatch.setattr(WebhookHandler, 'run_handlers',
+                        lambda self, event_type, data_object: calls.append((event_type, data_object['id'])))
+    return calls
+
+
+def test_run_batch_uses_the_batch_handler(monkeypatch, recorded):
+    batches = []
+    monkeypatch.setitem(WebhookHandler.BATCH_HANDLERS, 'invoice.paid',
+                        lambda objs: batches.append([obj['id'] for obj in objs]))
+    WebhookHandler(SECRET).run_batch('invoice.paid', [{'id': 'in_1'}, {'id': 'in_2'}])
+    assert batches == [['in_1', 'in_2']]
+    assert recorded == []
+
+
+def test_batch_handler_gets_the_newest_event_per_object(monkeypatch, recorded):
+    batches = []
+    monkeypatch.setitem(WebhookHandler.BATCH_HANDLERS, 'invoice.paid', batches.append)
+    # in_1's second delivery is a retry of an older event
+    objects = [{'id': 'in_1', 'v': 2}, {'id': 'in_2', 'v': 1}, {'id': 'in_1', 'v': 1}]
+    WebhookHandler(SECRET).run_batch('invoice.paid', objects, created=[200, 150, 100])
+    assert batches == [[{'id': 'in_1', 'v': 2}, {'id': 'in_2', 'v': 1}]]
+
+
+def test_failed_batch_is_retried_one_by_one(monkeypatch, recorded, quiet):
+    def fail(objs):
+        raise RuntimeError("constraint violated")
+
+    monkeypatch.setitem(WebhookHandler.BATCH_HANDLERS, 'invoice.paid', fail)
+    WebhookHandler(SECRET).run_batch('invoice.paid', [{'id': 'in_1'}, {'id': 'in_2'}])
+    assert recorded == [('invoice.paid', 'in_1'), ('invoice.paid', 'in_2')]
+
+
+def test_types_without_batch_handler_run_singly(recorded):
+    WebhookHandler(SECRET).run_batch('customer.created', [{'id': 'cus_1'}, {'id': 'cus_2'}])
+    assert recorded == [('customer.created', 'cus_1'), ('customer.created', 'cus_2')]
+
+
+def test_disabled_types_are_skipped_in_batches(recorded):
+    handler = WebhookHandler(SECRET)
+    handler.disabled_event_types = frozenset(['customer.created'])
+    handler.run_batch('customer.created', [{'id': 'cus_1'}])
+    assert recorded == []
+
+
+def test_dispatch_batch_ends_traces_by_outcome(monkeypatch, quiet):
+    class Trace:
+        def __init__(self):
+            self.marks = []
+            self.status = None
+
+        def mark(self, stage):
+            self.marks.append(stage)
+
+        def end(self, status='ok'):
+            self.status = status
+
+    handler = WebhookHandler(SECRET)
+    ok = [Trace(), Trace()]
+    monkeypatch.setattr(WebhookHandler, 'run_batch', lambda self, event_type, objs, created=None: None)
+    handler.dispatch_batch('invoice.paid', [{'id': 'in_1'}, {'id': 'in_2'}], ok)
+    assert [trace.status for trace in ok] == ['ok', 'ok']
+    assert ok[0].marks == ['handler_start']
+
+    def fail(self, event_type, objs, created=None):
+        raise RuntimeError("boom")
+
+    failed = [Trace()]
+    monkeypatch.setattr(WebhookHandler, 'run_batch', fail)
+    with pytest.raises(RuntimeError):
+        handler.dispatch_batch('invoice.paid', [{'id': 'in_1'}], failed)
+    assert failed[0].status == 'error'
+
+
+def test_lanes_hand_backlog_to_handlers_in_batches(monkeypatch, quiet, wait_for):
+    release = threading.Event()
+    batches = []
+
+    def run_batch(self, event_type, objs, created=None):
+        release.wait(5)
+        batches.append(list(created))
+
+    monkeypatch.setattr(WebhookHandler, 'run_batch', run_batch)
+    handler = WebhookHandler(SECRET, lanes=[Lane('payments', ['payment_intent.succeeded'])],
+                             micro_batch=AdaptiveBatchSizer(latency_target=60, max_size=100))
+    try:
+        assert handler.route_event('payment_intent.succeeded', {'id': 'pi_0'}, created=100)
+        # The only worker is now busy with pi_0 while a backlog builds up
+        wait_for(lambda: handler.scheduler.queue_depth() == 0)
+        for index in range(1, 51):
+            assert handler.route_event('payment_intent.succeeded', {'id': f"pi_{index}"}, created=100 + index)
+        release.set()
+        wait_for(lambda: sum(len(batch) for batch in batches) == 51)
+    finally:
+        release.set()
+        handler.scheduler.stop()
+    # Each event's creation time travels with it into the batch
+    assert batches == [[100], list(range(101, 151))]
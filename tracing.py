@@ -0,0 +1,352 @@
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+# The trace of the event being handled on this thread, so handlers can stamp
+# their own stages with mark('commit') without it being passed around
+current_trace = contextvars.ContextVar('stripe_webhook_trace', default=None)
+
+# Stages in the order an event passes them. `created` is Stripe's own
+# timestamp and only has one second resolution.
+STAGES = ('created', 'receive', 'verify', 'enqueue', 'dequeue', 'handler_start', 'commit')
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+# (span name, start stage, end stage) for the child spans of every trace
+CHILD_SPANS = (
+    ('stripe.delivery', 'created', 'receive'),
+    ('webhook.verify', 'receive', 'verify'),
+    ('webhook.queue', 'enqueue', 'dequeue'),
+    ('webhook.handler', 'handler_start', 'commit'),
+)
+
+
+def mark(stage: str) -> None:
+    """
+    Stamp a stage on the current event's trace, if it is being traced.
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.mark(stage)
+
+
+def percentiles(samples: Iterable[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {'count': len(ordered), 'p50': at(0.50), 'p90': at(0.90), 'p99': at(0.99), 'max': round(ordered[-1], 3)}
+
+
+class EventTrace:
+    """
+    Wall clock timestamps (ns) of one event's trip from Stripe to the
+    database commit.
+    """
+
+    __slots__ = ('tracer', 'trace_id', 'event_id', 'event_type', 'stamps', 'status', 'ended')
+
+    def __init__(self, tracer: 'Tracer', event: Dict, received_ns: int):
+        self.tracer = tracer
+        self.trace_id = os.urandom(16).hex()
+        self.event_id = event.get('id')
+        self.event_type = event.get('type')
+        self.stamps = {'receive': received_ns}
+        if event.get('created'):
+            self.stamps['created'] = int(event['created']) * 1_000_000_000
+        self.status = 'ok'
+        self.ended = False
+
+    def mark(self, stage: str) -> None:
+        # The first stamp wins, so a handler's own commit stamp is kept
+        self.stamps.setdefault(stage, time.time_ns())
+
+    def ms_between(self, start: str, end: str) -> Optional[float]:
+        if start not in self.stamps or end not in self.stamps:
+            return None
+        return (self.stamps[end] - self.stamps[start]) / 1_000_000
+
+    def end(self, status: str = 'ok') -> None:
+        if self.ended:
+            return
+        self.ended = True
+        self.status = status
+        self.mark('commit')
+        self.tracer.finish(self)
+
+    def to_spans(self) -> List[Dict]:
+        """
+        One SERVER span covering the whole trip plus a child span per stage,
+        in OTLP/JSON form.
+        """
+        stamps = self.stamps
+        root_id = os.urandom(8).hex()
+        start = stamps.get('created', stamps['receive'])
+        attributes = [
+            _attribute('stripe.event_id', self.event_id),
+            _attribute('stripe.event_type', self.event_type),
+            _attribute('stripe.status', self.status),
+        ]
+        for name, first, last in (('stripe.delivery_lag_ms', 'created', 'receive'),
+                                  ('webhook.queue_wait_ms', 'enqueue', 'dequeue'),
+                                  ('webhook.end_to_end_ms', 'created', 'commit')):
+            value = self.ms_between(first, last)
+            if value is not None:
+                attributes.append(_attribute(name, value))
+
+        spans = [{
+            'traceId': self.trace_id,
+            'spanId': root_id,
+            'name': f"stripe.webhook {self.event_type}",
+            'kind': SPAN_KIND_SERVER,
+            'startTimeUnixNano': str(start),
+            'endTimeUnixNano': str(stamps['commit']),
+            'attributes': attributes,
+            'events': [
+                {'timeUnixNano': str(stamps[stage]), 'name': stage} for stage in STAGES if stage in stamps
+            ],
+            'status': {'code': STATUS_CODE_OK if self.status in ('ok', 'coalesced') else STATUS_CODE_ERROR},
+        }]
+        for name, first, last in CHILD_SPANS:
+            if first in stamps and last in stamps:
+                spans.append({
+                    'traceId': self.trace_id,
+                    'spanId': os.urandom(8).hex(),
+                    'parentSpanId': root_id,
+                    'name': name,
+                    'kind': SPAN_KIND_INTERNAL,
+                    'startTimeUnixNano': str(stamps[first]),
+                    'endTimeUnixNano': str(stamps[last]),
+                })
+        return spans
+
+
+def _attribute(key: str, value) -> Dict:
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def _attribute_value(attribute: Dict):
+    value = attribute['value']
+    return value.get('doubleValue', value.get('stringValue', value.get('intValue')))
+
+
+class SpanExporter(ABC):
+    """
+    Batch spans on a background thread so the request path only appends
+    to a queue. Subclasses write one OTLP ExportTraceServiceRequest per batch.
+    """
+
+    def __init__(self, service_name: str = 'stripe-webhook', batch_size: int = 512, interval: float = 2.0,
+                 max_queue: int = 65536):
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, spans: List[Dict]) -> None:
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            # Never slow the webhook down for the sake of a trace
+            self.dropped += 1
+
+    def request_body(self, spans: List[Dict]) -> Dict:
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', self.service_name)]},
+            'scopeSpans': [{'scope': {'name': 'stripe_webhook.tracing'}, 'spans': spans}],
+        }]}
+
+    @abstractmethod
+    def write(self, body: Dict) -> None:
+        """
+        Deliver one request body. Raising counts the batch as an export error.
+        """
+
+    def _run(self) -> None:
+        while True:
+            spans = []
+            deadline = time.monotonic() + self.interval
+            while len(spans) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write_batch(spans)
+                    return
+                spans.extend(item)
+            self._write_batch(spans)
+
+    def _write_batch(self, spans: List[Dict]) -> None:
+        if not spans:
+            return
+        try:
+            self.write(self.request_body(spans))
+        except Exception as e:
+            self.errors += 1
+            print(f"Error exporting {len(spans)} spans: {str(e)}")
+
+    def shutdown(self, timeout: Optional[float] = 5.0) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Append batches as OTLP/JSON lines, the format the OpenTelemetry
+    Collector's file exporter writes and its otlpjsonfile receiver reads.
+    """
+
+    def __init__(self, path: str, **options):
+        self.path = path
+        self._file = open(path, 'a')
+        super().__init__(**options)
+
+    def write(self, body: Dict) -> None:
+        self._file.write(json.dumps(body) + '\n')
+        self._file.flush()
+
+
+class OtlpHttpSpanExporter(SpanExporter):
+    """
+    POST batches to an OTLP/HTTP collector endpoint, e.g.
+    http://localhost:4318/v1/traces.
+    """
+
+    def __init__(self, url: str, timeout: float = 10.0, headers: Optional[Dict] = None, **options):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json'}
+        self.headers.update(headers or {})
+        super().__init__(**options)
+
+    def write(self, body: Dict) -> None:
+        # Loaded here so importing this module stays cheap for the webhook path
+        import urllib.request
+
+        request = urllib.request.Request(self.url, data=json.dumps(body).encode('utf-8'), method='POST',
+                                         headers=self.headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"Collector {self.url} answered {response.status}")
+
+
+def exporter_from_uri(uri: str) -> SpanExporter:
+    """
+    Build an exporter from file:/path or an http(s):// collector URL.
+    """
+    if uri.startswith('file:'):
+        return FileSpanExporter(uri[len('file:'):])
+    if uri.startswith(('http://', 'https://')):
+        return OtlpHttpSpanExporter(uri)
+    raise ValueError(f"Unsupported trace exporter: {uri}")
+
+
+class Tracer:
+    """
+    Start a trace per accepted event, export it when the handler finishes
+    and keep recent stage latencies per event type for report().
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_rate: float = 1.0,
+                 report_samples: int = 4096):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.report_samples = report_samples
+        self.samples: Dict[str, Dict[str, deque]] = {}
+        self.traces = 0
+        self._lock = threading.Lock()
+
+    def start(self, event: Dict, received_ns: int) -> Optional[EventTrace]:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        return EventTrace(self, event, received_ns)
+
+    def finish(self, trace: EventTrace) -> None:
+        with self._lock:
+            self.traces += 1
+            by_stage = self.samples.get(trace.event_type)
+            if by_stage is None:
+                by_stage = self.samples[trace.event_type] = {
+                    name: deque(maxlen=self.report_samples)
+                    for name in ('delivery_lag_ms', 'queue_wait_ms', 'handler_ms', 'end_to_end_ms')
+                }
+            for name, first, last in (('delivery_lag_ms', 'created', 'receive'),
+                                      ('queue_wait_ms', 'enqueue', 'dequeue'),
+                                      ('handler_ms', 'handler_start', 'commit'),
+                                      ('end_to_end_ms', 'created', 'commit')):
+                value = trace.ms_between(first, last)
+                if value is not None:
+                    by_stage[name].append(value)
+        if self.exporter is not None:
+            self.exporter.export(trace.to_spans())
+
+    def report(self) -> Dict[str, Dict]:
+        """
+        Latency distributions per event type over the recent traces.
+        """
+        with self._lock:
+            return {
+                event_type: {name: percentiles(values) for name, values in by_stage.items()}
+                for event_type, by_stage in self.samples.items()
+            }
+
+
+def report_from_file(path: str) -> Dict[str, Dict]:
+    """
+    Delivery lag and end-to-end distributions per event type from a file
+    written by FileSpanExporter.
+    """
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    with open(path) as f:
+        for line in f:
+            for resource in json.loads(line).get('resourceSpans', []):
+                for scope in resource.get('scopeSpans', []):
+                    for span in scope.get('spans', []):
+                        if span.get('kind') != SPAN_KIND_SERVER:
+                            continue
+                        attributes = {item['key']: _attribute_value(item) for item in span.get('attributes', [])}
+                        by_stage = samples.setdefault(attributes.get('stripe.event_type'), {})
+                        for name in ('stripe.delivery_lag_ms', 'webhook.queue_wait_ms', 'webhook.end_to_end_ms'):
+                            if name in attributes:
+                                by_stage.setdefault(name, []).append(float(attributes[name]))
+    return {
+        event_type: {name: percentiles(values) for name, values in by_stage.items()}
+        for event_type, by_stage in samples.items()
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Delivery lag per event type from an exported trace file.")
+    parser.add_argument('path', help="OTLP/JSON lines written by FileSpanExporter")
+    args = parser.parse_args()
+
+    for event_type, by_stage in sorted(report_from_file(args.path).items()):
+        print(event_type)
+        for name, stats in by_stage.items():
+            summary = ', '.join(f"{key}={value}" for key, value in stats.items())
+            print(f"  {name:26} {summary}")
@@ -0,0 +1,75 @@
+import json
+import os
+import time
+from typing import Dict
+
+from records import INVOICE_SCHEMA, PAYMENT_INTENT_SCHEMA, SUBSCRIPTION_SCHEMA
+from signature import sign_payload
+from stripe_client import load_stripe
+
+# Small event pushed through verification and record extraction so the first
+# real request doesn't pay for cold code paths
+WARMUP_EVENT = {
+    'id': 'evt_warmup',
+    'object': 'event',
+    'type': 'invoice.paid',
+    'created': 0,
+    'data': {
+        'object': {
+            'id': 'in_warmup',
+            'object': 'invoice',
+            'customer': 'cus_warmup',
+            'lines': {'data': [{'price': {'id': 'price_warmup'}}]},
+        }
+    },
+}
+
+
+def prewarm(tenants) -> Dict[str, float]:
+    """
+    Do the expensive one-off work before the worker accepts traffic: load the
+    Stripe SDK, build each tenant's API client and connection pool, exercise
+    the pre-keyed HMAC verifiers and, when Django is configured, load the ORM
+    modules the handlers import lazily. Returns milliseconds per step.
+    """
+    timings = {}
+
+    def step(name, func):
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            print(f"Error during warmup step {name}: {str(e)}")
+        timings[name] = round((time.perf_counter() - started) * 1000, 3)
+
+    step('stripe_sdk', load_stripe)
+    step('stripe_clients', lambda: [tenant.stripe_client.api for tenant in tenants.tenants.values()])
+
+    def verify():
+        payload = json.dumps(WARMUP_EVENT)
+        for tenant in tenants.tenants.values():
+            handler = tenant.handler
+            handler.construct_event(payload, sign_payload(payload, handler.webhook_secret))
+
+    step('signatures', verify)
+
+    def records():
+        invoice = WARMUP_EVENT['data']['object']
+        INVOICE_SCHEMA.extract(invoice)
+        PAYMENT_INTENT_SCHEMA.extract(invoice)
+        SUBSCRIPTION_SCHEMA.extract(invoice)
+
+    step('records', records)
+
+    if os.environ.get('DJANGO_SETTINGS_MODULE'):
+        def django_modules():
+            import django
+            from django.apps import apps
+            if not apps.ready:
+                django.setup()
+            import django.db.transaction  # noqa: F401
+            import outbox  # noqa: F401
+
+        step('django', django_modules)
+
+    return timings
@@ -1,29 +1,146 @@
+import json
 import logging
-import stripe
-from django.http import HttpResponse
-from flask import Flask, request, jsonify
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Union
+
+from records import CUSTOMER_SCHEMA, INVOICE_SCHEMA, PAYMENT_INTENT_SCHEMA, SUBSCRIPTION_SCHEMA
+from responses import DUPLICATE, INVALID_PAYLOAD, INVALID_SIGNATURE, JOURNAL_UNAVAILABLE, LANE_FULL, SUCCESS
+from signature import SignatureVerificationError, WebhookVerifier
+from tracing import current_trace
 
-app = Flask(__name__)
 
 # Webhook Handler Class (for processing Stripe webhook events)
 class WebhookHandler:
 
-    def __init__(self, webhook_secret: str):
-        self.webhook_secret = webhook_secret
+    # How many recently processed event ids are remembered
+    MAX_PROCESSED_EVENT_IDS = 10000
+
+    def __init__(self, webhook_secret: Union[str, Iterable[str]], stripe_client=None,
+                 coalesce_window: Optional[float] = None, archive=None, lanes=None, plugins=None,
+                 state_store=None, tracer=None, micro_batch=None, journal=None, shared_cache=None):
+        self.set_webhook_secrets(webhook_secret)
+        self.stripe_client = stripe_client
+        # Optional StateStore holding the latest snapshot of each object
+        self.state_store = state_store
+        # Optional tracing.Tracer following each event from Stripe to commit
+        self.tracer = tracer
+        # Event types switched off at runtime (see config.py)
+        self.disabled_event_types = frozenset()
+        # Optional EventArchive that keeps analytics off the handler tables
+        self.archive = archive
+        self.processed_event_ids = OrderedDict()
+        self._processed_lock = threading.Lock()
+        # Optional shared_cache.SharedCache: processed event ids are shared
+        # with every worker on the host, so a redelivery that lands on
+        # another worker is still recognized
+        self.shared_cache = shared_cache
+
+        # Optional handler plugins, each with its own timeout and concurrency limit
+        self.plugin_runtime = None
+        if plugins:
+            from plugins import PluginRuntime
+            self.plugin_runtime = PluginRuntime(plugins)
+
+        # Optional per-event-type priority lanes (see priority_lanes.DEFAULT_LANES),
+        # optionally handing events to the handlers in adaptive batches
+        # (a micro_batching.AdaptiveBatchSizer)
+        self.scheduler = None
+        if lanes:
+            from priority_lanes import LaneScheduler
+            self.scheduler = LaneScheduler(
+                self.dispatch_event,
+                lanes,
+                dispatch_batch=self.dispatch_batch if micro_batch is not None else None,
+                batch_sizer=micro_batch
+            )
+
+        # Optional stage that collapses bursts of events for the same object
+        self.coalescer = None
+        if coalesce_window:
+            from event_coalescer import EventCoalescer
+            self.coalescer = EventCoalescer(
+                self.route_event,
+                window_seconds=coalesce_window,
+                on_processed=self.record_processed_event
+            )
+
+        # Optional journal.Journal: verified payloads are made durable before
+        # they are dispatched, and whatever a crash left unhandled is replayed
+        self.journal = journal
+        if journal is not None:
+            threading.Thread(target=self.replay_journal, name='journal-replay', daemon=True).start()
+
+    def set_webhook_secrets(self, secrets: Union[str, Iterable[str]]) -> None:
+        """
+        Replace the accepted signing secrets. The first one is current; any
+        others are still accepted while a rotation is in progress.
+        """
+        secrets = (secrets,) if isinstance(secrets, str) else tuple(secrets)
+        if not secrets:
+            raise ValueError("At least one webhook secret is required")
+        # The verifier is swapped in one assignment, so requests already
+        # verifying keep a consistent view of the old secrets
+        self.verifier = WebhookVerifier(secrets)
+        self.webhook_secrets = secrets
+        self.webhook_secret = secrets[0]
+
+    def construct_event(self, payload, sig_header):
+        """
+        Verify the payload against each accepted secret, newest first, and
+        parse it. Events are plain dicts; the Stripe SDK is not needed here.
+        """
+        self.verifier.verify(payload, sig_header)
+        event = json.loads(payload)
+        # Every handler and the coalescer read the object the event is about
+        if not isinstance(event, dict) or not isinstance(event.get('data'), dict) \
+                or not isinstance(event['data'].get('object'), dict):
+            raise ValueError("Payload is not a Stripe event")
+        return event
 
     def handle_webhook(self, payload, sig_header):
         """
         Handle the Stripe webhook event by verifying the signature and processing
-        the event based on its type.
+        the event based on its type. Returns one of the static responses in
+        responses.py.
         """
         event = None
+        received_ns = time.time_ns() if self.tracer is not None else 0
 
         try:
-            event = stripe.Webhook.construct_event(payload, sig_header, self.webhook_secret)
+            event = self.construct_event(payload, sig_header)
         except ValueError:
-            return {"error": "Invalid payload"}, 400
-        except stripe.error.SignatureVerificationError:
-            return {"error": "Invalid signature"}, 400
+            return INVALID_PAYLOAD
+        except SignatureVerificationError:
+            return INVALID_SIGNATURE
+
+        # Stripe redelivers events it is unsure we received
+        if self.is_processed_event(event.get('id')):
+            return DUPLICATE
+
+        trace = None
+        if self.tracer is not None:
+            trace = self.tracer.start(event, received_ns)
+            if trace is not None:
+                trace.mark('verify')
+
+        if self.journal is not None:
+            try:
+                raw = payload.encode('utf-8') if isinstance(payload, str) else payload
+                seq = self.journal.append(raw)
+                if not self.journal.wait_durable(seq, timeout=5.0):
+                    raise RuntimeError(f"record {seq} was not synced in time")
+            except Exception as e:
+                # Not durable, so let Stripe deliver it again later
+                print(f"Error writing event to journal: {str(e)}")
+                if trace is not None:
+                    trace.end('rejected')
+                return JOURNAL_UNAVAILABLE
+            # Acknowledges the record once the handler is done
+            from journal import JournalEntry
+
+            trace = JournalEntry(self.journal, seq, raw, trace, redelivered=True)
     # def stripe_webhook():
     #     """
     #     Handle Stripe webhook events.
@@ -44,9 +161,167 @@ class WebhookHandler:
     #         # Invalid signature
     #         return jsonify({'error': 'Invalid signature'}), 400
 
+        # Keep the local snapshots current before any handler runs; the store
+        # ignores snapshots older than the one it has, so order does not matter
+        if self.state_store is not None:
+            try:
+                self.state_store.apply_event(event)
+            except Exception as e:
+                print(f"Error updating state store: {str(e)}")
+
         # Handle the event
-        event_type = event.get('type')
-        data_object = event['data']['object']
+        if self.coalescer is not None and self.coalescer.accepts(event):
+            self.coalescer.submit(event, trace)
+        elif self.route_event(event.get('type'), event['data']['object'], trace, event.get('created')):
+            self.record_processed_event(event.get('id'))
+        else:
+            # Not recorded as processed, so Stripe's retry is handled
+            if trace is not None:
+                trace.end('rejected')
+            return LANE_FULL
+
+        if self.archive is not None:
+            self.archive.append(event)
+
+        return SUCCESS
+
+    def replay_journal(self):
+        """
+        Dispatch the journal records a previous run accepted but never
+        finished handling. Handlers upsert, so repeating one is harmless.
+        """
+        from journal import JournalEntry
+
+        records = self.journal.recovered()
+        if records:
+            print(f"Replaying {len(records)} unacknowledged events from the journal")
+        for seq, payload in records:
+            entry = JournalEntry(self.journal, seq, payload)
+            try:
+                event = json.loads(payload)
+                event_type, data_object = event.get('type'), event['data']['object']
+            except Exception as e:
+                print(f"Error replaying journal record {seq}: {str(e)}")
+                entry.end('invalid')
+                continue
+            try:
+                if self.coalescer is not None and self.coalescer.accepts(event):
+                    self.coalescer.submit(event, entry)
+                else:
+                    # Stripe will not send these again, so a full lane only
+                    # slows the replay down
+                    while not self.route_event(event_type, data_object, entry, event.get('created')):
+                        time.sleep(0.05)
+            except Exception as e:
+                # dispatch_event has already ended the entry
+                print(f"Error replaying journal record {seq}: {str(e)}")
+
+    def route_event(self, event_type, data_object, trace=None, created=None) -> bool:
+        """
+        Hand the event to its priority lane, or run it inline without lanes.
+        Returns False if the lane is full and the event was not queued; the
+        trace is left open for the caller, which may still retry the event.
+        """
+        if self.scheduler is not None:
+            if trace is not None:
+                trace.mark('enqueue')
+            return self.scheduler.submit(event_type, data_object, trace, created)
+
+        token = current_trace.set(trace)
+        try:
+            self.dispatch_event(event_type, data_object)
+        finally:
+            current_trace.reset(token)
+        return True
+
+    def queue_depth(self) -> int:
+        """
+        Events accepted but not yet picked up by a handler.
+        """
+        depth = 0
+        if self.scheduler is not None:
+            depth += self.scheduler.queue_depth()
+        if self.coalescer is not None:
+            depth += self.coalescer.pending_count()
+        return depth
+
+    def dispatch_event(self, event_type, data_object):
+        """
+        Run the handlers for one event, closing its trace (if any) once they
+        have committed.
+        """
+        trace = current_trace.get()
+        if trace is None:
+            return self.run_handlers(event_type, data_object)
+
+        trace.mark('handler_start')
+        try:
+            self.run_handlers(event_type, data_object)
+        except Exception:
+            trace.end('error')
+            raise
+        trace.end()
+
+    def dispatch_batch(self, event_type, data_objects, traces=(), created=None):
+        """
+        Run the handlers for a batch of events of one type, closing their
+        traces once the batch has committed. `created` holds the events'
+        Stripe creation times, in the same order as `data_objects`.
+        """
+        traces = [trace for trace in traces if trace is not None]
+        for trace in traces:
+            trace.mark('handler_start')
+        try:
+            self.run_batch(event_type, data_objects, created)
+        except Exception:
+            for trace in traces:
+                trace.end('error')
+            raise
+        for trace in traces:
+            trace.end()
+
+    def run_batch(self, event_type, data_objects, created=None):
+        """
+        Route a batch to the batch handler for its type, or to the single
+        event handler once per object when the type has no batch handler.
+        Batch handlers get one object per id, from the newest event.
+        """
+        if event_type in self.disabled_event_types:
+            logging.info(f"Skipping disabled event type: {event_type}")
+            return
+
+        if self.plugin_runtime is not None and self.plugin_runtime.handles(event_type):
+            for data_object in data_objects:
+                self.plugin_runtime.dispatch(event_type, data_object)
+            return
+
+        from micro_batching import adapt_single, dedupe_latest
+
+        batch_handler = WebhookHandler.BATCH_HANDLERS.get(event_type)
+        if batch_handler is None:
+            adapt_single(lambda data_object: self.run_handlers(event_type, data_object))(data_objects)
+            return
+
+        data_objects = dedupe_latest(data_objects, created)
+        try:
+            batch_handler(data_objects)
+        except Exception as e:
+            # One bad object should not cost the rest of the batch
+            print(f"Error processing {event_type} batch of {len(data_objects)}, retrying one by one: {str(e)}")
+            for data_object in data_objects:
+                self.run_handlers(event_type, data_object)
+
+    def run_handlers(self, event_type, data_object):
+        """
+        Route a single event object to the handler for its type.
+        """
+        if event_type in self.disabled_event_types:
+            logging.info(f"Skipping disabled event type: {event_type}")
+            return
+
+        if self.plugin_runtime is not None and self.plugin_runtime.handles(event_type):
+            self.plugin_runtime.dispatch(event_type, data_object)
+            return
 
         if event_type == 'customer.subscription.created':
             WebhookHandler.handle_subscription_created(data_object)
@@ -66,7 +341,54 @@ class WebhookHandler:
         else:
             print(f"Unhandled event type: {event_type}")
 
-        return jsonify({'status': 'success'}), 20
+    @staticmethod
+    def default_plugins(timeout: float = 10.0, concurrency: int = 4):
+        """
+        The built-in handlers as thread plugins, for use with `plugins=`.
+        """
+        from plugins import FunctionPlugin
+
+        return [
+            FunctionPlugin('subscription_created', ['customer.subscription.created'],
+                           WebhookHandler.handle_subscription_created, timeout, concurrency),
+            FunctionPlugin('subscription_deleted', ['customer.subscription.deleted'],
+                           WebhookHandler.handle_subscription_deleted, timeout, concurrency),
+            FunctionPlugin('invoice_paid', ['invoice.paid'],
+                           WebhookHandler.handle_invoice_paid, timeout, concurrency),
+            FunctionPlugin('invoice_updated', ['invoice.updated'],
+                           WebhookHandler.handle_invoice_updated, timeout, concurrency),
+            FunctionPlugin('invoice_payment_succeeded', ['invoice.payment_succeeded'],
+                           WebhookHandler.handle_invoice_payment_succeeded, timeout, concurrency),
+            FunctionPlugin('payment_intent_succeeded', ['payment_intent.succeeded'],
+                           WebhookHandler.handle_payment_intent_succeeded, timeout, concurrency),
+            FunctionPlugin('customer_created', ['customer.created'],
+                           WebhookHandler.handle_customer_created, timeout, concurrency),
+        ]
+
+    def is_processed_event(self, event_id) -> bool:
+        if not event_id:
+            return False
+        if event_id in self.processed_event_ids:
+            return True
+        return self.shared_cache is not None and f"evt:{event_id}" in self.shared_cache
+
+    def record_processed_event(self, event_id):
+        """
+        Remember an event id as processed, keeping only the most recent ones.
+        """
+        if not event_id:
+            return
+        with self._processed_lock:
+            self.processed_event_ids[event_id] = True
+            self.processed_event_ids.move_to_end(event_id)
+            if len(self.processed_event_ids) > self.MAX_PROCESSED_EVENT_IDS:
+                self.processed_event_ids.popitem(last=False)
+        if self.shared_cache is not None:
+            try:
+                # Stripe stops redelivering after three days
+                self.shared_cache.set(f"evt:{event_id}", b'1', ttl=3 * 24 * 3600)
+            except Exception as e:
+                print(f"Error recording event in shared cache: {str(e)}")
 
     def handle_subscription_created(subscription):
         """
@@ -74,27 +396,27 @@ class WebhookHandler:
         """
         # print(f"Subscription created: {subscription['id']}")
         try:
-            data = extract_subscription_data(subscription)
+            data = WebhookHandler.extract_subscription_data(subscription)
 
             if data is None:
-                return HttpResponse(status=200)  # Exit if there was an issue with extracting the data
+                return  # Exit if there was an issue with extracting the data
 
             # Log for debugging purposes
-            logging.info(f"Processing subscription created event for {data['subscription_id']}")
+            logging.info(f"Processing subscription created event for {data.subscription_id}")
 
             # Store or update the subscription in the database
             obj, created = Subscription.objects.update_or_create(
-                stripe_subscription_id=data['subscription_id'],
+                stripe_subscription_id=data.subscription_id,
                 defaults={
-                    'customer_id': data['customer_id']
+                    'customer_id': data.customer_id
                 }
             )
 
             # Log the outcome
             if created:
-                print(f"New subscription record created: {data['subscription_id']}")
+                print(f"New subscription record created: {data.subscription_id}")
             else:
-                print(f"Subscription record updated: {data['subscription_id']}")
+                print(f"Subscription record updated: {data.subscription_id}")
 
         except Exception as e:
             print(f"Error processing subscription created event: {str(e)}")
@@ -110,7 +432,7 @@ class WebhookHandler:
 
             if not subscription_id:
                 logging.info("No subscription ID found for deletion event.")
-                return HttpResponse(status=200)
+                return
 
             # Log the deletion event
             print(f"Subscription deleted: {subscription_id}")
@@ -137,30 +459,30 @@ class WebhookHandler:
         """
         # print(f"Invoice paid: {invoice['id']}")
         try:
-            data = extract_invoice_data(invoice)
+            data = WebhookHandler.extract_invoice_data(invoice)
 
             if data is None:
-                return HttpResponse(status=200)  # Exit if there was an issue with extracting the data
+                return  # Exit if there was an issue with extracting the data
 
-            if not data['user']:
+            if not data.user:
                 logging.error("User not found.")
-                return HttpResponse(status=200)
+                return
 
             # Log for debugging
-            print(f"Invoice paid event received for invoice ID: {data['invoice_id']}")
+            print(f"Invoice paid event received for invoice ID: {data.invoice_id}")
 
             # Store or update the invoice in the database
             obj, created = Invoice.objects.update_or_create(
-                stripe_invoice_id=data['invoice_id'],
+                stripe_invoice_id=data.invoice_id,
                 defaults={
-                    'customer_id': data['customer_id']
+                    'customer_id': data.customer_id
                 }
             )
 
             if created:
-                print(f"New invoice record created for ID: {data['invoice_id']}")
+                print(f"New invoice record created for ID: {data.invoice_id}")
             else:
-                print(f"Invoice record updated for ID: {data['invoice_id']}")
+                print(f"Invoice record updated for ID: {data.invoice_id}")
 
         except Exception as e:
             print(f"Error processing invoice.paid event: {str(e)}")
@@ -172,30 +494,30 @@ class WebhookHandler:
         # print(f"Invoice updated: {invoice['id']}")
         try:
             # Extract necessary data from the invoice object
-            data = extract_invoice_data(invoice)
+            data = WebhookHandler.extract_invoice_data(invoice)
 
             if data is None:
-                return HttpResponse(status=200)  # Exit if there was an issue with extracting the data
+                return  # Exit if there was an issue with extracting the data
 
-            if not data['user']:
+            if not data.user:
                 logging.error("User not found.")
-                return HttpResponse(status=200)
+                return
 
             # Log for debugging
-            print(f"Processing invoice updated event for invoice ID: {data['invoice_id']}")
+            print(f"Processing invoice updated event for invoice ID: {data.invoice_id}")
 
             # Store or update the invoice in the database
             obj, created = Invoice.objects.update_or_create(
-                stripe_invoice_id=data['invoice_id'],
+                stripe_invoice_id=data.invoice_id,
                 defaults={
-                    'customer_id': data['customer_id']
+                    'customer_id': data.customer_id
                 }
             )
 
             if created:
-                print(f"New invoice record created: {data['invoice_id']}")
+                print(f"New invoice record created: {data.invoice_id}")
             else:
-                print(f"Invoice record updated: {data['invoice_id']}")
+                print(f"Invoice record updated: {data.invoice_id}")
 
         except Exception as e:
             print(f"Error processing invoice updated event: {str(e)}")
@@ -206,27 +528,38 @@ class WebhookHandler:
         """
         # print(f"Invoice payment succeeded: {invoice['id']}")
         try:
-            data = extract_invoice_data(invoice)
+            data = WebhookHandler.extract_invoice_data(invoice)
 
             if data is None:
-                return HttpResponse(status=200)  # Exit if there was an issue with extracting the data
+                return  # Exit if there was an issue with extracting the data
 
-            if not data['user']:
+            if not data.user:
                 logging.error("User not found.")
-                return HttpResponse(status=200)
+                return
 
-            # Store or update the invoice in the database
-            obj, created = Invoice.objects.update_or_create(
-                stripe_invoice_id=data['invoice_id'],
-                defaults={
-                    'customer_id': data['customer_id']
-                }
-            )
+            # Imported here so the Flask path doesn't load Django until a handler needs it
+            from django.db import transaction
+            from outbox import enqueue_outbox_message, outbox_enabled
+
+            # Store or update the invoice and notify downstream services in one transaction
+            with transaction.atomic():
+                obj, created = Invoice.objects.update_or_create(
+                    stripe_invoice_id=data.invoice_id,
+                    defaults={
+                        'customer_id': data.customer_id
+                    }
+                )
+                if outbox_enabled():
+                    enqueue_outbox_message('invoice.payment_succeeded', {
+                        'invoice_id': data.invoice_id,
+                        'customer_id': data.customer_id,
+                        'subscription_id': data.subscription_id,
+                    })
 
             if created:
-                print(f"Invoice payment succeeded and recorded: {data['invoice_id']}")
+                print(f"Invoice payment succeeded and recorded: {data.invoice_id}")
             else:
-                print(f"Invoice record updated: {data['invoice_id']}")
+                print(f"Invoice record updated: {data.invoice_id}")
 
         except Exception as e:
             print(f"Error processing invoice.payment_succeeded event: {str(e)}")
@@ -238,30 +571,30 @@ class WebhookHandler:
         # print(f"PaymentIntent succeeded: {payment_intent['id']}")
         try:
             # Extract necessary data from the payment_intent object
-            data = extract_payment_intent_data(payment_intent)
+            data = WebhookHandler.extract_payment_intent_data(payment_intent)
 
             if data is None:
-                return HttpResponse(status=200)  # Exit if there was an issue with extracting the data
+                return  # Exit if there was an issue with extracting the data
 
             # Log for debugging purposes
-            print(f"Processing payment intent succeeded event for payment ID: {data['payment_id']}")
+            print(f"Processing payment intent succeeded event for payment ID: {data.payment_id}")
 
             # Store or update the payment intent in the database
             obj, created = PaymentIntent.objects.update_or_create(
-                stripe_payment_intent_id=data['payment_id'],
+                stripe_payment_intent_id=data.payment_id,
                 defaults={
-                    'amount': data['amount'],
-                    'currency': data['currency'],
-                    'customer_id': data['customer_id'],
-                    'status': data['status'],
-                    'metadata': data['metadata']
+                    'amount': data.amount,
+                    'currency': data.currency,
+                    'customer_id': data.customer_id,
+                    'status': data.status,
+                    'metadata': data.metadata
                 }
             )
 
             if created:
-                print(f"Payment intent created: {data['payment_id']}")
+                print(f"Payment intent created: {data.payment_id}")
             else:
-                print(f"Payment intent updated: {data['payment_id']}")
+                print(f"Payment intent updated: {data.payment_id}")
 
         except Exception as e:
             print(f"Error processing payment intent: {str(e)}")
@@ -271,33 +604,138 @@ class WebhookHandler:
             Handle the customer.created event.
             """
             try:
-                data = extract_customer_data(customer)
+                data = WebhookHandler.extract_customer_data(customer)
 
                 if data is None:
-                    return HttpResponse(status=200)  # Exit if there was an issue with extracting the data
+                    return  # Exit if there was an issue with extracting the data
 
                 # Log for debugging purposes
-                logging.info(f"Processing customer created event for {data['customer_id']}")
-
-                # Store or update the customer in the database
-                obj, created = Customer.objects.update_or_create(
-                    stripe_customer_id=data['customer_id'],
-                    defaults={
-                        'email': data['email'],
-                        'name': data['name'],
-                        'description': data['description'],
-                    }
-                )
+                logging.info(f"Processing customer created event for {data.customer_id}")
+
+                from django.db import transaction
+                from outbox import enqueue_outbox_message, outbox_enabled
+
+                # Store or update the customer and notify downstream services in one transaction
+                with transaction.atomic():
+                    obj, created = Customer.objects.update_or_create(
+                        stripe_customer_id=data.customer_id,
+                        defaults={
+                            'email': data.email,
+                            'name': data.name,
+                            'description': data.description,
+                        }
+                    )
+                    if outbox_enabled():
+                        enqueue_outbox_message('customer.created', {
+                            'customer_id': data.customer_id,
+                            'email': data.email,
+                        })
 
                 # Log the outcome
                 if created:
-                    print(f"New customer record created: {data['customer_id']}")
+                    print(f"New customer record created: {data.customer_id}")
                 else:
-                    print(f"Customer record updated: {data['customer_id']}")
+                    print(f"Customer record updated: {data.customer_id}")
 
             except Exception as e:
                 print(f"Error processing customer created event: {str(e)}")
 
+    def handle_invoice_paid_batch(invoices):
+        """
+        Handle a batch of invoice.paid events with one user query and one upsert.
+        """
+        WebhookHandler.upsert_invoices(invoices, 'invoice.paid')
+
+    def handle_invoice_updated_batch(invoices):
+        """
+        Handle a batch of invoice.updated events with one user query and one upsert.
+        """
+        WebhookHandler.upsert_invoices(invoices, 'invoice.updated')
+
+    def handle_invoice_payment_succeeded_batch(invoices):
+        """
+        Handle a batch of invoice.payment_succeeded events; the upsert and the
+        outbox messages commit together.
+        """
+        WebhookHandler.upsert_invoices(invoices, 'invoice.payment_succeeded', outbox_topic='invoice.payment_succeeded')
+
+    def handle_payment_intent_succeeded_batch(payment_intents):
+        """
+        Handle a batch of payment_intent.succeeded events with one upsert.
+        """
+        records = []
+        for payment_intent in payment_intents:
+            data = WebhookHandler.extract_payment_intent_data(payment_intent)
+            if data is not None:
+                records.append(data)
+        if not records:
+            return
+
+        # Needs Django 4.1+ and a unique stripe_payment_intent_id
+        PaymentIntent.objects.bulk_create(
+            [
+                PaymentIntent(
+                    stripe_payment_intent_id=data.payment_id,
+                    amount=data.amount,
+                    currency=data.currency,
+                    customer_id=data.customer_id,
+                    status=data.status,
+                    metadata=data.metadata
+                )
+                for data in records
+            ],
+            update_conflicts=True,
+            unique_fields=['stripe_payment_intent_id'],
+            update_fields=['amount', 'currency', 'customer_id', 'status', 'metadata']
+        )
+        print(f"Payment intents recorded: {len(records)}")
+
+    def upsert_invoices(invoices, event_type, outbox_topic=None):
+        """
+        Store a batch of invoices in one transaction: one query for all their
+        users and one INSERT ... ON CONFLICT for all the rows.
+        """
+        records = []
+        for data in WebhookHandler.extract_invoice_batch(invoices):
+            if not data.user:
+                logging.error(f"User not found for invoice {data.invoice_id}.")
+                continue
+            records.append(data)
+        if not records:
+            return
+
+        from django.db import transaction
+        from outbox import enqueue_outbox_messages, outbox_enabled
+
+        with transaction.atomic():
+            # Needs Django 4.1+ and a unique stripe_invoice_id
+            Invoice.objects.bulk_create(
+                [Invoice(stripe_invoice_id=data.invoice_id, customer_id=data.customer_id) for data in records],
+                update_conflicts=True,
+                unique_fields=['stripe_invoice_id'],
+                update_fields=['customer_id']
+            )
+            if outbox_topic and outbox_enabled():
+                enqueue_outbox_messages(outbox_topic, [
+                    {
+                        'invoice_id': data.invoice_id,
+                        'customer_id': data.customer_id,
+                        'subscription_id': data.subscription_id,
+                    }
+                    for data in records
+                ])
+
+        print(f"{event_type} batch recorded {len(records)} invoices")
+
+    # Batch handlers by event type, called with at most one object per id;
+    # other types are adapted from their single event handler (see run_batch)
+    BATCH_HANDLERS = {
+        'invoice.paid': handle_invoice_paid_batch,
+        'invoice.updated': handle_invoice_updated_batch,
+        'invoice.payment_succeeded': handle_invoice_payment_succeeded_batch,
+        'payment_intent.succeeded': handle_payment_intent_succeeded_batch,
+    }
+
 
 
     def extract_customer_data(customer):
@@ -305,19 +743,8 @@ class WebhookHandler:
         Helper function to extract necessary data from a customer object.
         """
         try:
-            customer_id = customer.get('id')
-            email = customer.get('email')
-            name = customer.get('name')
-            description = customer.get('description')
-
-            # You can add more fields here depending on what is available from the customer object
-
-            return {
-                'customer_id': customer_id,
-                'email': email,
-                'name': name,
-                'description': description
-            }
+            # You can add more fields to CustomerRecord and CUSTOMER_SCHEMA in records.py
+            return CUSTOMER_SCHEMA.extract(customer)
         except Exception as e:
             print(f"Error extracting customer data: {str(e)}")
             return None
@@ -327,7 +754,6 @@ class WebhookHandler:
         Helper function to extract the necessary data from an invoice.
         """
         try:
-            invoice_id = invoice.get('id')
             # customer_id = invoice.get('customer')
             # amount_paid = invoice.get('amount_paid')
             # currency = invoice.get('currency')
@@ -354,34 +780,36 @@ class WebhookHandler:
             # start_date = datetime.fromtimestamp(created_time, tz=timezone.utc)
             # expires_date = datetime.fromtimestamp(expires_at_time, tz=timezone.utc)
 
-            return {
-                'invoice_id': invoice_id,
-                'user': user
-            }
+            return INVOICE_SCHEMA.extract(invoice, user=user)
         except Exception as e:
             print(f"Error extracting invoice data: {str(e)}")
             return None
 
+    def extract_invoice_batch(invoices):
+        """
+        Extract a batch of invoices, looking up all their users in one query.
+        """
+        emails = {invoice.get('customer_email') for invoice in invoices if invoice.get('customer_email')}
+        users = {}
+        if emails:
+            # Ordered so each email maps to the same user .first() would return
+            for user in User.objects.filter(email__in=emails).order_by('pk'):
+                users.setdefault(user.email, user)
+
+        records = []
+        for invoice in invoices:
+            try:
+                records.append(INVOICE_SCHEMA.extract(invoice, user=users.get(invoice.get('customer_email'))))
+            except Exception as e:
+                print(f"Error extracting invoice data: {str(e)}")
+        return records
+
     def extract_payment_intent_data(payment_intent):
         """
         Helper function to extract necessary data from a payment intent.
         """
         try:
-            payment_id = payment_intent.get('id')
-            amount = payment_intent.get('amount_received')
-            currency = payment_intent.get('currency')
-            customer = payment_intent.get('customer')
-            status = payment_intent.get('status')
-            metadata = payment_intent.get('metadata', {})
-
-            return {
-                'payment_id': payment_id,
-                'amount': amount,
-                'currency': currency,
-                'customer_id': customer,
-                'status': status,
-                'metadata': metadata
-            }
+            return PAYMENT_INTENT_SCHEMA.extract(payment_intent)
         except Exception as e:
             print(f"Error extracting payment intent data: {str(e)}")
             return None
@@ -391,7 +819,6 @@ class WebhookHandler:
         Helper function to extract necessary data from a subscription.
         """
         try:
-            subscription_id = subscription.get('id')
             customer_id = subscription.get('customer')
             user = User.objects.filter(stripe_customer_id=customer_id)  # change with model name
             # status = subscription.get('status')
@@ -410,10 +837,7 @@ class WebhookHandler:
             # interval = subscription['items']['data'][0]['plan']['interval']
             # payment_status = subscription['status']
 
-            return {
-                'subscription_id': subscription_id,
-                'user': user
-            }
+            return SUBSCRIPTION_SCHEMA.extract(subscription, user=user)
         except Exception as e:
             print(f"Error extracting subscription data: {str(e)}")
             return None
@@ -433,7 +857,3 @@ class WebhookHandler:
 
         return result
 
-
-
-if __name__ == "__main__":
-    app.run(port=8000)
@@ -0,0 +1,9 @@
+# wsgi.py
+# Startup-optimized entry point, e.g. `gunicorn wsgi:application`.
+from app import app, tenants
+from warmup import prewarm
+
+# Heavy imports and client setup happen here, before the worker accepts its first request
+warmup_timings = prewarm(tenants)
+
+application = app